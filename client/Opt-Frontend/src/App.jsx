@@ -1,50 +1,124 @@
-import { useState } from 'react'
+import { useState, useEffect } from 'react'
 import './App.css'
 import GifPlayer from './GifPlayer'
 import InteractiveNetworkPlayer from './InteractiveNetworkPlayer'
+import RunCharts from './RunCharts'
+import { readNetworkData } from './trajectory'
 
 // API URL selection:
 // - Development: localhost backend
 // - Production: same-origin /api unless VITE_API_URL is explicitly set
 const API_URL = import.meta.env.VITE_API_URL || (import.meta.env.DEV ? 'http://localhost:3000' : '/api')
 
+// Progress bar position and status line for a progress event of the solver:
+// building 0-5%, solving 5-60% (by simulated time), rendering 60-100%
+function describeProgress(event) {
+  if (event.stage === 'solve') {
+    return {
+      percent: 5 + 55 * Math.min(event.t / event.t_final, 1),
+      text: `Solving pricing phase ${event.phase}/${event.n_phases}: t = ${event.t.toFixed(1)} of ${event.t_final} s (${event.rhs_calls} RHS evaluations)`
+    }
+  }
+  if (event.stage === 'render') {
+    return {
+      percent: 60 + 40 * (event.figure - 1) / event.n_figures,
+      text: `Rendering figure ${event.figure}/${event.n_figures}: ${event.name}`
+    }
+  }
+  return { percent: 2, text: 'Building network...' }
+}
+
+// Follows a job over Server-Sent Events until it has finished, falling back
+// to polling once a second if the stream fails.  Resolves with the final job.
+function waitForJob(jobUrl, onProgress) {
+  const finished = (job) => job.status !== 'queued' && job.status !== 'running'
+  return new Promise((resolve, reject) => {
+    const poll = async () => {
+      try {
+        let job
+        do {
+          await new Promise(done => setTimeout(done, 1000))
+          const polled = await fetch(jobUrl)
+          if (!polled.ok) {
+            throw new Error(`Server error: ${polled.status}`)
+          }
+          job = await polled.json()
+        } while (!finished(job))
+        resolve(job)
+      } catch (err) {
+        reject(err)
+      }
+    }
+
+    if (typeof EventSource === 'undefined') {
+      poll()
+      return
+    }
+    const events = new EventSource(`${jobUrl}/events`)
+    events.addEventListener('progress', (e) => onProgress(JSON.parse(e.data)))
+    events.addEventListener('status', (e) => {
+      const job = JSON.parse(e.data)
+      if (finished(job)) {
+        events.close()
+        resolve(job)
+      }
+    })
+    events.onerror = () => {
+      events.close()
+      poll()
+    }
+  })
+}
+
 function App() {
   const [isRunning, setIsRunning] = useState(false)
   const [graphs, setGraphs] = useState([])
   const [animation, setAnimation] = useState(null)
   const [networkData, setNetworkData] = useState(null)
+  const [charts, setCharts] = useState(null)
   const [error, setError] = useState(null)
   const [currentGraphIndex, setCurrentGraphIndex] = useState(0)
+  const [viewedGraphs, setViewedGraphs] = useState([])
   const [showAnimation, setShowAnimation] = useState(true)
   const [viewMode, setViewMode] = useState('animation') // 'animation', 'interactive', 'static'
   const [progress, setProgress] = useState(0)
+  const [progressText, setProgressText] = useState('')
   const [duration, setDuration] = useState(70)
   const [points, setPoints] = useState(400)
   const [simType, setSimType] = useState('tc7') // 'tc7' or 'tc9'
 
+  // Graphs opened so far: only these load their thumbnails, so a lazy
+  // figure nobody looks at is never rendered
+  useEffect(() => {
+    if (viewMode !== 'static') return
+    setViewedGraphs((viewed) => viewed.includes(currentGraphIndex) ? viewed : [...viewed, currentGraphIndex])
+  }, [viewMode, currentGraphIndex])
+
   const runSimulation = async () => {
     setIsRunning(true)
     setError(null)
     setGraphs([])
     setAnimation(null)
     setNetworkData(null)
+    setCharts(null)
     setCurrentGraphIndex(0)
+    setViewedGraphs([])
     setShowAnimation(true)
     setViewMode('interactive')
     setProgress(0)
+    setProgressText('Waiting for a simulation worker...')
 
-    // Simulate progress animation
-    const progressInterval = setInterval(() => {
-      setProgress(prev => {
-        if (prev >= 90) return prev
-        return prev + Math.random() * 15
-      })
-    }, 500)
+    let jobUrl = null
+    // Closing the page cancels the job so the server stops computing it
+    const cancelJob = () => {
+      if (jobUrl) fetch(jobUrl, { method: 'DELETE', keepalive: true })
+    }
+    window.addEventListener('pagehide', cancelJob)
 
     try {
       console.log('Starting simulation...')
       console.log(`Parameters: duration=${duration}s, points=${points}, type=${simType}`)
-      const response = await fetch(`${API_URL}/api/run-simulation`, {
+      const submitted = await fetch(`${API_URL}/api/jobs`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -52,14 +126,35 @@ function App() {
         body: JSON.stringify({
           duration: duration,
           points: points,
-          simType: simType
+          simType: simType,
+          trajectory: 'uint16',   // network data as quantized binary columns
+          figures: 'lazy',        // each figure rendered when first requested
+          charts: true            // graph series, drawn here instead of PNGs
         })
       })
 
+      if (!submitted.ok) {
+        const body = await submitted.json().catch(() => ({}))
+        throw new Error(body.details || `Server error: ${submitted.status}`)
+      }
+
+      // Follow the solver's progress until the job has finished
+      let job = await submitted.json()
+      jobUrl = `${API_URL}/api/jobs/${job.id}`
+      console.log(`Job ${job.id} ${job.status}`)
+      job = await waitForJob(jobUrl, (event) => {
+        const { percent, text } = describeProgress(event)
+        setProgress(percent)
+        setProgressText(text)
+      })
+      jobUrl = null
+
+      const response = await fetch(`${API_URL}/api/jobs/${job.id}/result`)
       console.log('Response status:', response.status)
 
       if (!response.ok) {
-        throw new Error(`Server error: ${response.status}`)
+        const body = await response.json().catch(() => ({}))
+        throw new Error(body.details || body.error || `Server error: ${response.status}`)
       }
 
       const data = await response.json()
@@ -67,9 +162,16 @@ function App() {
       setProgress(100)
 
       if (data.success && data.data) {
-        const graphsArray = data.data.graphs || data.graphs || []
-        const animationData = data.data.animation || null
-        const networkDataFromServer = data.data.networkData || null
+        // Lazy figures come as URLs: figure 1 is the animation, the rest graphs
+        const figures = (data.data.figures || []).map((f) => ({ ...f, src: `${API_URL}${f.url}` }))
+        const graphsArray = figures.length > 0
+          ? figures.filter((f) => f.type === 'image/png').map((f) => f.src)
+          : (data.data.graphs || data.graphs || []).map((g) => `data:image/png;base64,${g}`)
+        const animationFigure = figures.find((f) => f.type === 'image/gif')
+        const animationData = animationFigure
+          ? animationFigure.src
+          : data.data.animation && `data:image/gif;base64,${data.data.animation}`
+        const networkDataFromServer = readNetworkData(data.data.networkData) || null
         
         if (animationData) {
           console.log('Received animation GIF')
@@ -81,6 +183,11 @@ function App() {
           setNetworkData(networkDataFromServer)
           setViewMode('interactive')
         }
+
+        if (data.data.charts) {
+          console.log('Received chart series')
+          setCharts(data.data.charts)
+        }
         
         if (graphsArray.length > 0) {
           console.log(`Received ${graphsArray.length} graphs`)
@@ -99,9 +206,10 @@ function App() {
       const apiUrl = API_URL || 'not configured'
       setError(`Error: ${err.message}. Backend URL: ${apiUrl}. Check if VITE_API_URL is correctly set in .env.production`)
     } finally {
-      clearInterval(progressInterval)
+      window.removeEventListener('pagehide', cancelJob)
       setIsRunning(false)
       setProgress(0)
+      setProgressText('')
     }
   }
 
@@ -254,7 +362,7 @@ function App() {
               <span className="status-icon">⚙️</span>
               <div className="status-info">
                 <span className="status-title">Simulation in Progress</span>
-                <span className="status-desc">Computing network dynamics... This may take 10-30 seconds</span>
+                <span className="status-desc">{progressText || 'Computing network dynamics... This may take 10-30 seconds'}</span>
               </div>
             </div>
           </div>
@@ -326,7 +434,7 @@ function App() {
             {viewMode === 'animation' && animation && (
               <>
                 <div className="animation-display">
-                  <GifPlayer gifBase64={animation} simulationDuration={duration} />
+                  <GifPlayer gifSrc={animation} simulationDuration={duration} />
                 </div>
                 <div className="animation-footer">
                   <div className="legend-item">
@@ -355,12 +463,21 @@ function App() {
                   </p>
                 </div>
                 <div className="graph-display">
-                  <img 
-                    src={`data:image/png;base64,${graphs[currentGraphIndex]}`}
-                    alt={`Graph ${currentGraphIndex + 1}`}
-                    className="graph-image"
-                  />
+                  {charts ? (
+                    <RunCharts charts={charts} index={currentGraphIndex} />
+                  ) : (
+                    <img 
+                      src={graphs[currentGraphIndex]}
+                      alt={`Graph ${currentGraphIndex + 1}`}
+                      className="graph-image"
+                    />
+                  )}
                 </div>
+                {charts && (
+                  <a className="graph-download" href={graphs[currentGraphIndex]} target="_blank" rel="noreferrer">
+                    Open as PNG
+                  </a>
+                )}
 
                 <div className="navigation">
                   <button 
@@ -400,10 +517,15 @@ function App() {
                       onClick={() => setCurrentGraphIndex(index)}
                     >
                       <div className="thumbnail">
-                        <img 
-                          src={`data:image/png;base64,${graphs[index]}`}
-                          alt={`Thumbnail ${index + 1}`}
-                        />
+                        {charts && (
+                          <span className="thumbnail-icon">{['📈', '📉', '📊'][index]}</span>
+                        )}
+                        {!charts && viewedGraphs.includes(index) && (
+                          <img 
+                            src={graphs[index]}
+                            alt={`Thumbnail ${index + 1}`}
+                          />
+                        )}
                       </div>
                       <span className="thumb-label">
                         {['Path Demand', 'Convergence', 'Competition'][index] || `Graph ${index + 1}`}
@@ -1,7 +1,7 @@
 import { useState, useRef, useEffect, useCallback } from 'react'
 import { parseGIF, decompressFrames } from 'gifuct-js'
 
-function GifPlayer({ gifBase64, simulationDuration }) {
+function GifPlayer({ gifSrc, simulationDuration }) {
   const canvasRef = useRef(null)
   const [frames, setFrames] = useState([])
   const [currentFrame, setCurrentFrame] = useState(0)
@@ -14,20 +14,20 @@ function GifPlayer({ gifBase64, simulationDuration }) {
 
   // Parse the GIF and extract frames
   useEffect(() => {
-    if (!gifBase64) return
+    if (!gifSrc) return
 
     const parseGifData = async () => {
       setIsLoading(true)
       try {
-        // Convert base64 to ArrayBuffer
-        const binaryString = atob(gifBase64)
-        const bytes = new Uint8Array(binaryString.length)
-        for (let i = 0; i < binaryString.length; i++) {
-          bytes[i] = binaryString.charCodeAt(i)
+        // Fetch the GIF (a figure URL, rendered on first request, or a data: URL)
+        const response = await fetch(gifSrc)
+        if (!response.ok) {
+          throw new Error(`Animation request failed: ${response.status}`)
         }
+        const buffer = await response.arrayBuffer()
 
         // Parse the GIF
-        const gif = parseGIF(bytes.buffer)
+        const gif = parseGIF(buffer)
         const decompressedFrames = decompressFrames(gif, true)
 
         if (decompressedFrames.length > 0) {
@@ -95,7 +95,7 @@ function GifPlayer({ gifBase64, simulationDuration }) {
     }
 
     parseGifData()
-  }, [gifBase64])
+  }, [gifSrc])
 
   // Render current frame to canvas
   useEffect(() => {
@@ -270,7 +270,7 @@ function GifPlayer({ gifBase64, simulationDuration }) {
 
         <a 
           className="gif-control-btn" 
-          href={`data:image/gif;base64,${gifBase64}`}
+          href={gifSrc}
           download="ev_simulation.gif"
           title="Download"
         >
@@ -0,0 +1,285 @@
+import { useState } from 'react'
+
+// Interactive charts of a run, drawn from the series the server sends with
+// "charts": true (chart_data() of the models) instead of rendered PNGs.
+// index 0: path demands, 1: replicator convergence, 2: competition metrics.
+// Hovering a line chart reads every series at that time in its legend;
+// clicking a legend entry hides or shows the series.
+
+const PATH_COLORS = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
+const STATION_COLORS = { S1: '#FF4136', S2: '#0074D9', S3: '#2ECC40', S4: '#FF851B' }
+
+const WIDTH = 460
+const HEIGHT = 260
+const MARGIN = { top: 12, right: 16, bottom: 36, left: 56 }
+const PLOT_W = WIDTH - MARGIN.left - MARGIN.right
+const PLOT_H = HEIGHT - MARGIN.top - MARGIN.bottom
+
+function stationColor(sid, i) {
+  return STATION_COLORS[sid] || PATH_COLORS[i % PATH_COLORS.length]
+}
+
+function formatValue(v) {
+  if (!Number.isFinite(v)) return '-'
+  return Math.abs(v) >= 1000 ? v.toFixed(0) : String(Number(v.toPrecision(3)))
+}
+
+// Evenly spaced round tick values covering [lo, hi]
+function ticks(lo, hi, count = 5) {
+  const raw = (hi - lo) / count
+  const magnitude = Math.pow(10, Math.floor(Math.log10(raw)))
+  const step = [1, 2, 5, 10].map((m) => m * magnitude).find((s) => s >= raw)
+  const out = []
+  for (let v = Math.ceil(lo / step) * step; v <= hi + step * 1e-9; v += step) {
+    out.push(Math.abs(v) < step * 1e-9 ? 0 : v)
+  }
+  return out
+}
+
+// [lo, hi] of all values (and extra ones such as a reference line), padded
+function domain(series, extra = []) {
+  let lo = Infinity
+  let hi = -Infinity
+  for (const values of series) {
+    for (const v of values) {
+      if (v < lo) lo = v
+      if (v > hi) hi = v
+    }
+  }
+  for (const v of extra) {
+    lo = Math.min(lo, v)
+    hi = Math.max(hi, v)
+  }
+  if (!Number.isFinite(lo)) return [0, 1]
+  const pad = hi > lo ? (hi - lo) * 0.05 : Math.abs(hi) * 0.1 || 1
+  return [lo - pad, hi + pad]
+}
+
+function scale([d0, d1], [r0, r1]) {
+  return (v) => r0 + (v - d0) * (r1 - r0) / (d1 - d0)
+}
+
+function Axes({ x, y, xTicks, yTicks, xLabel, yLabel }) {
+  return (
+    <g className="chart-axes">
+      {yTicks.map((v) => (
+        <g key={`y-${v}`}>
+          <line x1={MARGIN.left} x2={WIDTH - MARGIN.right} y1={y(v)} y2={y(v)} stroke="#e5e7eb" />
+          <text x={MARGIN.left - 6} y={y(v)} textAnchor="end" dominantBaseline="middle" fontSize="10" fill="#4b5563">
+            {formatValue(v)}
+          </text>
+        </g>
+      ))}
+      {xTicks.map((tick) => (
+        <text key={`x-${tick.label}`} x={x(tick.value)} y={HEIGHT - MARGIN.bottom + 14} textAnchor="middle" fontSize="10" fill="#4b5563">
+          {tick.label}
+        </text>
+      ))}
+      <line x1={MARGIN.left} x2={WIDTH - MARGIN.right} y1={HEIGHT - MARGIN.bottom} y2={HEIGHT - MARGIN.bottom} stroke="#333333" />
+      <line x1={MARGIN.left} x2={MARGIN.left} y1={MARGIN.top} y2={HEIGHT - MARGIN.bottom} stroke="#333333" />
+      <text x={MARGIN.left + PLOT_W / 2} y={HEIGHT - 4} textAnchor="middle" fontSize="11" fill="#333333">{xLabel}</text>
+      <text transform={`translate(12 ${MARGIN.top + PLOT_H / 2}) rotate(-90)`} textAnchor="middle" fontSize="11" fill="#333333">
+        {yLabel}
+      </text>
+    </g>
+  )
+}
+
+function Legend({ entries, hidden, onToggle }) {
+  return (
+    <div className="chart-legend">
+      {entries.map((entry) => (
+        <button
+          key={entry.label}
+          className={`chart-legend-item ${hidden.includes(entry.label) ? 'hidden' : ''}`}
+          onClick={() => onToggle && onToggle(entry.label)}
+        >
+          <span className={`chart-legend-swatch ${entry.dashed ? 'dashed' : ''}`} style={{ borderColor: entry.color }}></span>
+          <span>{entry.label}</span>
+          {entry.value !== undefined && <span className="chart-legend-value">{formatValue(entry.value)}</span>}
+        </button>
+      ))}
+    </div>
+  )
+}
+
+// Lines over time: lines [{ label, color, values }], reference { y, label }
+// (dashed horizontal line), markers (times of dashed vertical lines)
+function LineChart({ title, t, lines, reference, markers = [], yLabel, yDomain }) {
+  const [hover, setHover] = useState(null)
+  const [hidden, setHidden] = useState([])
+  const shown = lines.filter((line) => !hidden.includes(line.label))
+
+  const x = scale([t[0], t[t.length - 1]], [MARGIN.left, WIDTH - MARGIN.right])
+  const yRange = yDomain || domain(shown.map((line) => line.values), reference ? [reference.y] : [])
+  const y = scale(yRange, [HEIGHT - MARGIN.bottom, MARGIN.top])
+  const xTicks = ticks(t[0], t[t.length - 1]).map((v) => ({ value: v, label: formatValue(v) }))
+
+  const handleMove = (e) => {
+    const rect = e.currentTarget.getBoundingClientRect()
+    const time = t[0] + ((e.clientX - rect.left) * WIDTH / rect.width - MARGIN.left) / PLOT_W * (t[t.length - 1] - t[0])
+    let nearest = 0
+    for (let i = 1; i < t.length; i++) {
+      if (Math.abs(t[i] - time) < Math.abs(t[nearest] - time)) nearest = i
+    }
+    setHover(nearest)
+  }
+
+  const toggle = (label) => {
+    setHidden((h) => h.includes(label) ? h.filter((l) => l !== label) : [...h, label])
+  }
+
+  const entries = lines.map((line) => ({
+    label: line.label,
+    color: line.color,
+    value: hover === null ? undefined : line.values[hover]
+  }))
+  if (reference) {
+    entries.push({ label: reference.label, color: '#DC143C', dashed: true })
+  }
+
+  return (
+    <div className="chart-panel">
+      <h4 className="chart-title">
+        {title}
+        {hover !== null && <span className="chart-cursor">t = {formatValue(t[hover])} s</span>}
+      </h4>
+      <svg
+        viewBox={`0 0 ${WIDTH} ${HEIGHT}`}
+        className="chart-svg"
+        onMouseMove={handleMove}
+        onMouseLeave={() => setHover(null)}
+      >
+        <Axes x={x} y={y} xTicks={xTicks} yTicks={ticks(yRange[0], yRange[1])} xLabel="Time (s)" yLabel={yLabel} />
+        {markers.filter((m) => m > t[0] && m < t[t.length - 1]).map((m) => (
+          <line key={`m-${m}`} x1={x(m)} x2={x(m)} y1={MARGIN.top} y2={HEIGHT - MARGIN.bottom}
+            stroke="gray" strokeDasharray="4 3" opacity="0.6" />
+        ))}
+        {reference && (
+          <line x1={MARGIN.left} x2={WIDTH - MARGIN.right} y1={y(reference.y)} y2={y(reference.y)}
+            stroke="#DC143C" strokeWidth="2" strokeDasharray="6 4" />
+        )}
+        {shown.map((line) => (
+          <polyline
+            key={line.label}
+            fill="none"
+            stroke={line.color}
+            strokeWidth="2"
+            points={Array.from(line.values, (v, i) => `${x(t[i]).toFixed(1)},${y(v).toFixed(1)}`).join(' ')}
+          />
+        ))}
+        {hover !== null && (
+          <line x1={x(t[hover])} x2={x(t[hover])} y1={MARGIN.top} y2={HEIGHT - MARGIN.bottom} stroke="#333333" opacity="0.4" />
+        )}
+      </svg>
+      <Legend entries={entries} hidden={hidden} onToggle={toggle} />
+    </div>
+  )
+}
+
+// Grouped bars: groups (category labels), bars [{ label, color, values }]
+// with one value per group
+function BarChart({ title, groups, bars, yLabel, yDomain, unit = '' }) {
+  const values = bars.flatMap((bar) => bar.values)
+  const yRange = yDomain || domain([values], [0])
+  const y = scale(yRange, [HEIGHT - MARGIN.bottom, MARGIN.top])
+  const slot = PLOT_W / groups.length
+  const width = slot * 0.8 / bars.length
+  const x = (group) => MARGIN.left + slot * (group + 0.5)
+  const xTicks = groups.map((label, g) => ({ value: g, label }))
+
+  return (
+    <div className="chart-panel">
+      <h4 className="chart-title">{title}</h4>
+      <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} className="chart-svg">
+        <Axes x={x} y={y} xTicks={xTicks} yTicks={ticks(yRange[0], yRange[1])} xLabel="" yLabel={yLabel} />
+        {bars.map((bar, b) => bar.values.map((v, g) => {
+          const left = MARGIN.left + slot * g + slot * 0.1 + width * b
+          return (
+            <g key={`${bar.label}-${g}`}>
+              <rect x={left} y={Math.min(y(v), y(0))} width={width * 0.92} height={Math.abs(y(v) - y(0))}
+                fill={bar.color} opacity="0.85">
+                <title>{`${bar.label}, ${groups[g]}: ${formatValue(v)}${unit}`}</title>
+              </rect>
+              {bars.length * groups.length <= 16 && (
+                <text x={left + width * 0.46} y={v >= 0 ? y(v) - 3 : y(v) + 10} textAnchor="middle" fontSize="9" fontWeight="bold" fill="#333333">
+                  {formatValue(v)}{unit}
+                </text>
+              )}
+            </g>
+          )
+        }))}
+      </svg>
+      <Legend entries={bars.map((bar) => ({ label: bar.label, color: bar.color }))} hidden={[]} />
+    </div>
+  )
+}
+
+function PathDemandCharts({ data }) {
+  return (
+    <div className="chart-grid">
+      {data.series.map((s) => (
+        <LineChart
+          key={s.title}
+          title={s.title}
+          t={data.t}
+          lines={s.flows.map((values, i) => ({ label: `Path ${i}`, color: PATH_COLORS[i % PATH_COLORS.length], values }))}
+          reference={{ y: s.demand, label: `Total demand = ${s.demand.toFixed(2)}` }}
+          yLabel="Path flow"
+        />
+      ))}
+    </div>
+  )
+}
+
+function ConvergenceCharts({ data }) {
+  return (
+    <div className="chart-grid">
+      {data.series.map((s) => (
+        <LineChart
+          key={s.title}
+          title={s.title}
+          t={data.t}
+          lines={s.gaps.map((values, i) => ({ label: `Path ${i}`, color: PATH_COLORS[i % PATH_COLORS.length], values }))}
+          reference={{ y: 0, label: 'Equilibrium (0)' }}
+          yLabel="τ_avg - τ_p"
+        />
+      ))}
+    </div>
+  )
+}
+
+function StationCharts({ data }) {
+  const { t, stations, phases } = data
+  const lines = (byStation) => stations.map((sid, i) => ({ label: sid, color: stationColor(sid, i), values: byStation[sid] }))
+  const bars = (byStation) => stations.map((sid, i) => ({ label: sid, color: stationColor(sid, i), values: byStation[sid] }))
+  const markers = phases.slice(0, -1).map((ph) => ph.t_end)
+  const phaseNames = phases.map((ph) => ph.name)
+
+  return (
+    <div className="chart-grid">
+      <LineChart title="Market Share Evolution" t={t} lines={lines(data.marketShare)} markers={markers}
+        yLabel="Market share (%)" yDomain={[0, 100]} />
+      <LineChart title="Pricing Strategy" t={t} lines={lines(data.price)} markers={markers} yLabel="Price ($/vehicle)" />
+      <LineChart title="Queue Lengths" t={t} lines={lines(data.queue)} markers={markers} yLabel="Vehicles in queue" />
+      <BarChart title="Revenue by Phase" groups={phaseNames} bars={bars(data.revenue)} yLabel="Integrated revenue ($·veh)" />
+      <BarChart title="Net Profit by Phase" groups={phaseNames} bars={bars(data.profit)} yLabel="Integrated net profit ($·veh)" />
+      <BarChart
+        title="Overall Market Share"
+        groups={['Whole run']}
+        bars={bars(Object.fromEntries(stations.map((sid) => [sid, [data.overallShare[sid]]])))}
+        yLabel="Market share (%)"
+        yDomain={[0, 110]}
+        unit="%"
+      />
+    </div>
+  )
+}
+
+function RunCharts({ charts, index }) {
+  if (index === 0) return <PathDemandCharts data={charts.pathDemands} />
+  if (index === 1) return <ConvergenceCharts data={charts.convergence} />
+  return <StationCharts data={charts.stations} />
+}
+
+export default RunCharts
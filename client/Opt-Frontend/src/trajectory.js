@@ -0,0 +1,72 @@
+// Decoder for the binary trajectory of a run (ev_trajectory.py), sent as
+// networkData = { encoding: 'float32' | 'uint16', trajectory: <base64> }.
+//
+// Returns networkData in the shape of the JSON version (nodes, edges,
+// timePoints, densities[link][t], stationPrices[station][t], ...) plus
+// pathFlows { EV, NEV } and paths, with every series a Float32Array: rows
+// are views into one array per column, so nothing is copied per link.
+// Typed arrays use the platform's byte order, little-endian like the
+// payload on every platform browsers run on.
+
+const MAGIC = 'EVT1'
+
+function rows(values, shape) {
+  const [n, width] = shape
+  return Array.from({ length: n }, (_, i) => values.subarray(i * width, (i + 1) * width))
+}
+
+function readColumn(buffer, start, column) {
+  const count = column.shape.reduce((a, b) => a * b, 1)
+  if (column.dtype === 'float32') {
+    return new Float32Array(buffer, start + column.offset, count)
+  }
+  // uint16 codes, scaled per row: value = min[row] + code * scale[row]
+  const codes = new Uint16Array(buffer, start + column.offset, count)
+  const values = new Float32Array(count)
+  const width = column.shape[column.shape.length - 1]
+  for (let i = 0; i < count; i++) {
+    const row = Math.floor(i / width)
+    values[i] = column.min[row] + codes[i] * column.scale[row]
+  }
+  return values
+}
+
+export function decodeTrajectory(base64) {
+  const binary = atob(base64)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i)
+  }
+  const view = new DataView(bytes.buffer)
+  if (String.fromCharCode(...bytes.subarray(0, 4)) !== MAGIC) {
+    throw new Error('Not an EVT1 trajectory')
+  }
+  const headerLength = view.getUint32(4, true)
+  const header = JSON.parse(new TextDecoder().decode(bytes.subarray(8, 8 + headerLength)))
+  const start = 8 + headerLength
+
+  const columns = {}
+  for (const column of header.columns) {
+    columns[column.name] = { values: readColumn(bytes.buffer, start, column), shape: column.shape }
+  }
+  const { stations, ...meta } = header.meta
+  const prices = rows(columns.stationPrices.values, columns.stationPrices.shape)
+  return {
+    ...meta,
+    timePoints: columns.timePoints.values,
+    densities: rows(columns.densities.values, columns.densities.shape),
+    pathFlows: {
+      EV: rows(columns.pathFlowsEV.values, columns.pathFlowsEV.shape),
+      NEV: rows(columns.pathFlowsNEV.values, columns.pathFlowsNEV.shape)
+    },
+    stationPrices: Object.fromEntries(stations.map((sid, i) => [sid, prices[i]]))
+  }
+}
+
+// networkData of a result, decoded if it arrived as a binary trajectory
+export function readNetworkData(networkData) {
+  if (networkData && networkData.trajectory) {
+    return decodeTrajectory(networkData.trajectory)
+  }
+  return networkData
+}
@@ -0,0 +1,226 @@
+"""
+On-disk cache of compiled scenarios.
+
+compile_scenario() rebuilds the graph, enumerates paths, builds the OD
+demand and compiles the sparse kernels on every run.  Its result is a
+dict of arrays, CSR matrices, index maps and a few scalars, so it is
+stored once per scenario as one directory:
+
+    <cache dir>/<key>/header.json     everything that is not an array,
+                                      plus the offset table of arrays.bin
+    <cache dir>/<key>/arrays.bin      every array, 64-byte aligned
+                                      (CSR matrices as data/indices/indptr)
+
+and loaded as views into one read-only np.memmap of arrays.bin, which
+takes milliseconds and shares the pages between processes.  The key is a SHA-256 over the
+scenario definition (demand, schedule, path options, model constants)
+and the source of the modules that build it, so editing the network or
+the compiler invalidates old artifacts.  Loaded arrays are read-only.
+
+The cache lives in .scenario_cache/ next to this file unless the
+EV_SCENARIO_CACHE environment variable points elsewhere.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+
+FORMAT = 1
+ALIGN = 64
+CACHE_DIR = os.environ.get(
+    'EV_SCENARIO_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.scenario_cache'))
+SOURCES = ('ev_engine.py', 'ev_paths.py', 'ev_pricing.py')
+
+
+# ──────────────────────────────────────────────────────
+#  KEYS
+# ──────────────────────────────────────────────────────
+def _canonical(obj):
+    """JSON-ready form of a definition: tuples become lists, dict keys strings."""
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def scenario_key(module_file, definition):
+    """Content hash of a scenario: ``definition`` plus the source of the
+    scenario module and of the shared compiler modules."""
+    h = hashlib.sha256()
+    h.update(f"format {FORMAT}\n".encode())
+    base = os.path.dirname(os.path.abspath(__file__))
+    for path in (module_file,) + tuple(os.path.join(base, s) for s in SOURCES):
+        with open(path, 'rb') as fh:
+            h.update(fh.read())
+    h.update(json.dumps(_canonical(definition), sort_keys=True).encode())
+    return h.hexdigest()[:32]
+
+
+# ──────────────────────────────────────────────────────
+#  ENCODING
+# ──────────────────────────────────────────────────────
+def _is_path_dict(obj):
+    return bool(obj) and all(isinstance(v, list) and all(isinstance(p, list) for p in v)
+                             for v in obj.values())
+
+
+def _encode(obj, name, arrays):
+    """Header form of ``obj``; its arrays go into ``arrays`` under ``name``."""
+    if isinstance(obj, np.ndarray):
+        arrays[name] = obj
+        return {'__npy__': name}
+    if sp.issparse(obj):
+        m = obj.tocsr()
+        for part in ('data', 'indices', 'indptr'):
+            arrays[f"{name}.{part}"] = getattr(m, part)
+        return {'__csr__': name, 'shape': list(m.shape)}
+    if hasattr(obj, 'adj') and hasattr(obj, 'graph'):   # networkx graph
+        return {'__graph__': type(obj).__name__, 'multi': obj.is_multigraph(),
+                'nodes': [[_encode(n, '', arrays), _encode(d, '', arrays)]
+                          for n, d in obj.nodes(data=True)],
+                'edges': [_encode(e, '', arrays) for e in
+                          (obj.edges(keys=True, data=True) if obj.is_multigraph()
+                           else obj.edges(data=True))]}
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) for k in obj):
+            return {k: _encode(v, f"{name}.{k}", arrays) for k, v in obj.items()}
+        if _is_path_dict(obj):
+            # ragged path lists as CSR-style arrays: paths per key, offsets, links
+            keys = list(obj)
+            paths = [p for k in keys for p in obj[k]]
+            arrays[f"{name}.count"] = np.array([len(obj[k]) for k in keys], dtype=np.intp)
+            arrays[f"{name}.ptr"] = np.cumsum([0] + [len(p) for p in paths]).astype(np.intp)
+            arrays[f"{name}.links"] = np.array([i for p in paths for i in p], dtype=np.intp)
+            return {'__paths__': name, 'keys': [_encode(k, '', arrays) for k in keys]}
+        return {'__items__': [[_encode(k, '', arrays), _encode(v, f"{name}.{i}", arrays)]
+                              for i, (k, v) in enumerate(obj.items())]}
+    if isinstance(obj, tuple):
+        return {'__tuple__': [_encode(v, '', arrays) for v in obj]}
+    if isinstance(obj, list):
+        return [_encode(v, f"{name}.{i}", arrays) for i, v in enumerate(obj)]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _decode(obj, load):
+    if isinstance(obj, list):
+        return [_decode(v, load) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if '__npy__' in obj:
+        return load(obj['__npy__'])
+    if '__csr__' in obj:
+        name = obj['__csr__']
+        return sp.csr_matrix((load(f"{name}.data"), load(f"{name}.indices"),
+                              load(f"{name}.indptr")), shape=tuple(obj['shape']))
+    if '__graph__' in obj:
+        import networkx as nx
+        G = getattr(nx, obj['__graph__'])()
+        for n, d in obj['nodes']:
+            G.add_node(_decode(n, load), **_decode(d, load))
+        for e in obj['edges']:
+            e = _decode(e, load)
+            if obj['multi']:
+                G.add_edge(e[0], e[1], key=e[2], **e[3])
+            else:
+                G.add_edge(e[0], e[1], **e[2])
+        return G
+    if '__paths__' in obj:
+        name = obj['__paths__']
+        count, ptr = load(f"{name}.count"), load(f"{name}.ptr").tolist()
+        links = load(f"{name}.links").tolist()
+        paths = [links[a:b] for a, b in zip(ptr[:-1], ptr[1:])]
+        ends = np.cumsum(count).tolist()
+        return {_decode(k, load): paths[e - c:e]
+                for k, c, e in zip(obj['keys'], count.tolist(), ends)}
+    if '__items__' in obj:
+        return {_decode(k, load): _decode(v, load) for k, v in obj['__items__']}
+    if '__tuple__' in obj:
+        return tuple(_decode(v, load) for v in obj['__tuple__'])
+    return {k: _decode(v, load) for k, v in obj.items()}
+
+
+# ──────────────────────────────────────────────────────
+#  ARTIFACTS
+# ──────────────────────────────────────────────────────
+def save_artifact(path, params):
+    """Write ``params`` as header.json + arrays.bin; atomic, so concurrent
+    writers of the same key leave one complete artifact behind."""
+    arrays = {}
+    header = {'format': FORMAT, 'params': _encode(params, 'p', arrays)}
+    table, offset = {}, 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        offset = -(-offset // ALIGN) * ALIGN
+        table[name] = [offset, arr.dtype.str, list(arr.shape)]
+        offset += arr.nbytes
+    header['arrays'] = table
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        os.chmod(tmp, 0o755)
+        with open(os.path.join(tmp, 'arrays.bin'), 'wb') as fh:
+            for name, arr in arrays.items():
+                fh.seek(table[name][0])
+                fh.write(arr.tobytes())
+            fh.truncate(max(offset, 1))
+        with open(os.path.join(tmp, 'header.json'), 'w') as fh:
+            json.dump(header, fh)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_artifact(path):
+    """Read an artifact written by save_artifact(); arrays are read-only
+    views into the memory-mapped arrays.bin."""
+    with open(os.path.join(path, 'header.json')) as fh:
+        header = json.load(fh)
+    if header.get('format') != FORMAT:
+        raise ValueError(f"artifact {path} has format {header.get('format')}, "
+                         f"expected {FORMAT}")
+    blob = np.memmap(os.path.join(path, 'arrays.bin'), dtype=np.uint8, mode='r')
+    table = header['arrays']
+
+    def load(name):
+        offset, dtype, shape = table[name]
+        dtype = np.dtype(dtype)
+        n = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        return blob[offset:offset + n].view(dtype).reshape(shape)
+
+    return _decode(header['params'], load)
+
+
+def cached_scenario(module_file, definition, build, cache_dir=None):
+    """Load the artifact of a scenario, compiling and storing it on a miss.
+
+    ``build()`` returns the params dict; ``definition`` is everything it
+    depends on besides the module sources (see scenario_key).  A damaged
+    artifact is rebuilt.
+    """
+    path = os.path.join(cache_dir or CACHE_DIR, scenario_key(module_file, definition))
+    if os.path.isdir(path):
+        try:
+            return load_artifact(path)
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(path, ignore_errors=True)
+    save_artifact(path, build())
+    return load_artifact(path)
@@ -0,0 +1,275 @@
+"""
+Destination-based link formulation of the link/replicator model.
+
+Instead of one flow per enumerated path, every destination d and class
+keeps turning fractions beta at the end of each link: the share of its
+d-bound flow leaving link i that turns into link j.  EVs are tracked on
+the two layers of ev_paths.charging_layers() (not yet charged / charged),
+so the one-stop rule holds by construction.  A commodity (class, d) only
+carries the (link, layer) nodes that are reachable from its origins and
+can still reach d, so the state is
+
+    [x (n_links), beta (one per commodity transition)]
+
+and grows with links x destinations, never with the number of paths.
+
+Given beta, the demand loads the network as v = q + B^T v (flow through
+every node) and the expected cost-to-go is C = c + B C, both from one
+sparse LU of I - B.  Links route their outflow by the loaded turning
+fractions, exactly as compile_routing() does with path flows, and the
+splits follow
+
+    d beta_ij / dt = rate * beta_ij * (C_i - c_i - C_j)
+
+which telescopes along a route into rate * (tau_avg - tau_p): the path
+flows beta induces obey the path replicator of ev_engine, so the two
+formulations share trajectories when started from the same split and
+share their equilibria in any case.
+"""
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+from ev_engine import link_outflows, link_costs, station_metrics
+
+
+# ──────────────────────────────────────────────────────
+#  COMPILATION
+# ──────────────────────────────────────────────────────
+def _reachable(starts, step):
+    seen = set(starts)
+    queue = deque(starts)
+    while queue:
+        for nxt in step(queue.popleft()):
+            if nxt not in seen:
+                seen.add(nxt)
+                queue.append(nxt)
+    return seen
+
+
+def compile_destinations(G, idx_to_edge, lambda_EV, lambda_NEV, eps=1e-12):
+    """Layered nodes and transitions of every (class, destination) commodity.
+
+    ``lambda_EV``/``lambda_NEV`` map (origin link, destination link) to
+    demand, as create_od_demand() returns them.  Nodes are
+    (class, destination, link, layer) with class 0 = EV, 1 = NEV.
+    """
+    n_links = len(idx_to_edge)
+    data = [G[u][v][k] for u, v, k in idx_to_edge]
+    EV_only = np.array([d.get('link_type') == 'EV-only' for d in data], dtype=np.intp)
+    out_links = {}
+    for i, (u, _, _) in enumerate(idx_to_edge):
+        if not data[i].get('is_origin'):
+            out_links.setdefault(u, []).append(i)
+
+    def successors(cls, d, node):
+        i, layer = node
+        if data[i].get('is_destination'):
+            return []
+        v = idx_to_edge[i][1]
+        out = []
+        for j in out_links.get(v, []):
+            if j == i or (data[j].get('is_destination') and j != d):
+                continue
+            if EV_only[j]:
+                if cls == 0 and layer == 0:
+                    out.append((j, 1))
+            else:
+                out.append((j, layer))
+        return out
+
+    nodes, node_id, trans = [], {}, []
+    q = []
+    for cls, lam in enumerate((lambda_EV, lambda_NEV)):
+        for d in sorted({d for (_, d) in lam}):
+            demand = {(o, 0): l for (o, dd), l in sorted(lam.items())
+                      if dd == d and l > 1e-9}
+            if not demand:
+                continue
+            forward = _reachable(list(demand), lambda n: successors(cls, d, n))
+            pred = {}
+            for n in forward:
+                for m in successors(cls, d, n):
+                    pred.setdefault(m, []).append(n)
+            ends = [n for n in forward if n[0] == d]
+            keep = _reachable(ends, lambda n: pred.get(n, []))
+            for n in sorted(keep):
+                node_id[(cls, d) + n] = len(nodes)
+                nodes.append((cls, d) + n)
+                q.append(demand.get(n, 0.0))
+            for n in sorted(keep):
+                for m in successors(cls, d, n):
+                    if m in keep:
+                        trans.append((node_id[(cls, d) + n], node_id[(cls, d) + m]))
+
+    n_nodes = len(nodes)
+    t_src = np.array([a for a, _ in trans], dtype=np.intp)
+    t_dst = np.array([b for _, b in trans], dtype=np.intp)
+    node_link = np.array([n[2] for n in nodes], dtype=np.intp)
+    node_EV = np.array([n[0] == 0 for n in nodes], dtype=bool)
+
+    # physical link -> link transitions the commodities share
+    pair_idx = {}
+    pair_of = np.array([pair_idx.setdefault((node_link[a], node_link[b]), len(pair_idx))
+                        for a, b in trans], dtype=np.intp)
+    pair_src = np.array([j for (j, i) in pair_idx], dtype=np.intp)
+    pair_dst = np.array([i for (j, i) in pair_idx], dtype=np.intp)
+    n_succ = np.bincount(pair_src, minlength=n_links)
+
+    return dict(nodes=nodes, node_id=node_id, n_nodes=n_nodes, n_trans=len(trans),
+                n_links=n_links, t_src=t_src, t_dst=t_dst, t_EV=node_EV[t_src],
+                node_link=node_link, node_EV=node_EV, EV_only=EV_only,
+                q=np.array(q, dtype=float),
+                pair_of=pair_of, pair_src=pair_src, pair_dst=pair_dst,
+                fallback=1.0 / np.maximum(n_succ[pair_src], 1), eps=eps)
+
+
+def initial_splits(dest):
+    """Turning fractions that spread every OD demand evenly over its routes.
+
+    Splits in proportion to the number of routes left to d from each
+    successor, which is the uniform path split the path model starts
+    from; on networks with cycles (no finite route count) every node
+    splits evenly over its successors instead.
+    """
+    n = dest['n_nodes']
+    src, dst = dest['t_src'], dest['t_dst']
+    n_out = np.bincount(src, minlength=n)
+
+    # routes to d, successors first (Kahn on the reversed graph)
+    routes = np.where(n_out == 0, 1.0, 0.0)
+    pending = n_out.copy()
+    preds = [[] for _ in range(n)]
+    for a, b in zip(src, dst):
+        preds[b].append(a)
+    queue = deque(np.flatnonzero(n_out == 0))
+    done = 0
+    while queue:
+        b = queue.popleft()
+        done += 1
+        for a in preds[b]:
+            routes[a] += routes[b]
+            pending[a] -= 1
+            if pending[a] == 0:
+                queue.append(a)
+    if done < n:
+        return 1.0 / n_out[src]
+    return routes[dst] / routes[src]
+
+
+# ──────────────────────────────────────────────────────
+#  KERNELS
+# ──────────────────────────────────────────────────────
+def _splits(dest, model, beta):
+    """Floor the turning fractions and rescale each node's to sum to one."""
+    bc = np.maximum(beta, model['y_floor'])
+    return bc / np.bincount(dest['t_src'], bc, dest['n_nodes'])[dest['t_src']]
+
+
+def load_network(dest, bn, c_node):
+    """Flow through every node (v = q + B^T v) and its expected cost-to-go
+    (C = c + B C) under the splits ``bn``, from one LU of I - B."""
+    n = dest['n_nodes']
+    B = sp.csc_matrix((bn, (dest['t_src'], dest['t_dst'])), shape=(n, n))
+    lu = splu((sp.identity(n, format='csc') - B).tocsc())
+    return lu.solve(dest['q'], trans='T'), lu.solve(c_node)
+
+
+def _dest_rhs(dest, links, model, st, x, beta):
+    """[dx/dt, dbeta/dt], the node costs-to-go and the transition flows."""
+    src, dst = dest['t_src'], dest['t_dst']
+    f = link_outflows(links, model, x, st)
+    c_EV, c_NEV = link_costs(links, model, x, st)
+    link = dest['node_link']
+    c_node = np.where(dest['node_EV'], c_EV[link], c_NEV[link])
+
+    bn = _splits(dest, model, beta)
+    v, C = load_network(dest, bn, c_node)
+
+    # link transitions weighted by the flow the commodities send along them
+    d = np.bincount(dest['pair_of'], v[src] * bn, len(dest['pair_src']))
+    s = np.bincount(dest['pair_src'], d, dest['n_links'])[dest['pair_src']]
+    ok = s > dest['eps']
+    w = np.where(ok, d / np.where(ok, s, 1.0), dest['fallback'])
+    dx = np.bincount(dest['pair_dst'], w * f[dest['pair_src']], dest['n_links']) - f
+
+    rate = np.where(dest['t_EV'], model['rate_EV'], model['rate_NEV'])
+    dbeta = rate * bn * ((C - c_node)[src] - C[dst])
+    return np.concatenate([dx, dbeta]), C, v[src] * bn
+
+
+def destination_dynamics(dest, links, model, st, state):
+    """Right-hand side of the destination-based model at fixed prices."""
+    n = dest['n_links']
+    return _dest_rhs(dest, links, model, st, state[:n], state[n:])[0]
+
+
+def destination_gap(dest, links, model, st, state):
+    """Relative equilibrium gap of the turning fractions.
+
+    Flow-weighted |C_j - (C_i - c_i)| over every transition i -> j, over
+    the demand-weighted cost of the origins; zero exactly when no used
+    turn is dearer than its node average (Wardrop), like equilibrium_gap().
+    """
+    n = dest['n_links']
+    F, C, flow = _dest_rhs(dest, links, model, st, state[:n], state[n:])
+    src, dst = dest['t_src'], dest['t_dst']
+    bn = _splits(dest, model, state[n:])
+    avg = np.bincount(src, bn * C[dst], dest['n_nodes'])
+    return (np.sum(flow * np.abs(C[dst] - avg[src])) /
+            max(np.sum(dest['q'] * C), 1e-12))
+
+
+def path_flows(dest, model, beta, paths, od_pairs, cls):
+    """Path flows the splits induce on enumerated ``paths[od]`` of class
+    ``cls`` (0 = EV, 1 = NEV), in the order of the path model's state."""
+    bn = _splits(dest, model, beta)
+    node_id = dest['node_id']
+    trans = {(a, b): t for t, (a, b) in enumerate(zip(dest['t_src'], dest['t_dst']))}
+    y = []
+    for o, d in od_pairs:
+        lam = dest['q'][node_id[(cls, d, o, 0)]]
+        for path in paths[(o, d)]:
+            share, layer = lam, 0
+            a = node_id[(cls, d, o, 0)]
+            for j in path[1:]:
+                layer += dest['EV_only'][j]
+                b = node_id.get((cls, d, j, layer))
+                t = trans.get((a, b))
+                share = 0.0 if t is None else share * bn[t]
+                a = b
+            y.append(share)
+    return np.array(y)
+
+
+# ──────────────────────────────────────────────────────
+#  PHASE SUMMARIES
+# ──────────────────────────────────────────────────────
+def destination_snapshots(dest, links, model, schedule_fn, sol):
+    """The state every phase of an integrate_phases() run ended in, with
+    its residual, gap and station metrics (see ev_engine.phase_snapshots)."""
+    n = dest['n_links']
+    phases = []
+    for (t0, t1, ok), state, settled in zip(sol.segments, sol.ends, sol.settled):
+        st = schedule_fn(t0)
+        F = destination_dynamics(dest, links, model, st, state)
+        phases.append(dict(t_start=t0, t_end=t1, state=state, success=ok,
+                           residual=np.max(np.abs(F)), settled=settled,
+                           gap=destination_gap(dest, links, model, st, state),
+                           stations=station_metrics(links, model, st, state[:n])))
+    return phases
+
+
+def summarise_destinations(phases, links):
+    """JSON-ready view of destination_snapshots(), stations keyed by id."""
+    n = links['n_links']
+    return [dict(t_start=float(ph['t_start']), t_end=float(ph['t_end']),
+                 converged=bool(ph['success']), residual=float(ph['residual']),
+                 gap=float(ph['gap']),
+                 settled=None if ph['settled'] is None else float(ph['settled']),
+                 x=ph['state'][:n].tolist(), beta=ph['state'][n:].tolist(),
+                 stations={sid: {key: float(m[i]) for key, m in ph['stations'].items()}
+                           for i, sid in enumerate(links['station_ids'])})
+            for ph in phases]
@@ -0,0 +1,803 @@
+"""
+Compiled network engine shared by the ev_tc_* simulations.
+
+The path sets of a scenario are fixed for the whole run, so everything that
+only depends on them is compiled once into sparse matrices and the ODE
+right-hand side reduces to a handful of sparse mat-vecs.
+"""
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+from scipy.optimize import OptimizeResult
+
+
+# ──────────────────────────────────────────────────────
+#  ROUTING  (paper eq. 5)
+# ──────────────────────────────────────────────────────
+def compile_routing(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV, n_links,
+                    eps=1e-12):
+    """Compile the link-to-link transitions used by the active paths.
+
+    Path flows are ordered EV first, then NEV, exactly as they sit in the
+    ODE state.  Every distinct transition j -> i along any path becomes one
+    row of ``T`` (transition x path incidence), so the demand on all
+    transitions is ``T @ y`` and R(y) never has to be materialised.
+    """
+    all_paths = ([p for od in od_pairs_EV for p in paths_EV[od]] +
+                 [p for od in od_pairs_NEV for p in paths_NEV[od]])
+
+    trans_idx = {}
+    rows, cols = [], []
+    for p_idx, path in enumerate(all_paths):
+        for step in range(len(path) - 1):
+            key = (path[step], path[step + 1])
+            if key not in trans_idx:
+                trans_idx[key] = len(trans_idx)
+            rows.append(trans_idx[key])
+            cols.append(p_idx)
+
+    n_trans = len(trans_idx)
+    src = np.array([j for (j, i) in trans_idx], dtype=np.intp)
+    dst = np.array([i for (j, i) in trans_idx], dtype=np.intp)
+
+    T = sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                      shape=(n_trans, len(all_paths)))
+    A_src = sp.csr_matrix((np.ones(n_trans), (src, np.arange(n_trans))),
+                          shape=(n_links, n_trans))
+    A_dst = sp.csr_matrix((np.ones(n_trans), (dst, np.arange(n_trans))),
+                          shape=(n_links, n_trans))
+
+    # Links with no downstream demand split evenly over their successors
+    n_succ = np.bincount(src, minlength=n_links)
+    fallback = 1.0 / np.maximum(n_succ[src], 1)
+
+    return dict(T=T, A_src=A_src, A_dst=A_dst, src=src, dst=dst,
+                S=(A_src.T @ (A_src @ T)).tocsr(),
+                fallback=fallback, eps=eps,
+                n_links=n_links, n_trans=n_trans, n_paths=len(all_paths))
+
+
+def _col(v, ndim):
+    """Give a per-row vector trailing axes so it broadcasts over a batch."""
+    v = np.asarray(v)
+    return v.reshape(v.shape + (1,) * (ndim - v.ndim))
+
+
+def routing_weights(route, y):
+    """Turning fractions R[j, i] for every compiled transition."""
+    d = route['T'] @ y
+    s = (route['A_src'] @ d)[route['src']]
+    ok = s > route['eps']
+    w = np.where(ok, d / np.where(ok, s, 1.0), _col(route['fallback'], np.ndim(y)))
+    return w, d, s, ok
+
+
+def routing_inflow(route, y, f):
+    """Link inflows R(y)^T f without building R."""
+    w, _, _, _ = routing_weights(route, y)
+    return route['A_dst'] @ (w * f[route['src']])
+
+
+def routing_matrix(route, y):
+    """Dense R(y), for inspection and debugging only."""
+    w, _, _, _ = routing_weights(route, y)
+    n = route['n_links']
+    return sp.csr_matrix((w, (route['src'], route['dst'])), shape=(n, n)).toarray()
+
+
+# ──────────────────────────────────────────────────────
+#  LINK / PATH COMPILATION
+# ──────────────────────────────────────────────────────
+def compile_links(G, idx_to_edge, lambda_origin):
+    """Link-type masks and station index maps for the vectorised kernels."""
+    n_links = len(idx_to_edge)
+    origin, terminal, charging, station_of = [], np.zeros(n_links, bool), [], []
+    station_ids = sorted({G[u][v][k]['station_id'] for u, v, k in idx_to_edge
+                          if G[u][v][k].get('link_type') == 'EV-only'})
+    for i, (u, v, k) in enumerate(idx_to_edge):
+        lt = G[u][v][k].get('link_type', 'mixed')
+        if lt == 'origin':
+            origin.append(i)
+        if lt in ('origin', 'destination'):
+            terminal[i] = True
+        elif lt == 'EV-only':
+            charging.append(i)
+            station_of.append(station_ids.index(G[u][v][k]['station_id']))
+
+    return dict(n_links=n_links,
+                origin=np.array(origin, dtype=np.intp),
+                terminal=terminal,
+                charging=np.array(charging, dtype=np.intp),
+                station_of=np.array(station_of, dtype=np.intp),
+                station_ids=station_ids,
+                lambda_origin=np.asarray(lambda_origin, dtype=float))
+
+
+def compile_paths(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                  lambda_EV, lambda_NEV, n_links):
+    """Path x link incidence per class and the OD grouping of the path vector.
+
+    Groups are the EV OD pairs followed by the NEV OD pairs, matching the
+    order of the path flows in the ODE state.
+    """
+    def incidence(od_pairs, paths_dict):
+        rows, cols = [], []
+        p_idx = 0
+        for od in od_pairs:
+            for path in paths_dict[od]:
+                rows.extend([p_idx] * len(path))
+                cols.extend(path)
+                p_idx += 1
+        return sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                             shape=(p_idx, n_links))
+
+    P_EV = incidence(od_pairs_EV, paths_EV)
+    P_NEV = incidence(od_pairs_NEV, paths_NEV)
+
+    sizes = ([len(paths_EV[od]) for od in od_pairs_EV] +
+             [len(paths_NEV[od]) for od in od_pairs_NEV])
+    lam = np.array([lambda_EV.get(od, 0.0) for od in od_pairs_EV] +
+                   [lambda_NEV.get(od, 0.0) for od in od_pairs_NEV])
+    od_of = np.repeat(np.arange(len(sizes)), sizes)
+    n_paths = len(od_of)
+    groups = sp.csr_matrix((np.ones(n_paths), (np.arange(n_paths), od_of)),
+                           shape=(n_paths, len(sizes)))
+
+    return dict(P_EV=P_EV, P_NEV=P_NEV,
+                n_paths_EV=P_EV.shape[0], n_paths_NEV=P_NEV.shape[0],
+                n_paths=n_paths, od_of=od_of, groups=groups,
+                same_od=(groups @ groups.T).tocsr(),
+                group_size=np.array(sizes, dtype=float), lam=lam,
+                is_EV=np.arange(n_paths) < P_EV.shape[0])
+
+
+def kernel_model(link_cap, link_steep, alpha, gamma, rate_EV, rate_NEV,
+                 y_floor=1e-9, clamp=True, wait='mu'):
+    """Bundle the scalar model constants a module runs with.
+
+    ``wait='mu'`` charges alpha * x / mu_s for queueing (paper eq. 20);
+    ``wait='service'`` uses x / q_s(x) as ev_tc_7 does.
+    """
+    return dict(link_cap=link_cap, link_steep=link_steep, alpha=alpha,
+                gamma=gamma, rate_EV=rate_EV, rate_NEV=rate_NEV,
+                y_floor=y_floor, clamp=clamp, wait=wait)
+
+
+# ──────────────────────────────────────────────────────
+#  VECTORISED KERNELS
+# ──────────────────────────────────────────────────────
+def _density(model, x):
+    return np.maximum(x, 0.0) if model['clamp'] else x
+
+
+def charging_outflow(model, x, mu, nu):
+    """Station service rate q_s(x) = mu (1 - exp(-(nu/mu) x))."""
+    return mu * (1.0 - np.exp(-(nu / np.maximum(mu, 1e-9)) * _density(model, x)))
+
+
+def link_outflows(links, model, x, st):
+    """Outflow of every link in one pass (origins emit their demand)."""
+    f = model['link_cap'] * (1.0 - np.exp(-model['link_steep'] * _density(model, x)))
+    ch = links['charging']
+    if len(ch):
+        sidx = links['station_of']
+        f[ch] = charging_outflow(model, x[ch], st['mu_s'][sidx], st['nu_s'][sidx])
+    o = links['origin']
+    f[o] = links['lambda_origin'][o]
+    return f
+
+
+def link_costs(links, model, x, st):
+    """Per-link perceived cost for EV and NEV users.
+
+    Roads cost their BPR-style latency, origin/destination loops are free,
+    and EVs on a charging link pay service latency, waiting and price.
+    """
+    flow = 1.0 - np.exp(-model['link_steep'] * _density(model, x))
+    c_NEV = 1.0 + 2.0 * flow ** 4
+    c_NEV[links['terminal']] = 0.0
+    c_EV = c_NEV.copy()
+
+    ch = links['charging']
+    if len(ch):
+        sidx = links['station_of']
+        mu, nu, p = st['mu_s'][sidx], st['nu_s'][sidx], st['p_s'][sidx]
+        xc = x[ch]
+        if model['wait'] == 'service':
+            q = charging_outflow(model, xc, mu, nu)
+            ok = q > 1e-6
+            wt = np.where(ok, xc / np.where(ok, q, 1.0), 1.0 / (nu + 1e-9))
+        else:
+            wt = xc / np.maximum(mu, 1e-9)   # paper eq. (20): w = x_is / mu_s
+        c_EV[ch] = 0.1 + model['alpha'] * wt + model['gamma'] * p
+    return c_EV, c_NEV
+
+
+def path_costs(paths, c_EV, c_NEV):
+    """tau for every EV and NEV path at once (incidence-matrix product)."""
+    return np.concatenate([paths['P_EV'] @ c_EV, paths['P_NEV'] @ c_NEV])
+
+
+def _normalise(paths, model, y):
+    """Floor the path flows and rescale each OD group to its demand."""
+    od = paths['od_of']
+    yc = np.maximum(y, model['y_floor'])
+    total = (paths['groups'].T @ yc)[od]
+    lam_p = _col(paths['lam'], y.ndim)[od]
+    big = total > 1e-12
+    yn = np.where(big, yc * lam_p / np.where(big, total, 1.0),
+                  lam_p / _col(paths['group_size'], y.ndim)[od])
+    return yc, total, big, yn
+
+
+def replicator(paths, model, y, tau):
+    """Normalised replicator rates for the full path-flow vector."""
+    od = paths['od_of']
+    groups = paths['groups']
+    lam = _col(paths['lam'], y.ndim)
+
+    _, _, _, yn = _normalise(paths, model, y)
+
+    tau_avg = (groups.T @ (yn * tau)) / np.maximum(lam, 1e-300)
+    rate = _col(np.where(paths['is_EV'], model['rate_EV'], model['rate_NEV']), y.ndim)
+    return np.where(lam[od] > 1e-9, rate * yn * (tau_avg[od] - tau), 0.0)
+
+
+def _rhs(route, links, paths, model, st, x, y):
+    """[dx/dt, dy/dt] and the path costs; x, y may carry a batch axis."""
+    f = link_outflows(links, model, x, st)
+    c_EV, c_NEV = link_costs(links, model, x, st)
+    tau = path_costs(paths, c_EV, c_NEV)
+    return np.concatenate([routing_inflow(route, y, f) - f,
+                           replicator(paths, model, y, tau)]), tau
+
+
+def equilibrium_gap(paths, model, y, tau):
+    """Relative equilibrium gap of the path flows.
+
+    Demand-weighted |tau_p - tau_avg| over demand-weighted tau_avg; zero
+    exactly when every used path of an OD pair costs the OD average.
+    """
+    od = paths['od_of']
+    _, _, _, yn = _normalise(paths, model, y)
+    tau_avg = (paths['groups'].T @ (yn * tau)) / np.maximum(paths['lam'], 1e-300)
+    return np.sum(yn * np.abs(tau - tau_avg[od])) / max(np.sum(yn * tau_avg[od]), 1e-12)
+
+# ──────────────────────────────────────────────────────
+#  ANALYTIC JACOBIAN
+# ──────────────────────────────────────────────────────
+def _density_slope(model, x):
+    return (x >= 0.0).astype(float) if model['clamp'] else np.ones_like(x)
+
+
+def link_outflow_slopes(links, model, x, st):
+    """df_i/dx_i for every link (origin outflows are constant)."""
+    k = model['link_steep']
+    h = _density_slope(model, x)
+    df = model['link_cap'] * k * np.exp(-k * _density(model, x)) * h
+    ch = links['charging']
+    if len(ch):
+        sidx = links['station_of']
+        mu, nu = st['mu_s'][sidx], st['nu_s'][sidx]
+        r = nu / np.maximum(mu, 1e-9)
+        df[ch] = mu * r * np.exp(-r * _density(model, x[ch])) * h[ch]
+    df[links['origin']] = 0.0
+    return df
+
+
+def link_cost_slopes(links, model, x, st):
+    """dc_i/dx_i of link_costs() for EV and NEV users."""
+    k = model['link_steep']
+    e = np.exp(-k * _density(model, x))
+    dc_NEV = 8.0 * (1.0 - e) ** 3 * k * e * _density_slope(model, x)
+    dc_NEV[links['terminal']] = 0.0
+    dc_EV = dc_NEV.copy()
+
+    ch = links['charging']
+    if len(ch):
+        sidx = links['station_of']
+        mu, nu = st['mu_s'][sidx], st['nu_s'][sidx]
+        xc = x[ch]
+        if model['wait'] == 'service':
+            q = charging_outflow(model, xc, mu, nu)
+            r = nu / np.maximum(mu, 1e-9)
+            dq = mu * r * np.exp(-r * _density(model, xc)) * _density_slope(model, xc)
+            ok = q > 1e-6
+            qs = np.where(ok, q, 1.0)
+            dwt = np.where(ok, (qs - xc * dq) / qs ** 2, 0.0)
+        else:
+            dwt = 1.0 / np.maximum(mu, 1e-9)
+        dc_EV[ch] = model['alpha'] * dwt
+    return dc_EV, dc_NEV
+
+
+def _scaled(M, rows=None, cols=None):
+    """diag(rows) @ M @ diag(cols) for a CSR matrix, touching only its data."""
+    M = M.tocsr(copy=True)
+    if rows is not None:
+        M.data *= np.repeat(rows, np.diff(M.indptr))
+    if cols is not None:
+        M.data *= cols[M.indices]
+    return M
+
+
+def jacobian(route, links, paths, model, st, x, y, dense_below=200):
+    """Jacobian of [dx/dt, dy/dt] with respect to the state [x, y].
+
+    Blocks, with f' the outflow slopes, w the turning fractions and
+    S = A_src^T A_src T the demand leaving the source of every transition:
+
+        x-x  (A_dst diag(w) A_src^T - I) diag(f')
+        x-y  A_dst diag(f_src / s) (T - diag(w) S)
+        y-x  diag(rate yn) (G diag(1/lam) G^T diag(yn) - I) dtau/dx
+        y-y  diag(rate) (diag(tau_avg - tau) + diag(yn) G diag(1/lam) G^T diag(tau)) dyn/dy
+
+    Small systems come back dense (a dense LU beats splu there), larger
+    ones as CSC so Radau/BDF factorise them sparsely.
+    """
+    n, m = len(x), len(y)
+    src, dst = route['src'], route['dst']
+
+    # link block
+    f = link_outflows(links, model, x, st)
+    df = link_outflow_slopes(links, model, x, st)
+    w, _, s, ok = routing_weights(route, y)
+    J_xx = (sp.csr_matrix((w * df[src], (dst, src)), shape=(n, n)) -
+            sp.diags(df))
+
+    g = np.where(ok, f[src] / np.where(ok, s, 1.0), 0.0)
+    J_xy = route['A_dst'] @ (_scaled(route['T'], g) - _scaled(route['S'], g * w))
+
+    # path block
+    od = paths['od_of']
+    G = paths['groups']
+    lam = paths['lam']
+    lam_p = lam[od]
+    inv_lam = (1.0 / np.maximum(lam, 1e-300))[od]
+    rate = np.where(paths['is_EV'], model['rate_EV'], model['rate_NEV'])
+    rate = np.where(lam_p > 1e-9, rate, 0.0)
+
+    c_EV, c_NEV = link_costs(links, model, x, st)
+    tau = path_costs(paths, c_EV, c_NEV)
+    dc_EV, dc_NEV = link_cost_slopes(links, model, x, st)
+    D = sp.vstack([_scaled(paths['P_EV'], cols=dc_EV),
+                   _scaled(paths['P_NEV'], cols=dc_NEV)], format='csr')
+
+    yc, total, big, yn = _normalise(paths, model, y)
+    tot = np.where(big, total, 1.0)
+    a = np.where(big, lam_p / tot, 0.0)
+    h = (y >= model['y_floor']).astype(float)
+    same_od = paths['same_od']
+    M = sp.diags(a * h) - _scaled(same_od, a * yc / tot, h)
+
+    tau_avg = (G.T @ (yn * tau)) / np.maximum(lam, 1e-300)
+    J_yx = _scaled(_scaled(same_od, inv_lam, yn) @ D - D, rate * yn)
+    J_yy = _scaled(sp.diags(tau_avg[od] - tau) @ M +
+                   _scaled(same_od, yn * inv_lam, tau) @ M, rate)
+
+    J = sp.bmat([[J_xx, J_xy], [J_yx, J_yy]], format='csc')
+    return J.toarray() if n + m < dense_below else J
+
+
+def jacobian_sparsity(route, paths):
+    """Structural non-zeros of jacobian(), read off the compiled topology.
+
+    A link depends on itself and its upstream links, and on every path
+    that feeds or leaves them; a path depends on the links and flows of
+    all paths in its OD group.
+    """
+    n = route['n_links']
+    T, A_src, A_dst = route['T'], route['A_src'], route['A_dst']
+    P = sp.vstack([paths['P_EV'], paths['P_NEV']])
+    same_od = paths['same_od']
+
+    S_xx = sp.identity(n) + A_dst @ A_src.T
+    S_xy = A_dst @ (T + route['S'])
+    S_yx = same_od @ P
+    pattern = sp.bmat([[S_xx, S_xy], [S_yx, same_od]], format='csc')
+    pattern.data[:] = 1.0
+    return pattern
+
+
+def solver_jacobian(mode, route, paths, jac):
+    """solve_ivp keyword arguments for a Jacobian ``mode``.
+
+    ``'analytic'`` hands over ``jac``; ``'sparsity'`` only the topology
+    pattern, so SciPy groups its finite differences and factorises
+    sparsely; ``'fd'`` leaves SciPy's dense finite differences.
+    """
+    if mode == 'analytic':
+        return dict(jac=jac)
+    if mode == 'sparsity':
+        return dict(jac_sparsity=jacobian_sparsity(route, paths))
+    if mode == 'fd':
+        return {}
+    raise ValueError(f"unknown jacobian mode {mode!r}")
+
+
+def check_jacobian(fun, jac, t, state, rel_step=1.5e-8):
+    """Largest gap between ``jac(t, state)`` and forward differences of ``fun``.
+
+    Forward (not central) differences are what solve_ivp would otherwise
+    take and agree with the right-hand slopes used at the x = 0 clamp.
+    The gap is relative to the largest Jacobian entry; ~1e-6 or below
+    means the analytic derivatives agree.
+    """
+    state = np.asarray(state, dtype=float)
+    J = jac(t, state)
+    J = J.toarray() if sp.issparse(J) else np.asarray(J)
+    f0 = fun(t, state)
+    J_fd = np.empty_like(J)
+    for j in range(len(state)):
+        step = rel_step * max(1.0, abs(state[j]))
+        e = np.zeros_like(state)
+        e[j] = step
+        J_fd[:, j] = (fun(t, state + e) - f0) / step
+    return np.max(np.abs(J - J_fd)) / max(np.max(np.abs(J_fd)), 1e-300)
+
+
+# ──────────────────────────────────────────────────────
+#  ENSEMBLES
+# ──────────────────────────────────────────────────────
+def compile_ensemble(links, paths, lambda_origin, lam):
+    """Stack N demand variants of one compiled scenario.
+
+    ``lambda_origin`` is (n_links, N) and ``lam`` (n_groups, N).  The
+    batch views feed the vectorised kernels with a trailing member axis;
+    the per-member views are used for the Jacobian blocks.
+    """
+    lambda_origin = np.asarray(lambda_origin, dtype=float)
+    lam = np.asarray(lam, dtype=float)
+    n_members = lam.shape[1]
+    return dict(n_members=n_members,
+                links=dict(links, lambda_origin=lambda_origin),
+                paths=dict(paths, lam=lam),
+                members=[(dict(links, lambda_origin=lambda_origin[:, k]),
+                          dict(paths, lam=lam[:, k])) for k in range(n_members)])
+
+
+def ensemble_rhs(route, ens, model, st, z):
+    """Right-hand side of all members at once.
+
+    ``z`` is member-major (member k owns z[k*dim:(k+1)*dim]) so that the
+    Jacobian is block diagonal; ``st`` arrays carry a trailing member axis.
+    """
+    n = route['n_links']
+    X = z.reshape(ens['n_members'], -1).T
+    F, _ = _rhs(route, ens['links'], ens['paths'], model, st, X[:n], X[n:])
+    return F.T.ravel()
+
+
+def ensemble_jacobian(route, ens, model, st_members, z):
+    """Block-diagonal Jacobian of ensemble_rhs(); one block per member."""
+    n = route['n_links']
+    X = z.reshape(ens['n_members'], -1).T
+    blocks = [jacobian(route, lk, pk, model, st, X[:n, k], X[n:, k], dense_below=0)
+              for k, ((lk, pk), st) in enumerate(zip(ens['members'], st_members))]
+    return sp.block_diag(blocks, format='csc')
+
+
+# ──────────────────────────────────────────────────────
+#  SEGMENTED INTEGRATION
+# ──────────────────────────────────────────────────────
+def convergence_event(fun, gap, watch, tol, x_tol=None):
+    """Terminal solve_ivp event that fires once a phase has settled.
+
+    Settled means ``gap(t, state)`` (see equilibrium_gap) is below ``tol``
+    and the watched link densities move slower than ``x_tol`` (default
+    ``tol``).  Origin links are best left out of ``watch``: their density
+    only drains.
+    """
+    x_tol = tol if x_tol is None else x_tol
+
+    def event(t, state):
+        dx = fun(t, state)[watch]
+        return max(gap(t, state) / tol, np.max(np.abs(dx), initial=0.0) / x_tol) - 1.0
+
+    event.terminal = True
+    event.direction = -1
+    return event
+
+
+def progress_rhs(fun, edges, progress, interval=0.25):
+    """``fun`` wrapped to count its calls and report how far the solve is.
+
+    ``progress`` receives {'stage': 'solve', 't', 't_final', 'phase',
+    'n_phases', 'rhs_calls'} (phase counted from 1 over the phase
+    ``edges``) on entering every phase and otherwise at most once per
+    ``interval`` seconds of wall time.
+    """
+    edges = np.asarray(edges, dtype=float)
+    n_phases = len(edges) - 1
+    seen = {'calls': 0, 'phase': 0, 'at': -np.inf}
+
+    def wrapped(t, state):
+        seen['calls'] += 1
+        # phases only advance: an edge belongs to the phase it ends, and
+        # the solver of the next phase may still evaluate there
+        phase = max(min(int(np.searchsorted(edges, t)), n_phases), seen['phase'], 1)
+        now = time.perf_counter()
+        if phase != seen['phase'] or now - seen['at'] >= interval:
+            seen['phase'], seen['at'] = phase, now
+            progress({'stage': 'solve', 't': float(t), 't_final': float(edges[-1]),
+                      'phase': phase, 'n_phases': n_phases, 'rhs_calls': seen['calls']})
+        return fun(t, state)
+
+    return wrapped
+
+
+def integrate_phases(fun, t_eval, state0, edges, restart=None, converged=None,
+                     **solver_kw):
+    """solve_ivp over ``t_eval``, restarting cleanly at every phase edge.
+
+    ``edges`` are the phase boundaries including both ends (see
+    ev_pricing.phase_edges); each segment is a fresh solve_ivp call, so the
+    solver never steps across a price jump.  ``restart(t, state)`` may
+    adjust the state handed to each segment.  With a ``converged`` event
+    (see convergence_event) a segment stops once it has settled and the
+    rest of it holds the steady state.  The result carries ``t``/``y`` on
+    the ``t_eval`` grid, summed solver counters, the state every segment
+    ended in and its settling time (None if it never settled).
+    """
+    t_eval = np.asarray(t_eval, dtype=float)
+    state = np.asarray(state0, dtype=float)
+    ts, ys = [], []
+    res = OptimizeResult(success=True, message='', nfev=0, njev=0, nlu=0,
+                         segments=[], settled=[], ends=[])
+    if converged is not None:
+        solver_kw['events'] = converged
+
+    for k in range(len(edges) - 1):
+        t0, t1 = edges[k], edges[k + 1]
+        last = k == len(edges) - 2
+        keep = t_eval[(t_eval >= t0) & ((t_eval <= t1) if last else (t_eval < t1))]
+        if restart is not None:
+            state = restart(t0, state)
+
+        if converged is not None and converged(t0, state) <= 0:
+            # nothing changed at this edge: hold the state through the phase
+            ts.append(keep)
+            ys.append(np.repeat(state[:, None], len(keep), axis=1))
+            res.segments.append((t0, t1, True))
+            res.settled.append(t0)
+            res.ends.append(state)
+            continue
+
+        sol = solve_ivp(fun, [t0, t1], state, t_eval=np.union1d(keep, [t1]),
+                        **solver_kw)
+        n_keep = min(len(keep), len(sol.t))
+        ts.append(sol.t[:n_keep])
+        ys.append(sol.y[:, :n_keep])
+        res.nfev += sol.nfev
+        res.njev += sol.njev
+        res.nlu += sol.nlu
+        res.segments.append((t0, t1, sol.success))
+        res.message = sol.message
+        if not sol.success:
+            res.success = False
+            break
+
+        if sol.status == 1:
+            state = sol.y_events[0][-1]
+            res.settled.append(float(sol.t_events[0][-1]))
+            ts.append(keep[n_keep:])
+            ys.append(np.repeat(state[:, None], len(keep) - n_keep, axis=1))
+        else:
+            state = sol.y[:, -1]
+            res.settled.append(None)
+        res.ends.append(state)
+
+    res.t = np.concatenate(ts)
+    res.y = np.concatenate(ys, axis=1)
+    return res
+
+
+def save_solution(path, sol):
+    """Write an integrate_phases() result to ``path`` (.npz), atomically."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as fh:
+        np.savez(fh, t=sol.t, y=sol.y, ends=np.array(sol.ends),
+                 segments=np.array(sol.segments, dtype=float).reshape(-1, 3),
+                 settled=np.array([np.nan if s is None else s for s in sol.settled]),
+                 counts=np.array([sol.nfev, sol.njev, sol.nlu]),
+                 success=sol.success, message=str(sol.message))
+    os.replace(tmp, path)
+
+
+def load_solution(path):
+    """The integrate_phases() result save_solution() wrote to ``path``."""
+    with np.load(path) as f:
+        nfev, njev, nlu = (int(c) for c in f['counts'])
+        return OptimizeResult(
+            t=f['t'], y=f['y'], ends=list(f['ends']),
+            segments=[(t0, t1, bool(ok)) for t0, t1, ok in f['segments'].tolist()],
+            settled=[None if np.isnan(s) else float(s) for s in f['settled']],
+            nfev=nfev, njev=njev, nlu=nlu,
+            success=bool(f['success']), message=str(f['message']))
+
+
+# ──────────────────────────────────────────────────────
+#  STEADY STATES
+# ──────────────────────────────────────────────────────
+def project_state(links, paths, model, state):
+    """Pull a state back onto the feasible set: x >= 0 (if clamped) and
+    floored path flows rescaled to their OD demand."""
+    n = links['n_links']
+    x, y = state[:n].copy(), state[n:]
+    if model['clamp']:
+        x = np.maximum(x, 0.0)
+    _, _, _, yn = _normalise(paths, model, y)
+    return np.concatenate([x, yn])
+
+
+def steady_state(route, links, paths, model, st, state0, tol=1e-7, dt0=1.0,
+                 dt_max=1e8, max_iter=200, reseed=0.2):
+    """Equilibrium of the link/replicator system under fixed prices ``st``.
+
+    Pseudo-transient continuation: every iterate is a backward-Euler step
+    (I/dt - J) delta = F whose pseudo-time step dt grows as the residual
+    falls, so the iteration follows the dynamics far from equilibrium and
+    becomes Newton's method close to it.  Origin densities (which only
+    drain) and unused paths are held fixed, which keeps the Wardrop
+    boundary out of the Newton system; an unused path that turns out
+    cheaper than its OD average is reseeded with ``reseed`` of the OD
+    demand, since Newton would otherwise settle on the unstable y = 0
+    root.  Iterates are projected back onto x >= 0 and the OD demands.
+    """
+    n = links['n_links']
+    od = paths['od_of']
+    G = paths['groups']
+    lam = paths['lam']
+    links_free = np.setdiff1d(np.arange(n), links['origin'])
+    # demand rows lam - sum(y) per OD: zero on the feasible set, but they
+    # pin the scale of y that the normalisation leaves free
+    GG = paths['same_od'].toarray()
+
+    def evaluate(state):
+        F, tau = _rhs(route, links, paths, model, st, state[:n], state[n:])
+        y = state[n:]
+        F[n:] += (lam - G.T @ y)[od]
+        tau_avg = (G.T @ (y * tau)) / np.maximum(lam, 1e-300)
+        unused = y <= 10.0 * model['y_floor']
+        cheaper = unused & (tau < tau_avg[od] - tol) & (lam[od] > 1e-9)
+        free = np.concatenate([links_free, n + np.flatnonzero(~unused)])
+        return F, free, np.max(np.abs(F[free])), cheaper
+
+    state = project_state(links, paths, model, np.asarray(state0, dtype=float))
+    F, free, fnorm, cheaper = evaluate(state)
+    dt = dt0
+    for it in range(max_iter):
+        if fnorm < tol:
+            if not cheaper.any():
+                break
+            state[n:][cheaper] = reseed * lam[od][cheaper]
+            state = project_state(links, paths, model, state)
+            F, free, fnorm, cheaper = evaluate(state)
+            dt = dt0
+        J = jacobian(route, links, paths, model, st, state[:n], state[n:],
+                     dense_below=np.inf)
+        J[n:, n:] -= GG
+        A = np.eye(len(free)) / dt - J[np.ix_(free, free)]
+        trial = state.copy()
+        trial[free] += np.linalg.solve(A, F[free])
+        trial = project_state(links, paths, model, trial)
+        F_new, free_new, fnew, cheaper_new = evaluate(trial)
+        if not np.isfinite(fnew) or fnew > 10.0 * fnorm:
+            dt = max(dt / 4.0, 1e-6)          # reject, shorter pseudo-step
+            continue
+        dt = min(dt * fnorm / max(fnew, 1e-300), dt_max)
+        state, F, free, fnorm, cheaper = trial, F_new, free_new, fnew, cheaper_new
+    return OptimizeResult(x=state, success=bool(fnorm < tol and not cheaper.any()),
+                          nit=it, fnorm=fnorm)
+
+
+def station_metrics(links, model, st, x):
+    """Throughput, revenue, profit and market share of every station.
+
+    Arrays follow ``links['station_ids']``; ``st`` holds the station
+    parameters of one pricing phase.
+    """
+    ch, sidx = links['charging'], links['station_of']
+    n_st = len(links['station_ids'])
+    q = np.zeros(n_st)
+    q[sidx] = charging_outflow(model, x[ch], st['mu_s'][sidx], st['nu_s'][sidx])
+    total = q.sum()
+    return dict(price=st['p_s'][:n_st], throughput=q,
+                revenue=st['p_s'][:n_st] * q,
+                profit=(st['p_s'][:n_st] - st['c_s'][:n_st]) * q,
+                share=q / total if total > 0 else np.zeros(n_st))
+
+
+def phase_equilibria(route, links, paths, model, schedule_fn, edges, state0,
+                     restart=None, **solver_kw):
+    """Steady state of every pricing phase, continued from phase to phase.
+
+    ``schedule_fn(t)`` gives the station parameters at ``t`` (constant on
+    each phase); ``restart(t, state)`` may reseed the state handed to a
+    phase, as in integrate_phases().
+    """
+    n = links['n_links']
+    state = np.asarray(state0, dtype=float)
+    phases = []
+    for t0, t1 in zip(edges[:-1], edges[1:]):
+        st = schedule_fn(t0)
+        if restart is not None:
+            state = restart(t0, state)
+        res = steady_state(route, links, paths, model, st, state, **solver_kw)
+        state = res.x
+        _, tau = _rhs(route, links, paths, model, st, state[:n], state[n:])
+        phases.append(dict(t_start=t0, t_end=t1, state=state,
+                           success=res.success, residual=res.fnorm, nit=res.nit,
+                           gap=equilibrium_gap(paths, model, state[n:], tau),
+                           stations=station_metrics(links, model, st, state[:n])))
+    return phases
+
+
+def phase_snapshots(route, links, paths, model, schedule_fn, sol):
+    """The state every phase of an integrate_phases() run ended in, with
+    the same residual, gap and station metrics as phase_equilibria()."""
+    n = links['n_links']
+    phases = []
+    for (t0, t1, ok), state, settled in zip(sol.segments, sol.ends, sol.settled):
+        st = schedule_fn(t0)
+        F, tau = _rhs(route, links, paths, model, st, state[:n], state[n:])
+        phases.append(dict(t_start=t0, t_end=t1, state=state, success=ok,
+                           residual=np.max(np.abs(F)), settled=settled,
+                           gap=equilibrium_gap(paths, model, state[n:], tau),
+                           stations=station_metrics(links, model, st, state[:n])))
+    return phases
+
+
+def summarise_equilibria(phases, links, n_paths_EV):
+    """JSON-ready view of phase_equilibria() or phase_snapshots() output,
+    stations keyed by id."""
+    n = links['n_links']
+    out = []
+    for ph in phases:
+        s, m = ph['state'], ph['stations']
+        extra = {}
+        if 'nit' in ph:
+            extra['iterations'] = int(ph['nit'])
+        if 'settled' in ph:
+            extra['settled'] = None if ph['settled'] is None else float(ph['settled'])
+        out.append(dict(
+            t_start=float(ph['t_start']), t_end=float(ph['t_end']),
+            converged=bool(ph['success']), residual=float(ph['residual']),
+            gap=float(ph['gap']), **extra,
+            x=s[:n].tolist(), y_EV=s[n:n + n_paths_EV].tolist(),
+            y_NEV=s[n + n_paths_EV:].tolist(),
+            stations={sid: {key: float(m[key][i]) for key in m}
+                      for i, sid in enumerate(links['station_ids'])}))
+    return out
+
+
+def json_ready(obj, digits=4):
+    """``obj`` with every numpy array or float turned into (nested lists
+    of) floats rounded to ``digits`` decimals, for json.dumps()."""
+    if isinstance(obj, dict):
+        return {k: json_ready(v, digits) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [json_ready(v, digits) for v in obj]
+    if isinstance(obj, (np.ndarray, np.floating, float)):
+        return np.round(obj, digits).tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def equilibrium_table(phases, links):
+    """Plain-text per-phase station table for the console."""
+    lines = []
+    for k, ph in enumerate(phases):
+        flag = 'OK' if ph['success'] else 'NOT CONVERGED'
+        lines.append(f"  Phase {k + 1}: t in [{ph['t_start']:g}, {ph['t_end']:g}]  {flag}"
+                     f"  (gap {ph['gap']:.1e}, residual {ph['residual']:.1e}, {ph['nit']} its)")
+        m = ph['stations']
+        for i, sid in enumerate(links['station_ids']):
+            lines.append(f"    {sid}: p={m['price'][i]:.3f}  q={m['throughput'][i]:.4f}"
+                         f"  revenue={m['revenue'][i]:.4f}  profit={m['profit'][i]:.4f}"
+                         f"  share={100 * m['share'][i]:.1f}%")
+    return "\n".join(lines)
@@ -0,0 +1,233 @@
+"""
+Path generation for the path-based models.
+
+Listing every simple path of every OD pair and classifying it afterwards
+is exponential in the size of the network.  generate_paths() draws paths
+cheapest first from Yen's k-shortest-paths search over the edge-keyed
+multigraph and stops after ``k`` paths per OD pair and class, or once
+paths get dearer than ``max_cost`` (free-flow cost).  Charging paths are
+searched on a two-layer copy of the network (not yet charged / charged)
+in which only EV-only links lead from the first layer to the second, so
+the one-stop rule holds by construction and paths with two stations are
+never generated; the exhaustive mode applies the same limit inside its
+depth-first search.  The output is what enumerate_paths() returns:
+
+    paths_NEV[od] = mixed paths (no EV-only link)
+    paths_EV[od]  = mixed + charging paths (exactly one EV-only link),
+                    or just the mixed paths if no charging path exists
+
+with every path a list of link indices starting at the origin loop and
+ending at the destination loop.
+"""
+import heapq
+import itertools
+import math
+
+ROAD_COST = 1.0       # free-flow latency of a road link (1 + 2 * 0 ** 4)
+CHARGING_COST = 0.1   # service latency of an EV-only link
+
+
+def free_flow_cost(data):
+    """Free-flow cost of a link from its edge attributes."""
+    if data.get('is_origin') or data.get('is_destination'):
+        return 0.0
+    return CHARGING_COST if data.get('link_type') == 'EV-only' else ROAD_COST
+
+
+def _shortest(G, source, target, cost, banned_edges=(), banned_nodes=(), node_key=None):
+    """Dijkstra over (u, v, key) edges; (cost, edges) or None.
+
+    ``cost(data)`` returning None removes the edge; ``node_key`` maps a
+    node to what ``banned_nodes`` holds (default: the node itself).
+    """
+    tie = itertools.count()
+    dist = {source: 0.0}
+    prev = {}
+    heap = [(0.0, next(tie), source)]
+    while heap:
+        d, _, u = heapq.heappop(heap)
+        if u == target:
+            break
+        if d > dist[u]:
+            continue
+        for _, v, key, data in G.out_edges(u, keys=True, data=True):
+            if (v == u or (node_key(v) if node_key else v) in banned_nodes
+                    or (u, v, key) in banned_edges):
+                continue
+            c = cost(data)
+            if c is None:
+                continue
+            if d + c < dist.get(v, math.inf):
+                dist[v] = d + c
+                prev[v] = (u, v, key)
+                heapq.heappush(heap, (d + c, next(tie), v))
+    if target not in dist:
+        return None
+    edges, node = [], target
+    while node != source:
+        edges.append(prev[node])
+        node = prev[node][0]
+    return dist[target], edges[::-1]
+
+
+def shortest_edge_paths(G, source, target, cost=free_flow_cost, node_key=None):
+    """Yield (cost, edges) for the simple paths source -> target, cheapest
+    first (Yen's algorithm on the multigraph, parallel links distinct).
+
+    With ``node_key`` a spur may not revisit any node of its root under
+    that key, e.g. the physical node of a layered graph.
+    """
+    key = node_key or (lambda n: n)
+    first = _shortest(G, source, target, cost)
+    if first is None:
+        return
+    found = [first]
+    seen = {tuple(first[1])}
+    tie = itertools.count()
+    candidates = []
+    yield first
+
+    while True:
+        _, last = found[-1]
+        root_cost = 0.0
+        for i in range(len(last)):
+            root = last[:i]
+            banned_edges = {p[i] for _, p in found if len(p) > i and p[:i] == root}
+            spur = _shortest(G, last[i][0], target, cost, banned_edges,
+                             {key(u) for u, _, _ in root}, node_key)
+            if spur is not None:
+                path = root + spur[1]
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(candidates, (root_cost + spur[0], next(tie), path))
+            root_cost += cost(G.edges[last[i]])
+        if not candidates:
+            return
+        c, _, path = heapq.heappop(candidates)
+        found.append((c, path))
+        yield c, path
+
+
+def charging_layers(G, weight=None):
+    """Layered copy of G with nodes (node, charged): roads are repeated on
+    both layers, EV-only links only lead from charged=0 to charged=1.
+    Edge keys and attributes are those of the original links, plus the
+    link's ``weight[(u, v, key)]`` as 'w' when given."""
+    H = G.__class__()
+    for u, v, key, data in G.edges(keys=True, data=True):
+        if weight is not None:
+            data = dict(data, w=weight[(u, v, key)])
+        if data.get('link_type') == 'EV-only':
+            H.add_edge((u, 0), (v, 1), key=key, **data)
+        else:
+            H.add_edge((u, 0), (v, 0), key=key, **data)
+            H.add_edge((u, 1), (v, 1), key=key, **data)
+    return H
+
+
+def _layer_cost(data):
+    return None if data.get('is_origin') or data.get('is_destination') else data['w']
+
+
+def _projected(path):
+    """A layered path back on G; None if it visits a node on both layers."""
+    nodes = [path[0][0][0]] + [v[0] for _, v, _ in path]
+    if len(set(nodes)) < len(nodes):
+        return None
+    return [(u[0], v[0], key) for u, v, key in path]
+
+
+def cheapest_path(H, start, end, charging):
+    """(cost, edges) of the cheapest simple path start -> end in a weighted
+    charging_layers() graph, through exactly one station if ``charging``
+    and through none otherwise; None if there is no such path."""
+    target = (end, 1 if charging else 0)
+    if (start, 0) not in H or target not in H:
+        return None
+    for c, path in shortest_edge_paths(H, (start, 0), target, _layer_cost,
+                                       node_key=lambda n: n[0]):
+        path = _projected(path)
+        if path is not None:
+            return c, path
+    return None
+
+
+def _simple_paths(G, source, target, cost, n_charging):
+    """Every simple path with exactly ``n_charging`` EV-only links, by a
+    depth-first search that never takes one more.  Paths come in the
+    order nx.all_simple_edge_paths() lists them."""
+    out = []
+    stack = [(source, [], 0, {source})]
+    while stack:
+        u, path, n_ch, seen = stack.pop()
+        if u == target:
+            if n_ch == n_charging:
+                out.append(path)
+            continue
+        nxt = []
+        for _, v, key, data in G.out_edges(u, keys=True, data=True):
+            if v in seen or cost(data) is None:
+                continue
+            ch = n_ch + (data.get('link_type') == 'EV-only')
+            if ch <= n_charging:
+                nxt.append((v, path + [(u, v, key)], ch, seen | {v}))
+        stack.extend(reversed(nxt))
+    return out
+
+
+def _take(paths, k, max_cost):
+    out = []
+    for c, path in paths:
+        if (max_cost is not None and c > max_cost) or (k is not None and len(out) >= k):
+            break
+        out.append(path)
+    return out
+
+
+def generate_paths(G, origins, destinations, idx_to_edge, edge_to_idx,
+                   k=None, max_cost=None, cost=free_flow_cost):
+    """paths_EV, paths_NEV with at most ``k`` mixed and ``k`` charging paths
+    per OD pair, cheapest first and none dearer than ``max_cost``.
+
+    With both None every simple path is listed, in the order the old
+    post-filtered enumeration produced, by a depth-first search that
+    carries the same one-stop limit.
+    """
+    def is_terminal(data):
+        return data.get('is_origin') or data.get('is_destination')
+
+    def road_cost(data):
+        if is_terminal(data) or data.get('link_type') == 'EV-only':
+            return None
+        return cost(data)
+
+    def layer_cost(data):
+        return None if is_terminal(data) else cost(data)
+
+    exhaustive = k is None and max_cost is None
+    H = None if exhaustive else charging_layers(G)
+    paths_EV, paths_NEV = {}, {}
+    for o_idx in origins:
+        start = idx_to_edge[o_idx][0]
+        for d_idx in destinations:
+            end = idx_to_edge[d_idx][0]
+            od = (o_idx, d_idx)
+
+            if exhaustive:
+                mixed = _simple_paths(G, start, end, road_cost, 0)
+                charging = _simple_paths(G, start, end, layer_cost, 1)
+            else:
+                mixed = _take(shortest_edge_paths(G, start, end, road_cost), k, max_cost)
+                charging = []
+                if (start, 0) in H and (end, 1) in H:
+                    charging = _take(((c, _projected(p)) for c, p in
+                                      shortest_edge_paths(H, (start, 0), (end, 1), layer_cost,
+                                                          node_key=lambda n: n[0])
+                                      if _projected(p) is not None), k, max_cost)
+
+            mixed, charging = ([[o_idx] + [edge_to_idx[e] for e in p] + [d_idx] for p in ps]
+                               for ps in (mixed, charging))
+            paths_NEV[od] = mixed
+            paths_EV[od] = mixed + charging if charging else mixed
+
+    return paths_EV, paths_NEV
@@ -0,0 +1,105 @@
+"""
+Piecewise-constant station pricing schedules.
+
+A schedule is plain data so it can come from a module constant, a JSON
+file or a sweep grid:
+
+    {
+        'breakpoints': [125, 250, 375],      # phase k covers [b[k-1], b[k])
+        'horizon': 500.0,                    # optional, for rescaling
+        'stations': {
+            'S1': [{'p_s': .55, 'mu_s': 1.2, 'c_s': .10, 'nu_s': 8.0}, ...],
+            ...
+        },
+        'default': {'p_s': .5, 'mu_s': 1.5, 'c_s': .1, 'nu_s': 10.0},
+    }
+
+compile_schedule() turns it into breakpoint and parameter arrays; the
+lookup is a single searchsorted and accepts scalar or array t.
+"""
+import json
+import numpy as np
+
+STATION_KEYS = ('p_s', 'mu_s', 'c_s', 'nu_s')
+DEFAULT_STATION = {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
+
+
+def load_schedule(spec):
+    """Accept a schedule dict or a path to a JSON file holding one."""
+    if isinstance(spec, str):
+        with open(spec) as fh:
+            return json.load(fh)
+    return spec
+
+
+def compile_schedule(spec, station_ids=None, scale=1.0):
+    """Compile a schedule into breakpoint and per-station parameter tables.
+
+    ``station_ids`` fixes the row order (stations missing from the schedule
+    get its default); ``scale`` stretches the breakpoints, e.g. to fit a
+    500 s design schedule onto a shorter web run.
+    """
+    spec = load_schedule(spec)
+    breakpoints = np.asarray(spec.get('breakpoints', []), dtype=float) * scale
+    if np.any(np.diff(breakpoints) <= 0):
+        raise ValueError("schedule breakpoints must be strictly increasing")
+    n_phases = len(breakpoints) + 1
+
+    default = dict(DEFAULT_STATION, **spec.get('default', {}))
+    stations = spec.get('stations', {})
+    if station_ids is None:
+        station_ids = sorted(stations)
+
+    rows = []
+    for sid in station_ids:
+        phases = stations.get(sid, [default] * n_phases)
+        if len(phases) != n_phases:
+            raise ValueError(f"station {sid}: {len(phases)} phases given, "
+                             f"{n_phases} expected from the breakpoints")
+        rows.append([dict(default, **ph) for ph in phases])
+
+    table = {key: np.array([[ph[key] for ph in row] for row in rows],
+                           dtype=float).reshape(len(rows), n_phases)
+             for key in STATION_KEYS}
+
+    return dict(breakpoints=breakpoints, station_ids=list(station_ids),
+                row={sid: i for i, sid in enumerate(station_ids)},
+                table=table, default=default, n_phases=n_phases)
+
+
+def phase_index(sched, t):
+    """Phase of every time in ``t`` (scalar or array)."""
+    return np.searchsorted(sched['breakpoints'], t, side='right')
+
+
+def schedule_at(sched, t):
+    """Parameters of all stations at ``t``: arrays shaped (n_stations,) + t.shape."""
+    ph = phase_index(sched, t)
+    return {key: tab[:, ph] for key, tab in sched['table'].items()}
+
+
+def schedules_at(scheds, t):
+    """schedule_at() for several schedules over the same stations, stacked
+    along a trailing member axis: arrays shaped (n_stations, n_schedules)."""
+    per = [schedule_at(sched, t) for sched in scheds]
+    return {key: np.stack([p[key] for p in per], axis=-1) for key in per[0]}
+
+
+def station_parameters(sched, t, station_id):
+    """Parameters of one station; floats for scalar t, arrays otherwise."""
+    row = sched['row'].get(station_id)
+    if row is None:
+        if np.ndim(t) == 0:
+            return dict(sched['default'])
+        return {key: np.full(np.shape(t), val) for key, val in sched['default'].items()}
+    ph = phase_index(sched, t)
+    if np.ndim(t) == 0:
+        return {key: float(tab[row, ph]) for key, tab in sched['table'].items()}
+    return {key: tab[row, ph] for key, tab in sched['table'].items()}
+
+
+def phase_edges(sched, t_final, t_start=0.0):
+    """Phase boundaries inside [t_start, t_final], both ends included."""
+    bps = sched['breakpoints']
+    inner = bps[(bps > t_start) & (bps < t_final)]
+    return [float(t_start)] + [float(b) for b in inner] + [float(t_final)]
@@ -0,0 +1,234 @@
+"""
+Figure rendering of a solved run on a pool of processes.
+
+Once a model's run_simulation() has its trajectory, the four figures
+(network animation, path demands, replicator convergence, competition
+metrics) are independent, and drawing them one after the other on one
+core takes longer than the solve.  renderer() returns a drop-in for the
+models' render_figures() that draws them in parallel:
+
+- the trajectory (sol.t, sol.y) is copied once into a shared memory
+  block that the pool processes read, instead of being pickled into
+  every task;
+- the animation is split into interleaved frame batches (every k-th
+  frame), drawn by PillowWriter's own frame grabbing and put back
+  together into the GIF here, byte for byte the one PillowWriter writes;
+- the PNG figures are captured in the pool processes by
+  run_simulation's plt.show() and collected in figure order.
+
+The pool is created on first use and kept for the life of the process
+(one per sim_worker.py).  SIM_RENDER_PROCESSES sets its size (default
+min(4, CPUs)); 1 renders in process as before.
+"""
+import contextlib
+import functools
+import glob
+import importlib
+import io
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+RENDER_PROCESSES = int(os.environ.get('SIM_RENDER_PROCESSES')
+                       or min(4, os.cpu_count() or 1))
+
+# Shared memory blocks are named <prefix><pid>_<n> after the process owning them
+SHM_PREFIX = 'ev_render_'
+
+_pool = None
+_blocks = itertools.count()
+
+
+def _init_process():
+    """Pool process start-up: logs to the real stderr (stdout may be a
+    worker's frame pipe), modules and matplotlib loaded once."""
+    sys.stdout = sys.stderr = sys.__stderr__
+    import run_simulation
+    run_simulation.preload()
+
+
+def get_pool(processes=RENDER_PROCESSES):
+    """The process pool, started on first use."""
+    global _pool
+    if _pool is None:
+        remove_stale_blocks()
+        _pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_process)
+    return _pool
+
+
+def shutdown():
+    """Stop the pool (a later render starts a new one)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ──────────────────────────────────────────────────────
+#  TRAJECTORY IN SHARED MEMORY
+# ──────────────────────────────────────────────────────
+def remove_stale_blocks():
+    """Unlink the blocks of processes that were killed while rendering
+    (a cancelled job kills its worker's whole process group, resource
+    tracker included).  Linux only, where the blocks are in /dev/shm."""
+    for path in glob.glob(f'/dev/shm/{SHM_PREFIX}*'):
+        try:
+            pid = int(os.path.basename(path)[len(SHM_PREFIX):].split('_')[0])
+            os.kill(pid, 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        except PermissionError:
+            pass   # alive, someone else's
+
+
+def share_solution(sol):
+    """Copy sol.t and sol.y into a new shared memory block.  Returns the
+    block (the caller unlinks it) and the spec attach_solution() needs."""
+    t = np.ascontiguousarray(sol.t, dtype=float)
+    y = np.ascontiguousarray(sol.y, dtype=float)
+    shm = shared_memory.SharedMemory(name=f'{SHM_PREFIX}{os.getpid()}_{next(_blocks)}',
+                                     create=True, size=max(1, t.nbytes + y.nbytes))
+    np.ndarray(t.shape, float, shm.buf)[:] = t
+    np.ndarray(y.shape, float, shm.buf, offset=t.nbytes)[:] = y
+    return shm, {'name': shm.name, 't': t.shape, 'y': y.shape}
+
+
+def attach_solution(spec):
+    """The solution (t and y only) in the block of share_solution().  The
+    arrays are copied out, so the block is closed before the figures keep
+    references to them."""
+    # Not tracked here: the block belongs to the process that created it
+    track = {'track': False} if sys.version_info >= (3, 13) else {}
+    shm = shared_memory.SharedMemory(name=spec['name'], **track)
+    try:
+        t = np.ndarray(spec['t'], float, shm.buf)
+        y = np.ndarray(spec['y'], float, shm.buf, offset=t.nbytes)
+        sol = OptimizeResult(t=t.copy(), y=y.copy())
+        del t, y
+    finally:
+        shm.close()
+    return sol
+
+
+# ──────────────────────────────────────────────────────
+#  POOL TASKS
+# ──────────────────────────────────────────────────────
+def _frame_writer(fps):
+    """A PillowWriter that keeps its frames, as PNG bytes, instead of
+    writing the GIF."""
+    from matplotlib.animation import PillowWriter
+
+    class FrameWriter(PillowWriter):
+        def finish(self):
+            self.frames = []
+            for im in self._frames:
+                buf = io.BytesIO()
+                im.save(buf, format='PNG', compress_level=1)
+                self.frames.append(buf.getvalue())
+
+    return FrameWriter(fps=fps)
+
+
+def _render_task(model_name, figure, spec, params, t_final, n_points, batch=None):
+    """Draw one figure, or one (i, k) batch of the animation frames, in a
+    pool process.  Returns the captured PNGs (base64), or for a batch
+    {'fps', 'frames'} with the frames as PNG bytes."""
+    import run_simulation
+    model = importlib.import_module(model_name)
+    sol = attach_solution(spec)
+    run_simulation.captured_figures.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if figure == 1:
+            writer = _frame_writer(fps=10)   # the models' GIF frame rate
+            model.render_figure(1, sol, params, t_final, n_points,
+                                save_animation_path=os.devnull, batch=batch, writer=writer)
+            return {'fps': writer.fps, 'frames': getattr(writer, 'frames', [])}
+        model.render_figure(figure, sol, params, t_final, n_points)
+    return list(run_simulation.captured_figures)
+
+
+def save_gif(batches, path):
+    """Write the GIF of the frame ``batches`` (batch i holding every k-th
+    frame from the i-th on) to ``path`` as PillowWriter.finish() does."""
+    from PIL import Image
+
+    k = len(batches)
+    n = sum(len(b['frames']) for b in batches)
+    frames = [Image.open(io.BytesIO(batches[j % k]['frames'][j // k])) for j in range(n)]
+    if not frames:
+        return
+    frames[0].save(path, save_all=True, append_images=frames[1:],
+                   duration=int(1000 / batches[0]['fps']), loop=0)
+
+
+# ──────────────────────────────────────────────────────
+#  RENDERER
+# ──────────────────────────────────────────────────────
+def render_figures(model_name, captured, processes, figures, sol, params, t_final, n_points,
+                   save_animation_path=None, report=None):
+    """The models' render_figures() on the pool: the animation as
+    ``processes`` frame batches (saved to ``save_animation_path``), the
+    PNG figures appended to ``captured`` in figure order.  ``report`` gets
+    the {'stage': 'render', ...} event of each figure once it is done."""
+    if not figures:
+        return   # e.g. a lazy run: no pool, no shared trajectory
+    model = importlib.import_module(model_name)
+    pool = get_pool(processes)
+    shm, spec = share_solution(sol)
+    try:
+        tasks = {}
+        if 1 in figures and save_animation_path:
+            for i in range(processes):
+                task = pool.submit(_render_task, model_name, 1, spec, params, t_final,
+                                   n_points, (i, processes))
+                tasks[task] = (1, i)
+        for n in figures:
+            if n != 1:
+                task = pool.submit(_render_task, model_name, n, spec, params, t_final, n_points)
+                tasks[task] = (n, 0)
+
+        results = {}
+        pending = {}
+        for n, _ in tasks.values():
+            pending[n] = pending.get(n, 0) + 1
+        for task in as_completed(tasks):
+            n, i = tasks[task]
+            results[n, i] = task.result()
+            pending[n] -= 1
+            if not pending[n]:
+                name = model.FIGURE_NAMES[n - 1]
+                print(f"   [VIZ {n}/4] {name} done")
+                if report is not None:
+                    report({'stage': 'render', 'figure': n, 'n_figures': 4, 'name': name})
+    except BrokenProcessPool:
+        shutdown()
+        raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+    for n in sorted(pending):
+        if n == 1:
+            save_gif([results[1, i] for i in range(processes)], save_animation_path)
+        else:
+            captured.extend(results[n, 0])
+
+
+def renderer(sim_type, captured, processes=RENDER_PROCESSES):
+    """A renderer for the run_simulation() of ``sim_type`` that draws on
+    the pool and collects the PNGs in ``captured``, or None (render in
+    process) for a single process."""
+    if processes < 2:
+        return None
+    import run_simulation
+    model_name = run_simulation.load_simulation(sim_type).__module__
+    return functools.partial(render_figures, model_name, captured, processes)
@@ -0,0 +1,156 @@
+"""
+Parameter sweeps over the TC9 web scenario on a process pool.
+
+A grid is plain data (dict or JSON file); every combination of its lists
+becomes one run_simulation() call with plotting disabled:
+
+    {
+        'schedules': [null, 'pricing_a.json', {...schedule dict...}],
+        'demands':   [null, {'O1': {'beta_EV': 0.7}}],
+        'solvers':   [{}, {'jacobian': 'sparsity'}, {'converge_tol': 1e-3},
+                      {'rtol': 1e-6, 'atol': 1e-8}],
+        't_final': 200.0, 'n_points': 400, 'mode': 'dynamic'
+    }
+
+Every distinct scenario (schedule x demand x t_final) is compiled once
+in the parent into the on-disk artifact cache (ev_cache), so workers only
+memory-map it.  With tc9.SCENARIO_CACHE off, the network and path
+enumeration are compiled once in the parent and handed to each worker
+once (inherited under fork, pickled once per worker otherwise).  Results
+stream back as one compact JSON line per run, in
+completion order:
+
+    python ev_sweep.py grid.json --workers 8 --out results.jsonl
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ev_tc_9_web as tc9
+from ev_pricing import load_schedule
+
+SOLVER_KEYS = ('rtol', 'atol', 'max_step')
+RUN_KEYS = ('jacobian', 'converge_tol', 'mode', 't_final', 'n_points')
+
+_network = None
+
+
+def load_grid(spec):
+    """Accept a grid dict or a path to a JSON file holding one."""
+    if isinstance(spec, str):
+        with open(spec) as fh:
+            return json.load(fh)
+    return spec
+
+
+def grid_runs(grid):
+    """Expand a grid into run specs: the product of schedules x demands x
+    solvers, each carrying the grid-wide defaults of RUN_KEYS."""
+    grid = load_grid(grid)
+    defaults = {key: grid[key] for key in RUN_KEYS if key in grid}
+    runs = []
+    for i, (schedule, demand, solver) in enumerate(itertools.product(
+            grid.get('schedules', [None]), grid.get('demands', [None]),
+            grid.get('solvers', [{}]))):
+        if isinstance(schedule, str):
+            schedule = load_schedule(schedule)
+        runs.append(dict(defaults, id=i, schedule=schedule, demand=demand,
+                         **(solver or {})))
+    return runs
+
+
+def _init_worker(network):
+    global _network
+    _network = network
+
+
+def run_one(run):
+    """One sweep run in the calling process; never raises."""
+    kw = {key: run[key] for key in RUN_KEYS if key in run}
+    solver = {key: run[key] for key in SOLVER_KEYS if key in run}
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = tc9.run_simulation(schedule=run.get('schedule'), demand=run.get('demand'),
+                                     solver=solver, plots=False, network=_network, **kw)
+    except Exception as e:
+        res = {'success': False, 'error': f"{type(e).__name__}: {e}"}
+    res['id'] = run['id']
+    res['elapsed'] = round(time.perf_counter() - t0, 4)
+    return res
+
+
+def warm_cache(runs):
+    """Compile the artifact of every distinct scenario in ``runs`` unless
+    it is already cached; returns the number of distinct scenarios.
+    Scenarios that fail to compile are left to run_one() to report."""
+    seen = set()
+    for run in runs:
+        key = json.dumps([run.get('t_final'), run.get('schedule'), run.get('demand')],
+                         sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            try:
+                tc9.load_scenario(run.get('t_final'), run.get('schedule'), run.get('demand'))
+            except Exception:
+                pass
+    return len(seen)
+
+
+def run_sweep(runs, workers=None):
+    """Yield run_one() summaries as workers finish them.
+
+    ``workers=1`` runs serially in this process (no pool).
+    """
+    global _network
+    if tc9.SCENARIO_CACHE:
+        warm_cache(runs)
+        network = None
+    else:
+        network = tc9.compile_network()
+    if workers == 1:
+        _network = network
+        for run in runs:
+            yield run_one(run)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(network,)) as pool:
+        futures = [pool.submit(run_one, run) for run in runs]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('grid', help='grid JSON file')
+    ap.add_argument('--workers', type=int, default=None,
+                    help='pool size (default: CPU count; 1 = serial)')
+    ap.add_argument('--out', default=None, help='JSON-lines output (default: stdout)')
+    args = ap.parse_args(argv)
+
+    runs = grid_runs(args.grid)
+    print(f"Sweep: {len(runs)} runs on {args.workers or os.cpu_count()} workers",
+          file=sys.stderr)
+    t0 = time.perf_counter()
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        for n, res in enumerate(run_sweep(runs, args.workers), 1):
+            out.write(json.dumps(res, separators=(',', ':')) + '\n')
+            out.flush()
+            print(f"  [{n}/{len(runs)}] run {res['id']} "
+                  f"{'OK' if res.get('success') else 'FAILED'} ({res['elapsed']:.2f}s)",
+                  file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Sweep done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
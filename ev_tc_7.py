@@ -1,10 +1,17 @@
-import networkx as nx
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
-import matplotlib.animation as animation
-from matplotlib.patches import FancyBboxPatch
-import matplotlib.patches as mpatches
+from ev_engine import (compile_routing, routing_inflow, compile_links, compile_paths,
+                       kernel_model, charging_outflow, link_outflows, link_costs,
+                       path_costs, replicator, jacobian,
+                       solver_jacobian, integrate_phases, equilibrium_gap,
+                       convergence_event, phase_equilibria, summarise_equilibria,
+                       equilibrium_table, phase_snapshots, progress_rhs, save_solution,
+                       load_solution, json_ready)
+from ev_pricing import (load_schedule, compile_schedule, station_parameters, schedule_at,
+                        phase_edges)
+from ev_paths import generate_paths
+from ev_cache import cached_scenario
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -25,34 +32,41 @@ N_TIME_POINTS = 400
 SOLVER_RTOL = 1e-4
 SOLVER_ATOL = 1e-6
 MAX_STEP = 5.0
+JACOBIAN = 'analytic'  # 'analytic' | 'sparsity' | 'fd'
+CONVERGE_TOL = None    # e.g. 1e-3: hold the steady state once a phase settles
+PATH_K = None          # k cheapest paths per OD pair and class; None = all
+PATH_MAX_COST = None   # drop paths dearer than this free-flow cost
+SCENARIO_CACHE = True  # load compiled scenarios from disk (ev_cache)
 
 # PIECEWISE PRICING STRATEGY
+PRICING_SCHEDULE = {
+    'breakpoints': [100, 200, 300],
+    'stations': {
+        'S1': [{'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+               {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+               {'p_s': 0.42, 'mu_s': 2.5, 'c_s': 0.18, 'nu_s': 15.0},
+               {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.16, 'nu_s': 15.0}],
+        'S2': [{'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+               {'p_s': 0.25, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+               {'p_s': 0.25, 'mu_s': 1.5, 'c_s': 0.14, 'nu_s': 10.0},
+               {'p_s': 0.38, 'mu_s': 2.0, 'c_s': 0.20, 'nu_s': 13.0}],
+    },
+    'default': {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+}
+SCHEDULE = compile_schedule(PRICING_SCHEDULE)
+
+
 def get_station_parameters(t, station_id):
-    if station_id == 'S1':
-        if t < 100:
-            return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
-        elif t < 200:
-            return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
-        elif t < 300:
-            return {'p_s': 0.42, 'mu_s': 2.5, 'c_s': 0.18, 'nu_s': 15.0}
-        else:
-            return {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.16, 'nu_s': 15.0}
-    elif station_id == 'S2':
-        if t < 100:
-            return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
-        elif t < 200:
-            return {'p_s': 0.25, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
-        elif t < 300:
-            return {'p_s': 0.25, 'mu_s': 1.5, 'c_s': 0.14, 'nu_s': 10.0}
-        else:
-            return {'p_s': 0.38, 'mu_s': 2.0, 'c_s': 0.20, 'nu_s': 13.0}
-    return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
+    """Station parameters at time t (scalar or array of times)"""
+    return station_parameters(SCHEDULE, t, station_id)
 
 
 # ============================================================================
 # NETWORK CONSTRUCTION
 # ============================================================================
 def create_network_with_charging_stations():
+    import networkx as nx
+
     G = nx.MultiDiGraph()
     physical_nodes = ['O', 'A', 'B', 'D']
     G.add_nodes_from(physical_nodes)
@@ -83,60 +97,18 @@ def create_network_with_charging_stations():
     return G, origins, destinations, charging_stations
 
 
-def enumerate_paths(G, origins, destinations, charging_stations):
+def enumerate_paths(G, origins, destinations, charging_stations, k=None, max_cost=None):
+    """EV / NEV paths per OD pair via ev_paths.generate_paths(): every simple
+    path by default, or the k cheapest per class within max_cost (defaults
+    PATH_K / PATH_MAX_COST); charging paths never take a second station"""
     edges = list(G.edges(keys=True))
     edge_to_idx = {edge: i for i, edge in enumerate(edges)}
     idx_to_edge = edges
-    
-    paths_EV = {}
-    paths_NEV = {}
-    
-    link_info = {}
-    for u, v, k, data in G.edges(keys=True, data=True):
-        link_id = data['link_id']
-        edge = (u, v, k)
-        link_info[link_id] = {'edge': edge, 'data': data, 'start_node': u, 'end_node': v}
-    
-    for origin_link_id in origins:
-        origin_info = link_info[origin_link_id]
-        start_node = origin_info['start_node']
-        
-        for dest_link_id in destinations:
-            dest_info = link_info[dest_link_id]
-            end_node = dest_info['start_node']
-            od_pair = (origin_link_id, dest_link_id)
-            
-            temp_mixed_paths = []
-            temp_charging_paths = []
-            
-            if nx.has_path(G, start_node, end_node):
-                all_paths = list(nx.all_simple_edge_paths(G, source=start_node, target=end_node))
-                
-                for path_edges in all_paths:
-                    skip_path = False
-                    for edge in path_edges:
-                        edge_data = G.edges[edge]
-                        if edge_data.get('is_origin', False) or edge_data.get('is_destination', False):
-                            skip_path = True
-                            break
-                    
-                    if skip_path:
-                        continue
-                    
-                    path_indices = [edge_to_idx[edge] for edge in path_edges]
-                    full_path = [origin_link_id] + path_indices + [dest_link_id]
-                    
-                    ev_only_count = sum(1 for link_idx in full_path 
-                                       if link_info[link_idx]['data'].get('link_type') == 'EV-only')
-                    
-                    if ev_only_count == 0:
-                        temp_mixed_paths.append(full_path)
-                    elif ev_only_count == 1:
-                        temp_charging_paths.append(full_path)
-            
-            paths_NEV[od_pair] = temp_mixed_paths
-            paths_EV[od_pair] = temp_mixed_paths + temp_charging_paths if temp_charging_paths else temp_mixed_paths
-                        
+
+    k = PATH_K if k is None else k
+    max_cost = PATH_MAX_COST if max_cost is None else max_cost
+    paths_EV, paths_NEV = generate_paths(G, origins, destinations,
+                                         idx_to_edge, edge_to_idx, k, max_cost)
     return paths_EV, paths_NEV, edge_to_idx, idx_to_edge
 
 
@@ -200,103 +172,6 @@ def latency_function(x, is_charging=False):
         return 1.0 + 2.0 * (flow / LINK_CAPACITY) ** 4
 
 
-def compute_routing_matrix(y_EV, y_NEV, paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV, n_links):
-    """Compute routing matrix R(y) based on path flows"""
-    R = np.zeros((n_links, n_links))
-    
-    downstream_demand = np.zeros(n_links)
-    link_pair_demand = {}
-    
-    # Process EV paths
-    idx = 0
-    for od in od_pairs_EV:
-        paths = paths_EV[od]
-        for p_idx, path in enumerate(paths):
-            y_p = y_EV[idx]
-            idx += 1
-            
-            for k in range(len(path) - 1):
-                j = path[k]
-                i = path[k + 1]
-                
-                if (j, i) not in link_pair_demand:
-                    link_pair_demand[(j, i)] = 0.0
-                link_pair_demand[(j, i)] += y_p
-                downstream_demand[j] += y_p
-    
-    # Process NEV paths
-    idx = 0
-    for od in od_pairs_NEV:
-        paths = paths_NEV[od]
-        for p_idx, path in enumerate(paths):
-            y_p = y_NEV[idx]
-            idx += 1
-            
-            for k in range(len(path) - 1):
-                j = path[k]
-                i = path[k + 1]
-                
-                if (j, i) not in link_pair_demand:
-                    link_pair_demand[(j, i)] = 0.0
-                link_pair_demand[(j, i)] += y_p
-                downstream_demand[j] += y_p
-    
-    # Build routing matrix
-    for (j, i), demand in link_pair_demand.items():
-        if downstream_demand[j] > 1e-9:
-            R[j, i] = demand / downstream_demand[j]
-        else:
-            successors = [k for (j_, k) in link_pair_demand.keys() if j_ == j]
-            if len(successors) > 0:
-                R[j, i] = 1.0 / len(successors)
-    
-    return R
-
-
-def compute_path_costs(x, paths_all, od_pairs, charging_stations, idx_to_edge, G, t, vehicle_class='EV'):
-    """Compute perceived path costs"""
-    path_costs = []
-    
-    for od in od_pairs:
-        paths = paths_all[od]
-        
-        for path in paths:
-            cost = 0.0
-            
-            for link_id in path:
-                edge = idx_to_edge[link_id]
-                edge_data = G.edges[edge]
-                link_type = edge_data.get('link_type', 'mixed')
-                
-                if link_type == 'EV-only' and vehicle_class == 'EV':
-                    station_id = edge_data.get('station_id')
-                    params = get_station_parameters(t, station_id)
-                    
-                    p_s = params['p_s']
-                    mu_s = params['mu_s']
-                    nu_s = params['nu_s']
-                    x_is = x[link_id]
-                    
-                    service_rate = outflow_function(x_is, mu=mu_s, nu=nu_s, is_charging=True)
-                    
-                    if service_rate > 1e-6:
-                        waiting_time = x_is / service_rate
-                    else:
-                        waiting_time = 1.0 / (nu_s + 1e-9)
-                    
-                    base_latency = latency_function(x_is, is_charging=True)
-                    cost += base_latency + alpha * waiting_time + gamma * p_s
-                    
-                elif link_type == 'origin' or link_type == 'destination':
-                    continue
-                else:
-                    cost += latency_function(x[link_id], is_charging=False)
-            
-            path_costs.append(cost)
-    
-    return np.array(path_costs)
-
-
 # ============================================================================
 # ODE SYSTEM
 # ============================================================================
@@ -305,138 +180,66 @@ def coupled_dynamics(t, state, params):
     Coupled ODE system with PROPER NORMALIZATION
     """
     n_links = params['n_links']
-    n_paths_EV = params['n_paths_EV']
-    n_paths_NEV = params['n_paths_NEV']
+    links = params['links']
+    model = params['model']
     
-    # Unpack state
+    # Unpack state (EV path flows first, then NEV path flows)
     x = state[:n_links]
-    y_EV = state[n_links:n_links + n_paths_EV]
-    y_NEV = state[n_links + n_paths_EV:]
-    
-    # Compute routing matrix
-    R = compute_routing_matrix(y_EV, y_NEV, params['paths_EV'], params['paths_NEV'], 
-                               params['od_pairs_EV'], params['od_pairs_NEV'], n_links)
+    y = state[n_links:]
     
-    # Compute outflows for all links
-    f = np.zeros(n_links)
-    for i in range(n_links):
-        edge = params['idx_to_edge'][i]
-        edge_data = params['G'].edges[edge]
-        link_type = edge_data.get('link_type', 'mixed')
-        
-        if link_type == 'origin':
-            # CRITICAL: Origin constant outflow
-            f[i] = params['lambda_origin'][i]
-        elif link_type == 'EV-only':
-            station_id = edge_data.get('station_id')
-            station_params = get_station_parameters(t, station_id)
-            f[i] = outflow_function(x[i], mu=station_params['mu_s'], nu=station_params['nu_s'], is_charging=True)
-        else:
-            f[i] = outflow_function(x[i])
-    
-    # Traffic flow dynamics: dx/dt = R^T f - f
-    dx_dt = R.T @ f - f
-    
-    # --- REPLICATOR DYNAMICS for EV with NORMALIZATION ---
-    dy_EV_dt = np.zeros(n_paths_EV)
-    
-    tau_EV = compute_path_costs(x, params['paths_EV'], params['od_pairs_EV'], 
-                                 params['charging_stations'], params['idx_to_edge'], 
-                                 params['G'], t, vehicle_class='EV')
-    
-    idx = 0
-    for od in params['od_pairs_EV']:
-        paths = params['paths_EV'][od]
-        n_paths_od = len(paths)
-        
-        y_od = np.maximum(y_EV[idx:idx + n_paths_od], 1e-12)
-        tau_od = tau_EV[idx:idx + n_paths_od]
-        lambda_od = params['lambda_od_EV'][od]
-        
-        # RENORMALIZE to conserve flow
-        total_flow = np.sum(y_od)
-        if total_flow > 1e-12:
-            y_od = y_od * (lambda_od / total_flow)
-        else:
-            y_od = np.ones(n_paths_od) * (lambda_od / n_paths_od)
-        
-        if lambda_od > 1e-9:
-            tau_avg = np.sum(y_od * tau_od) / lambda_od
-            
-            for i in range(n_paths_od):
-                dy_EV_dt[idx + i] = eta_EV * y_od[i] * (tau_avg - tau_od[i])
-        
-        idx += n_paths_od
-    
-    # --- REPLICATOR DYNAMICS for NEV with NORMALIZATION ---
-    dy_NEV_dt = np.zeros(n_paths_NEV)
+    station_params = schedule_at(params['schedule'], t)
     
-    tau_NEV = compute_path_costs(x, params['paths_NEV'], params['od_pairs_NEV'], 
-                                  params['charging_stations'], params['idx_to_edge'], 
-                                  params['G'], t, vehicle_class='NEV')
+    # Outflows for all links (origin links emit their constant demand)
+    f = link_outflows(links, model, x, station_params)
     
-    idx = 0
-    for od in params['od_pairs_NEV']:
-        paths = params['paths_NEV'][od]
-        n_paths_od = len(paths)
-        
-        y_od = np.maximum(y_NEV[idx:idx + n_paths_od], 1e-12)
-        tau_od = tau_NEV[idx:idx + n_paths_od]
-        lambda_od = params['lambda_od_NEV'][od]
-        
-        # RENORMALIZE to conserve flow
-        total_flow = np.sum(y_od)
-        if total_flow > 1e-12:
-            y_od = y_od * (lambda_od / total_flow)
-        else:
-            y_od = np.ones(n_paths_od) * (lambda_od / n_paths_od)
-        
-        if lambda_od > 1e-9:
-            tau_avg = np.sum(y_od * tau_od) / lambda_od
-            
-            for i in range(n_paths_od):
-                dy_NEV_dt[idx + i] = eta_NEV * y_od[i] * (tau_avg - tau_od[i])
-        
-        idx += n_paths_od
+    # Traffic flow dynamics: dx/dt = R^T f - f (R(y) from compiled transitions)
+    dx_dt = routing_inflow(params['routing'], y, f) - f
     
-    # Combine derivatives
-    dstate_dt = np.concatenate([dx_dt, dy_EV_dt, dy_NEV_dt])
+    # --- REPLICATOR DYNAMICS for EV and NEV with NORMALIZATION ---
+    c_EV, c_NEV = link_costs(links, model, x, station_params)
+    tau = path_costs(params['paths'], c_EV, c_NEV)
+    dy_dt = replicator(params['paths'], model, y, tau)
     
-    return dstate_dt
+    return np.concatenate([dx_dt, dy_dt])
+
+
+def coupled_jacobian(t, state, params):
+    """
+    Analytic Jacobian of coupled_dynamics, used by Radau
+    """
+    n_links = params['n_links']
+    station_params = schedule_at(params['schedule'], t)
+    return jacobian(params['routing'], params['links'], params['paths'],
+                    params['model'], station_params,
+                    state[:n_links], state[n_links:])
+
+
+def coupled_gap(t, state, params):
+    """
+    Relative equilibrium gap of the path flows at (t, state)
+    """
+    n_links = params['n_links']
+    station_params = schedule_at(params['schedule'], t)
+    c_EV, c_NEV = link_costs(params['links'], params['model'], state[:n_links],
+                             station_params)
+    tau = path_costs(params['paths'], c_EV, c_NEV)
+    return equilibrium_gap(params['paths'], params['model'], state[n_links:], tau)
 
 
 # ============================================================================
-# SIMULATION RUNNER
+# SCENARIO SETUP
 # ============================================================================
-def run_simulation(save_animation_path=None, t_final=None, n_points=None, return_data=False):
-    """Main simulation with segmented ODE integration
-    
-    Args:
-        save_animation_path: If provided, saves animation to this file path (e.g., 'network_animation.gif')
-        t_final: Simulation duration (default: T_FINAL)
-        n_points: Number of time points (default: N_TIME_POINTS)
-        return_data: If True, returns network data for interactive visualization
+def compile_scenario(schedule=None):
+    """
+    Network, paths, demand and compiled kernels of one run: the params dict
+    coupled_dynamics() expects, plus 'state0' (uniform split of every OD
+    demand, empty links)
     """
-    # Use provided parameters or defaults
-    sim_t_final = t_final if t_final is not None else T_FINAL
-    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
-    
-    print("\n" + "="*70)
-    print("EV CHARGING STATION COMPETITION SIMULATION")
-    print("Dynamic Pricing with Time-Varying Parameters")
-    print("="*70 + "\n")
-    
-    # Create network
-    print("1. Building network...")
     G, origins, destinations, charging_stations = create_network_with_charging_stations()
     paths_EV, paths_NEV, edge_to_idx, idx_to_edge = enumerate_paths(G, origins, destinations, charging_stations)
     lambda_od_EV, lambda_od_NEV = create_od_demand(G, origins, destinations)
     
     n_links = len(idx_to_edge)
-    print(f"   Network: {n_links} links, {len(charging_stations)} charging stations")
-    
-    # Initialize state
-    print("\n2. Initializing state variables...")
     x0 = np.zeros(n_links)
     
     # Initialize EV path flows
@@ -457,11 +260,6 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
     
     state0 = np.concatenate([x0, y_EV_0, y_NEV_0])
     
-    n_paths_EV = len(y_EV_0)
-    n_paths_NEV = len(y_NEV_0)
-    
-    print(f"   State dimension: {len(state0)} ({n_links} links + {n_paths_EV} EV paths + {n_paths_NEV} NEV paths)")
-    
     # CRITICAL: Prepare lambda_origin for constant origin outflow
     lambda_origin = np.zeros(n_links)
     for origin_link_id in origins:
@@ -469,10 +267,14 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
         total_demand += sum(lambda_od_NEV.get((origin_link_id, d), 0.0) for d in destinations)
         lambda_origin[origin_link_id] = total_demand
     
-    params = {
+    links = compile_links(G, idx_to_edge, lambda_origin)
+    sched = compile_schedule(PRICING_SCHEDULE if schedule is None else load_schedule(schedule),
+                             links['station_ids'])
+    
+    return {
         'n_links': n_links,
-        'n_paths_EV': n_paths_EV,
-        'n_paths_NEV': n_paths_NEV,
+        'n_paths_EV': len(y_EV_0),
+        'n_paths_NEV': len(y_NEV_0),
         'paths_EV': paths_EV,
         'paths_NEV': paths_NEV,
         'od_pairs_EV': od_pairs_EV,
@@ -482,110 +284,193 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
         'lambda_origin': lambda_origin,  # CRITICAL!
         'charging_stations': charging_stations,
         'G': G,
-        'idx_to_edge': idx_to_edge
+        'idx_to_edge': idx_to_edge,
+        'routing': compile_routing(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                                   n_links, eps=1e-9),
+        'links': links,
+        'schedule': sched,
+        'paths': compile_paths(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                               lambda_od_EV, lambda_od_NEV, n_links),
+        'model': kernel_model(LINK_CAPACITY, LATENCY_STEEPNESS, alpha, gamma,
+                              eta_EV, eta_NEV, y_floor=1e-12, clamp=False,
+                              wait='service'),
+        'state0': state0,
     }
+
+
+def load_scenario(schedule=None):
+    """
+    compile_scenario() through the on-disk artifact cache (ev_cache), keyed
+    by this module's source, the schedule, the path options and the model
+    constants; SCENARIO_CACHE = False always recompiles
+    """
+    if not SCENARIO_CACHE:
+        return compile_scenario(schedule)
+    definition = dict(
+        schedule=PRICING_SCHEDULE if schedule is None else load_schedule(schedule),
+        paths=(PATH_K, PATH_MAX_COST),
+        model=[LINK_CAPACITY, LATENCY_STEEPNESS, alpha, gamma, eta_EV, eta_NEV])
+    return cached_scenario(__file__, definition, lambda: compile_scenario(schedule))
+
+
+# ============================================================================
+# SIMULATION RUNNER
+# ============================================================================
+def run_simulation(save_animation_path=None, t_final=None, n_points=None, return_data=False,
+                   schedule=None, jacobian=None, converge_tol=None, mode='dynamic',
+                   plots=True, figures=(1, 2, 3, 4), solution_path=None, charts=False,
+                   progress=None, renderer=None):
+    """Main simulation with segmented ODE integration
+    
+    Args:
+        save_animation_path: If provided, saves animation to this file path (e.g., 'network_animation.gif')
+        t_final: Simulation duration (default: T_FINAL)
+        n_points: Number of time points (default: N_TIME_POINTS)
+        return_data: If True, returns network data for interactive visualization;
+            'arrays' keeps its time series as numpy arrays and adds the
+            path flows, for ev_trajectory.encode()
+        schedule: Pricing schedule dict or JSON path (default: PRICING_SCHEDULE)
+        jacobian: 'analytic', 'sparsity' or 'fd' (default: JACOBIAN)
+        converge_tol: Stop each pricing phase once the relative equilibrium
+            gap and link-density rates fall below this (default: CONVERGE_TOL)
+        mode: 'dynamic' integrates the transient; 'equilibrium' solves the
+            steady state of every pricing phase and returns
+            {'mode', 'success', 'phases'} without plotting
+        plots: If False, skip all figures (matplotlib is never imported)
+            and return a compact {'mode', 'success', 'nfev', 'njev', 'nlu',
+            'phases'} summary with the state and station metrics each
+            pricing phase ended in; with return_data the network data
+            carries the same 'phases'
+        figures: Numbers of the figures to render when plotting (1 network
+            animation, 2 path demands, 3 replicator convergence, 4
+            competition metrics; default all)
+        solution_path: .npz file holding the solver output for these
+            parameters: loaded instead of integrating if it exists,
+            written after a successful solve otherwise
+        charts: With return_data, add the series behind figures 2-4 as
+            'charts' (see chart_data()); needs no plotting
+        progress: Called with a dict per progress event: {'stage': 'build'},
+            the solver's {'stage': 'solve', ...} (see ev_engine.progress_rhs)
+            and {'stage': 'render', 'figure', 'n_figures', 'name'}
+        renderer: Draws the figures in place of render_figures(), called
+            with the same arguments (e.g. ev_render's process pool)
+    """
+    report = progress or (lambda event: None)
+    shown = set(figures)
+
+    # Use provided parameters or defaults
+    sim_t_final = t_final if t_final is not None else T_FINAL
+    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
+    
+    print("\n" + "="*70)
+    print("EV CHARGING STATION COMPETITION SIMULATION")
+    print("Dynamic Pricing with Time-Varying Parameters")
+    print("="*70 + "\n")
     
+    print("1. Building network...")
+    report({'stage': 'build'})
+    params = load_scenario(schedule)
+    (G, charging_stations, idx_to_edge, paths_EV, paths_NEV, od_pairs_EV,
+     od_pairs_NEV, lambda_od_EV, lambda_od_NEV, links, sched, state0) = (
+        params[k] for k in ('G', 'charging_stations', 'idx_to_edge',
+                            'paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                            'lambda_od_EV', 'lambda_od_NEV', 'links', 'schedule',
+                            'state0'))
+    n_links = params['n_links']
+    n_paths_EV = params['n_paths_EV']
+    n_paths_NEV = params['n_paths_NEV']
+    print(f"   Network: {n_links} links, {len(charging_stations)} charging stations")
+
+    print("\n2. Initializing state variables...")
+    print(f"   State dimension: {len(state0)} ({n_links} links + {n_paths_EV} EV paths + {n_paths_NEV} NEV paths)")
+
+    def get_params(t, sid):
+        return station_parameters(sched, t, sid)
+
     # SEGMENTED INTEGRATION
     print("\n3. Running segmented simulation across phases...")
     print(f"   Duration: {sim_t_final}s, Time points: {sim_n_points}")
     
-    # Simplified: single phase for faster cloud execution
-    phase_boundaries = [0, sim_t_final]
-    
-    t_all = []
-    x_all = []
-    y_EV_all = []
-    y_NEV_all = []
-    
-    current_state = state0
+    # One segment per pricing phase, split at the schedule breakpoints
+    phase_boundaries = phase_edges(sched, sim_t_final)
+    t_eval = np.linspace(0, sim_t_final, sim_n_points)
+
+    if mode == 'equilibrium':
+        phases = phase_equilibria(params['routing'], links, params['paths'],
+                                  params['model'], lambda t: schedule_at(sched, t),
+                                  phase_boundaries, state0)
+        print(equilibrium_table(phases, links))
+        return {'mode': 'equilibrium',
+                'success': all(ph['success'] for ph in phases),
+                'phases': summarise_equilibria(phases, links, n_paths_EV)}
 
     def dynamics_wrapper(t, state):
         return coupled_dynamics(t, state, params)
-    
-    for phase_idx in range(len(phase_boundaries) - 1):
-        t_start = phase_boundaries[phase_idx]
-        t_end = phase_boundaries[phase_idx + 1]
-        
-        print(f"\n   Phase {phase_idx + 1}: t = {t_start} to {t_end}")
-        
-        n_points_phase = int(sim_n_points * (t_end - t_start) / sim_t_final)
-        t_eval_phase = np.linspace(t_start, t_end, n_points_phase)
-        
-        sol = solve_ivp(
-            dynamics_wrapper, 
-            [t_start, t_end], 
-            current_state,
-            method='Radau',
-            t_eval=t_eval_phase,
-            rtol=SOLVER_RTOL,
-            atol=SOLVER_ATOL,
-            max_step=MAX_STEP
-        )
-        
-        if not sol.success:
-            print(f"   WARNING: Integration failed in phase {phase_idx + 1}")
-            print(f"   Message: {sol.message}")
-        else:
-            print(f"   Phase {phase_idx + 1} complete: {len(sol.t)} time points")
-        
-        t_phase = sol.t
-        x_phase = sol.y[:n_links, :]
-        y_EV_phase = sol.y[n_links:n_links + n_paths_EV, :]
-        y_NEV_phase = sol.y[n_links + n_paths_EV:, :]
-        
-        if phase_idx == 0:
-            t_all = t_phase
-            x_all = x_phase
-            y_EV_all = y_EV_phase
-            y_NEV_all = y_NEV_phase
+
+    def jacobian_wrapper(t, state):
+        return coupled_jacobian(t, state, params)
+
+    jac_kw = solver_jacobian(jacobian or JACOBIAN, params['routing'],
+                             params['paths'], jacobian_wrapper)
+
+    tol = converge_tol if converge_tol is not None else CONVERGE_TOL
+    converged = None
+    if tol is not None:
+        watch = np.setdiff1d(np.arange(n_links), links['origin'])
+        converged = convergence_event(dynamics_wrapper,
+                                      lambda t, s: coupled_gap(t, s, params),
+                                      watch, tol)
+
+    if solution_path and os.path.exists(solution_path):
+        sol = load_solution(solution_path)   # solved before with these parameters
+    else:
+        fun = dynamics_wrapper
+        if progress is not None:
+            fun = progress_rhs(dynamics_wrapper, phase_boundaries, progress)
+        sol = integrate_phases(fun, t_eval, state0, phase_boundaries,
+                               converged=converged,
+                               method='Radau', **jac_kw,
+                               rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
+        if solution_path and sol.success:
+            save_solution(solution_path, sol)
+
+    for phase_idx, (t_start, t_end, ok) in enumerate(sol.segments):
+        if ok and tol is not None and sol.settled[phase_idx] is not None:
+            print(f"\n   Phase {phase_idx + 1}: t = {t_start} to {t_end} settled at "
+                  f"t = {sol.settled[phase_idx]:.1f}")
+        elif ok:
+            print(f"\n   Phase {phase_idx + 1}: t = {t_start} to {t_end} complete")
         else:
-            t_all = np.concatenate([t_all, t_phase[1:]])
-            x_all = np.concatenate([x_all, x_phase[:, 1:]], axis=1)
-            y_EV_all = np.concatenate([y_EV_all, y_EV_phase[:, 1:]], axis=1)
-            y_NEV_all = np.concatenate([y_NEV_all, y_NEV_phase[:, 1:]], axis=1)
-        
-        current_state = sol.y[:, -1]
+            print(f"\n   WARNING: Integration failed in phase {phase_idx + 1}")
+            print(f"   Message: {sol.message}")
+
+    t_all = sol.t
+    x_all = sol.y[:n_links, :]
+    y_EV_all = sol.y[n_links:n_links + n_paths_EV, :]
+    y_NEV_all = sol.y[n_links + n_paths_EV:, :]
     
     print(f"\n   Total simulation: {len(t_all)} time points")
     
-    # Extract station metrics
-    print("\n4. Extracting station metrics...")
-    q_s_traj = {}
-    p_s_traj = {}
-    for sid, link_id in charging_stations.items():
-        q_s_traj[sid] = np.array([
-            outflow_function(x_all[link_id, i],
-                           mu=get_station_parameters(t_all[i], sid)['mu_s'],
-                           nu=get_station_parameters(t_all[i], sid)['nu_s'],
-                           is_charging=True)
-            for i in range(len(t_all))
-        ])
-        p_s_traj[sid] = np.array([
-            get_station_parameters(t_all[i], sid)['p_s'] for i in range(len(t_all))
-        ])
-    
-    # Create visualizations
-    print("\n5. Creating visualizations...")
-    # Enable animation with optimized settings for cloud
-    print("   [VIZ 1/4] Network animation...")
-    create_network_animation(G, x_all, t_all, idx_to_edge, charging_stations, get_station_parameters, save_path=save_animation_path, n_frames=min(50, sim_n_points // 4))
-    
-    print("   [VIZ 2/4] Path demands...")
-    plot_path_demands(t_all, y_EV_all, y_NEV_all, paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
-                     lambda_od_EV, lambda_od_NEV, idx_to_edge, G)
-    
-    print("   [VIZ 3/4] Replicator convergence...")
-    plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
-                         paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
-                         lambda_od_EV, lambda_od_NEV, idx_to_edge, G)
-    
-    print("   [VIZ 4/4] Competition metrics...")
-    plot_charging_station_metrics(q_s_traj, p_s_traj, t_all, charging_stations,
-                                  get_station_parameters, x_all, paths_EV, od_pairs_EV)
-    
+    phases = None
+    if not plots:
+        phases = summarise_equilibria(
+            phase_snapshots(params['routing'], links, params['paths'], params['model'],
+                            lambda t: schedule_at(sched, t), sol),
+            links, n_paths_EV)
+        if not return_data:
+            return {'mode': 'dynamic', 'success': bool(sol.success),
+                    'nfev': int(sol.nfev), 'njev': int(sol.njev), 'nlu': int(sol.nlu),
+                    'phases': phases}
+
+    if plots:
+        # Create visualizations
+        print("\n4. Creating visualizations...")
+        (renderer or render_figures)(sorted(shown), sol, params, sim_t_final, sim_n_points,
+                                     save_animation_path, report)
+
     # Return network data for interactive visualization
     if return_data:
-        pos = nx.get_node_attributes(G, 'pos')
+        pos = dict(G.nodes(data='pos', default=(0, 0)))
         # Build nodes list
         nodes = []
         for node in G.nodes():
@@ -615,17 +500,20 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
                 'stationId': station_id
             })
         
-        # Downsample time series for web (max 100 points)
+        # Downsample time series for web (max 100 points); lists for JSON
+        # unless return_data is 'arrays'
         step = max(1, len(t_all) // 100)
-        t_sampled = t_all[::step].tolist()
-        x_sampled = x_all[:, ::step].tolist()
+        arrays = return_data == 'arrays'
+        series = (lambda a: a) if arrays else (lambda a: a.tolist())
+        t_sampled = series(t_all[::step])
+        x_sampled = series(x_all[:, ::step])
         
         # Station prices over time
         station_prices = {}
         for sid in charging_stations:
-            station_prices[sid] = [get_station_parameters(t, sid)['p_s'] for t in t_sampled]
+            station_prices[sid] = series(get_params(t_all[::step], sid)['p_s'])
         
-        return {
+        data = {
             'nodes': nodes,
             'edges': edges,
             'timePoints': t_sampled,
@@ -634,6 +522,19 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
             'stationPrices': station_prices,
             'duration': float(sim_t_final)
         }
+        if phases is not None:
+            data['phases'] = phases  # per-phase end state and station metrics
+        if charts:
+            data['charts'] = chart_data(t_all, x_all, y_EV_all, y_NEV_all, params)
+        if arrays:
+            # path flows, rows in the order of 'paths' (OD pair, then path)
+            data['pathFlows'] = {'EV': y_EV_all[:, ::step], 'NEV': y_NEV_all[:, ::step]}
+            data['paths'] = {
+                cls: [{'od': list(od_label(od, idx_to_edge, G)), 'links': [int(l) for l in p]}
+                      for od in od_pairs for p in paths[od]]
+                for cls, paths, od_pairs in (('EV', paths_EV, od_pairs_EV),
+                                             ('NEV', paths_NEV, od_pairs_NEV))}
+        return data
     
     return None
 
@@ -641,13 +542,79 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
 # ============================================================================
 # VISUALIZATION FUNCTIONS
 # ============================================================================
-def create_network_animation(G, x_traj, t, idx_to_edge, charging_stations, get_params_func, save_path=None, n_frames=50):
+# Figures of run_simulation(), numbered from 1 as in its ``figures``
+FIGURE_NAMES = ('Network animation', 'Path demands', 'Replicator convergence',
+                'Competition metrics')
+
+
+def station_flows(params, t, x_all):
+    """Charging outflow q_s and price p_s of every station over ``t``"""
+    q_s_traj, p_s_traj = {}, {}
+    for sid, link_id in params['charging_stations'].items():
+        station_params = station_parameters(params['schedule'], t, sid)
+        q_s_traj[sid] = charging_outflow(params['model'], x_all[link_id],
+                                         station_params['mu_s'], station_params['nu_s'])
+        p_s_traj[sid] = station_params['p_s']
+    return q_s_traj, p_s_traj
+
+
+def render_figure(figure, sol, params, t_final, n_points, save_animation_path=None,
+                  batch=None, writer=None):
+    """Draw figure number ``figure`` (FIGURE_NAMES) of the run ``sol`` of
+    ``params``; ``batch`` and ``writer`` go to create_network_animation()"""
+    G, charging_stations, idx_to_edge = params['G'], params['charging_stations'], params['idx_to_edge']
+    n_links, n_paths_EV = params['n_links'], params['n_paths_EV']
+    t_all = sol.t
+    x_all = sol.y[:n_links, :]
+    y_EV_all = sol.y[n_links:n_links + n_paths_EV, :]
+    y_NEV_all = sol.y[n_links + n_paths_EV:, :]
+    paths = [params[k] for k in ('paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                                 'lambda_od_EV', 'lambda_od_NEV')]
+
+    def get_params(t, sid):
+        return station_parameters(params['schedule'], t, sid)
+
+    if figure == 1:
+        create_network_animation(G, x_all, t_all, idx_to_edge, charging_stations, get_params,
+                                 save_path=save_animation_path, n_frames=min(50, n_points // 4),
+                                 batch=batch, writer=writer)
+    elif figure == 2:
+        plot_path_demands(t_all, y_EV_all, y_NEV_all, *paths, idx_to_edge, G)
+    elif figure == 3:
+        plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all, *paths, idx_to_edge, G,
+                              get_params=get_params)
+    elif figure == 4:
+        q_s_traj, p_s_traj = station_flows(params, t_all, x_all)
+        plot_charging_station_metrics(q_s_traj, p_s_traj, t_all, charging_stations,
+                                      get_params, x_all, params['paths_EV'], params['od_pairs_EV'])
+
+
+def render_figures(figures, sol, params, t_final, n_points, save_animation_path=None,
+                   report=None):
+    """Draw ``figures`` one after the other (see render_figure()), calling
+    ``report`` with a {'stage': 'render', ...} event before each"""
+    for n in figures:
+        name = FIGURE_NAMES[n - 1]
+        print(f"   [VIZ {n}/4] {name}...")
+        if report is not None:
+            report({'stage': 'render', 'figure': n, 'n_figures': 4, 'name': name})
+        render_figure(n, sol, params, t_final, n_points, save_animation_path)
+
+
+def create_network_animation(G, x_traj, t, idx_to_edge, charging_stations, get_params_func, save_path=None, n_frames=50,
+                             batch=None, writer=None):
     """Create animated network visualization
     
     Args:
         save_path: If provided, saves animation to this file path (e.g., 'network_animation.gif')
         n_frames: Number of frames in the animation (default: 50 for cloud optimization)
+        batch: (i, k) to draw only every k-th frame from the i-th on
+        writer: Movie writer for Animation.save() (default: PillowWriter, 10 fps)
     """
+    import networkx as nx
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    import matplotlib.animation as animation
     
     # Compute link demands (total flow wanting to use each link)
     link_demands = np.zeros_like(x_traj)
@@ -757,13 +724,18 @@ def create_network_animation(G, x_traj, t, idx_to_edge, charging_stations, get_p
     # Calculate frame step to get n_frames total
     frame_step = max(1, len(t) // n_frames)
     frames = np.arange(0, len(t), frame_step)
+    if batch is not None:
+        frames = frames[batch[0]::batch[1]]
+    if not len(frames):
+        plt.close('all')
+        return
     ani = animation.FuncAnimation(fig, update, frames=frames, interval=100)
     
     # Save animation if path provided
     if save_path:
         try:
             print(f"   Saving animation to {save_path}...")
-            ani.save(save_path, writer='pillow', fps=10)
+            ani.save(save_path, writer=writer or animation.PillowWriter(fps=10))
             print(f"   Animation saved successfully!")
         except Exception as e:
             print(f"   Warning: Could not save animation: {e}")
@@ -781,70 +753,73 @@ def od_label(od, idx_to_edge, G):
     return on, dn
 
 
+def path_demand_series(y_EV_all, y_NEV_all, paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                       lambda_od_EV, lambda_od_NEV, idx_to_edge, G):
+    """Path flows of every OD pair, NEV first: a list of
+    {'title', 'vehicle', 'demand', 'flows'} with flows[path][time]."""
+    series = []
+    for vcls, y_all, paths, od_pairs, lam in (
+            ('NEV', y_NEV_all, paths_NEV, od_pairs_NEV, lambda_od_NEV),
+            ('EV', y_EV_all, paths_EV, od_pairs_EV, lambda_od_EV)):
+        idx = 0
+        for od in od_pairs:
+            n_od = len(paths[od])
+            on, dn = od_label(od, idx_to_edge, G)
+            series.append(dict(title=f'{vcls}: {on} -> {dn}', vehicle=vcls,
+                               demand=lam[od], flows=y_all[idx:idx + n_od, :]))
+            idx += n_od
+    return series
+
+
 def plot_path_demands(t, y_EV_all, y_NEV_all, paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
                      lambda_od_EV, lambda_od_NEV, idx_to_edge, G):
     """Plot path demand evolution"""
+    import matplotlib.pyplot as plt
+
+    series = path_demand_series(y_EV_all, y_NEV_all, paths_EV, paths_NEV, od_pairs_EV,
+                                od_pairs_NEV, lambda_od_EV, lambda_od_NEV, idx_to_edge, G)
+
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 7))
     fig.suptitle('Path Demand Dynamics', fontsize=16, fontweight='bold')
     
     # Bright vibrant colors
     bright_colors = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
     
-    # NEV paths
-    idx = 0
-    for od in od_pairs_NEV:
-        paths = paths_NEV[od]
-        for p_idx in range(len(paths)):
-            ax1.plot(t, y_NEV_all[idx, :], label=f'Path {p_idx}', linewidth=2.5,
-                    color=bright_colors[p_idx % len(bright_colors)])
-            idx += 1
-    
-    on, dn = od_label(od_pairs_NEV[0], idx_to_edge, G) if od_pairs_NEV else ('O', 'D')
-    ax1.axhline(y=lambda_od_NEV[od_pairs_NEV[0]], color='#DC143C', linestyle='--', linewidth=2.5,
-               label=f'Total Demand={lambda_od_NEV[od_pairs_NEV[0]]:.2f}')
-    ax1.set_title(f'NEV: {on} -> {dn}')
-    ax1.set_xlabel('Time')
-    ax1.set_ylabel('Path Flow')
-    ax1.legend()
-    ax1.grid(True, alpha=0.3)
-    
-    # EV paths
-    idx = 0
-    for od in od_pairs_EV:
-        paths = paths_EV[od]
-        for p_idx in range(len(paths)):
-            ax2.plot(t, y_EV_all[idx, :], label=f'Path {p_idx}', linewidth=2.5,
-                    color=bright_colors[p_idx % len(bright_colors)])
-            idx += 1
-    
-    on, dn = od_label(od_pairs_EV[0], idx_to_edge, G) if od_pairs_EV else ('O', 'D')
-    ax2.axhline(y=lambda_od_EV[od_pairs_EV[0]], color='#DC143C', linestyle='--', linewidth=2.5,
-               label=f'Total Demand={lambda_od_EV[od_pairs_EV[0]]:.2f}')
-    ax2.set_title(f'EV: {on} -> {dn}')
-    ax2.set_xlabel('Time')
-    ax2.set_ylabel('Path Flow')
-    ax2.legend()
-    ax2.grid(True, alpha=0.3)
+    # NEV paths on the left, EV paths on the right; all OD pairs of a class share an axis
+    for ax, vcls in ((ax1, 'NEV'), (ax2, 'EV')):
+        group = [s for s in series if s['vehicle'] == vcls]
+        for s in group:
+            for p_idx, flow in enumerate(s['flows']):
+                ax.plot(t, flow, label=f'Path {p_idx}', linewidth=2.5,
+                        color=bright_colors[p_idx % len(bright_colors)])
+
+        ax.axhline(y=group[0]['demand'], color='#DC143C', linestyle='--', linewidth=2.5,
+                   label=f"Total Demand={group[0]['demand']:.2f}")
+        ax.set_title(group[0]['title'])
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Path Flow')
+        ax.legend()
+        ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
     plt.show()
 
 
-def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
-                          paths_EV, paths_NEV,
-                          od_pairs_EV, od_pairs_NEV,
-                          lambda_EV, lambda_NEV, idx_to_edge, G):
-    """Plot replicator convergence: tau_avg - tau_p -> 0"""
-    step   = max(1, len(t_all)//400)
+def cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all,
+                            paths_EV, paths_NEV,
+                            od_pairs_EV, od_pairs_NEV,
+                            lambda_EV, lambda_NEV, idx_to_edge, G,
+                            get_params=get_station_parameters, max_points=400):
+    """Replicator convergence tau_avg - tau_p of every path, on at most
+    ``max_points`` of the time points: (t_sub, [{'title', 'vehicle',
+    'gaps'}]) with gaps[path][time], NEV OD pairs first."""
+    step   = max(1, len(t_all)//max_points)
     t_sub  = t_all[::step]
     x_sub  = x_all[:, ::step]
     yEVs   = y_EV_all[:, ::step]
     yNEVs  = y_NEV_all[:, ::step]
     n_sub  = len(t_sub)
 
-    # Bright colors for paths
-    bright_colors = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
-
     def gap_series(od_pairs, paths_dict, y_sub, lam_dict, vcls):
         results = []
         pidx = 0
@@ -868,7 +843,7 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
                         if lt in ('origin','destination'): continue
                         elif lt=='EV-only' and vcls=='EV':
                             sid = d['station_id']
-                            sp  = get_station_parameters(t_sub[ti], sid)
+                            sp  = get_params(t_sub[ti], sid)
                             xi  = x_t[lid]
                             wt  = xi / max(sp['mu_s'], 1e-9)
                             c  += latency_function(xi, True) + alpha*wt + gamma*sp['p_s']
@@ -879,12 +854,29 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
                 tau_avg= (y_n*tau_p).sum() / max(lam,1e-12)
                 gaps[:, ti] = tau_avg - tau_p
             on, dn = od_label(od, idx_to_edge, G)
-            results.append(dict(title=f'{vcls}: {on} -> {dn}', gaps=gaps))
+            results.append(dict(title=f'{vcls}: {on} -> {dn}', vehicle=vcls, gaps=gaps))
             pidx += np_od
         return results
 
-    all_res = (gap_series(od_pairs_NEV, paths_NEV, yNEVs, lambda_NEV, 'NEV') +
-               gap_series(od_pairs_EV,  paths_EV,  yEVs,  lambda_EV,  'EV'))
+    return t_sub, (gap_series(od_pairs_NEV, paths_NEV, yNEVs, lambda_NEV, 'NEV') +
+                   gap_series(od_pairs_EV,  paths_EV,  yEVs,  lambda_EV,  'EV'))
+
+
+def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
+                          paths_EV, paths_NEV,
+                          od_pairs_EV, od_pairs_NEV,
+                          lambda_EV, lambda_NEV, idx_to_edge, G,
+                          get_params=get_station_parameters):
+    """Plot replicator convergence: tau_avg - tau_p -> 0"""
+    import matplotlib.pyplot as plt
+
+    t_sub, all_res = cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all,
+                                             paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                                             lambda_EV, lambda_NEV, idx_to_edge, G,
+                                             get_params=get_params)
+
+    # Bright colors for paths
+    bright_colors = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
 
     if not all_res: return
 
@@ -913,11 +905,57 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
     plt.show()
 
 
+def station_metrics_series(q_s_traj, p_s_traj, t, charging_stations, station_params, x_traj):
+    """Competition metrics of the stations (sorted ids under 'stations'):
+    'marketShare' (%), 'price' and 'queue' over ``t``, integrated
+    'revenue' and 'profit' per entry of 'phases' ({'name', 't_start',
+    't_end'}) and 'overallShare' (%), each a dict by station."""
+    station_ids = sorted(charging_stations.keys())
+    phases = [dict(name='Phase 1', t_start=0, t_end=100),
+              dict(name='Phase 2', t_start=100, t_end=200),
+              dict(name='Phase 3', t_start=200, t_end=300),
+              dict(name='Phase 4', t_start=300, t_end=T_FINAL)]
+
+    def integrated(rate_fn):
+        # rate_fn(sid, mask, t_phase) integrated over every phase
+        out = {}
+        for sid in station_ids:
+            totals = []
+            for ph in phases:
+                mask = (t >= ph['t_start']) & (t <= ph['t_end'])
+                t_phase = t[mask]
+                if len(t_phase) > 1:
+                    totals.append(np.trapz(rate_fn(sid, mask, t_phase), t_phase))
+                else:
+                    totals.append(0.0)
+            out[sid] = totals
+        return out
+
+    total_flow = sum(q_s_traj[sid] for sid in station_ids)
+    total_integrated_flows = {sid: np.trapz(q_s_traj[sid], t) for sid in station_ids}
+    total_flow_all_stations = sum(total_integrated_flows.values())
+    return dict(
+        stations=station_ids,
+        phases=phases,
+        marketShare={sid: 100 * q_s_traj[sid] / (total_flow + 1e-9) for sid in station_ids},
+        price={sid: p_s_traj[sid] for sid in station_ids},
+        queue={sid: x_traj[charging_stations[sid], :] for sid in station_ids},
+        revenue=integrated(lambda sid, mask, t_phase: p_s_traj[sid][mask] * q_s_traj[sid][mask]),
+        profit=integrated(lambda sid, mask, t_phase: (p_s_traj[sid][mask]
+                                                      - station_params(t_phase, sid)['c_s'])
+                                                     * q_s_traj[sid][mask]),
+        overallShare={sid: (total_integrated_flows[sid] / total_flow_all_stations * 100)
+                      if total_flow_all_stations > 1e-9 else 0.0 for sid in station_ids})
+
+
 def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, 
                                    station_params, x_traj, paths_EV, od_pairs):
     """Plot charging station competition metrics"""
-    n_stations = len(charging_stations)
-    station_ids = sorted(charging_stations.keys())
+    import matplotlib.pyplot as plt
+
+    metrics = station_metrics_series(q_s_traj, p_s_traj, t, charging_stations,
+                                     station_params, x_traj)
+    station_ids = metrics['stations']
     
     fig, axs = plt.subplots(2, 3, figsize=(20, 12))
     fig.suptitle('Competition Metrics (Dynamic Pricing Game)', fontsize=18, fontweight='bold')
@@ -928,9 +966,8 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     
     # Market Share Evolution
     ax = axs[0, 0]
-    total_flow = sum(q_s_traj[sid] for sid in station_ids)
     for sid in station_ids:
-        market_share = 100 * q_s_traj[sid] / (total_flow + 1e-9)
+        market_share = metrics['marketShare'][sid]
         ax.plot(t, market_share, label=sid, linewidth=2.5, color=colors[sid])
         ax.fill_between(t, 0, market_share, color=colors[sid], alpha=0.15)
     ax.axvline(x=100, color='gray', linestyle='--', alpha=0.5, label='Phase Change')
@@ -946,7 +983,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     # Pricing Strategy
     ax = axs[0, 1]
     for sid in station_ids:
-        ax.plot(t, p_s_traj[sid], label=f'{sid} Price', linewidth=2.5, color=colors[sid])
+        ax.plot(t, metrics['price'][sid], label=f'{sid} Price', linewidth=2.5, color=colors[sid])
     ax.axvline(x=100, color='gray', linestyle='--', alpha=0.5)
     ax.axvline(x=200, color='gray', linestyle='--', alpha=0.5)
     ax.axvline(x=300, color='gray', linestyle='--', alpha=0.5)
@@ -959,8 +996,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     # Queue Lengths
     ax = axs[0, 2]
     for sid in station_ids:
-        link_id = charging_stations[sid]
-        ax.plot(t, x_traj[link_id, :], label=f'{sid} Queue', linewidth=2.5, color=colors[sid])
+        ax.plot(t, metrics['queue'][sid], label=f'{sid} Queue', linewidth=2.5, color=colors[sid])
     ax.axvline(x=100, color='gray', linestyle='--', alpha=0.5)
     ax.axvline(x=200, color='gray', linestyle='--', alpha=0.5)
     ax.axvline(x=300, color='gray', linestyle='--', alpha=0.5)
@@ -971,29 +1007,16 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     ax.legend(framealpha=0.9)
     
     # Phase comparison bar charts
-    phases = [
-        ('Phase 1\n(0-100s)', 0, 100),
-        ('Phase 2\n(100-200s)', 100, 200),
-        ('Phase 3\n(200-300s)', 200, 300),
-        ('Phase 4\n(300-400s)', 300, T_FINAL)
-    ]
+    phase_labels = ['Phase 1\n(0-100s)', 'Phase 2\n(100-200s)',
+                    'Phase 3\n(200-300s)', 'Phase 4\n(300-400s)']
     
-    x_pos = np.arange(len(phases))
+    x_pos = np.arange(len(phase_labels))
     width = 0.35
     
     # Revenue by Phase
     ax = axs[1, 0]
     for i, sid in enumerate(station_ids):
-        revenues = []
-        for _, start_t, end_t in phases:
-            mask = (t >= start_t) & (t <= end_t)
-            t_phase = t[mask]
-            if len(t_phase) > 1:
-                service_rates = q_s_traj[sid][mask]
-                revenue_rate = p_s_traj[sid][mask] * service_rates
-                revenues.append(np.trapz(revenue_rate, t_phase))
-            else:
-                revenues.append(0.0)
+        revenues = metrics['revenue'][sid]
         ax.bar(x_pos + i*width, revenues, width, label=sid, color=colors[sid], alpha=0.8, edgecolor='black')
         
         for j, (xpos, rev) in enumerate(zip(x_pos + i*width, revenues)):
@@ -1001,7 +1024,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
                    f'{rev:.1f}', ha='center', va='bottom', fontsize=8, fontweight='bold')
     
     ax.set_xticks(x_pos + width/2)
-    ax.set_xticklabels([p[0] for p in phases])
+    ax.set_xticklabels(phase_labels)
     ax.set_ylabel('Integrated Revenue ($·vehicles)')
     ax.set_title('Integrated Revenue ($/vehicles)')
     ax.legend()
@@ -1010,18 +1033,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     # Net Profit by Phase
     ax = axs[1, 1]
     for i, sid in enumerate(station_ids):
-        net_profits = []
-        for _, start_t, end_t in phases:
-            mask = (t >= start_t) & (t <= end_t)
-            t_phase = t[mask]
-            if len(t_phase) > 1:
-                prices = p_s_traj[sid][mask]
-                costs = np.array([get_station_parameters(ti, sid)['c_s'] for ti in t_phase])
-                service_rates = q_s_traj[sid][mask]
-                profit_rate = (prices - costs) * service_rates
-                net_profits.append(np.trapz(profit_rate, t_phase))
-            else:
-                net_profits.append(0.0)
+        net_profits = metrics['profit'][sid]
         ax.bar(x_pos + i*width, net_profits, width, label=sid, color=colors[sid], alpha=0.8, edgecolor='black')
         
         for j, (xpos, profit) in enumerate(zip(x_pos + i*width, net_profits)):
@@ -1031,7 +1043,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
                    fontsize=8, fontweight='bold')
     
     ax.set_xticks(x_pos + width/2)
-    ax.set_xticklabels([p[0] for p in phases])
+    ax.set_xticklabels(phase_labels)
     ax.set_ylabel('Integrated Net Profit ($·vehicles)')
     ax.set_title('Integrated Net Profit ($/vehicles)')
     ax.legend()
@@ -1040,19 +1052,8 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     
     # Market Share
     ax = axs[1, 2]
-    total_integrated_flows = {}
-    for sid in station_ids:
-        service_rates = q_s_traj[sid]
-        total_integrated_flows[sid] = np.trapz(service_rates, t)
-    
-    total_flow_all_stations = sum(total_integrated_flows.values())
-    
-    flow_shares = []
-    labels = []
-    for sid in station_ids:
-        pct = (total_integrated_flows[sid] / total_flow_all_stations * 100) if total_flow_all_stations > 1e-9 else 0.0
-        flow_shares.append(pct)
-        labels.append(sid)
+    flow_shares = [metrics['overallShare'][sid] for sid in station_ids]
+    labels = list(station_ids)
     
     bars = ax.bar(labels, flow_shares, color=[colors[sid] for sid in station_ids], 
                   edgecolor='black', alpha=0.8)
@@ -1072,6 +1073,34 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations,
     plt.show()
 
 
+def chart_data(t_all, x_all, y_EV_all, y_NEV_all, params, max_points=200):
+    """The series behind figures 2-4 on at most ``max_points`` time points,
+    JSON-ready, for clients that draw the charts themselves:
+    {'pathDemands': {'t', 'series'}, 'convergence': {'t', 'series'},
+    'stations': {'t', ...}} (see the *_series functions)."""
+    step = max(1, len(t_all) // max_points)
+    paths = [params[k] for k in ('paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                                 'lambda_od_EV', 'lambda_od_NEV', 'idx_to_edge', 'G')]
+
+    get_params = lambda t, sid: station_parameters(params['schedule'], t, sid)
+    q_s_traj, p_s_traj = station_flows(params, t_all, x_all)
+
+    demands = path_demand_series(y_EV_all, y_NEV_all, *paths)
+    t_sub, gaps = cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all, *paths,
+                                          get_params=get_params, max_points=max_points)
+    stations = station_metrics_series(q_s_traj, p_s_traj, t_all, params['charging_stations'],
+                                      get_params, x_all)
+    for key in ('marketShare', 'price', 'queue'):
+        stations[key] = {sid: s[::step] for sid, s in stations[key].items()}
+
+    return json_ready({
+        'pathDemands': {'t': t_all[::step],
+                        'series': [dict(s, flows=s['flows'][:, ::step]) for s in demands]},
+        'convergence': {'t': t_sub, 'series': gaps},
+        'stations': dict(stations, t=t_all[::step]),
+    })
+
+
 # ============================================================================
 # MAIN EXECUTION
 # ============================================================================
@@ -7,7 +7,15 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import matplotlib.animation as animation
 from matplotlib.widgets import Button
-from scipy.integrate import solve_ivp
+from ev_engine import (compile_routing, routing_inflow, compile_links,
+                       compile_paths, kernel_model, charging_outflow,
+                       link_outflows, link_costs, path_costs, replicator,
+                       jacobian, solver_jacobian, integrate_phases,
+                       equilibrium_gap, convergence_event, phase_equilibria,
+                       summarise_equilibria, equilibrium_table)
+from ev_pricing import compile_schedule, station_parameters, schedule_at, phase_edges
+from ev_paths import generate_paths, charging_layers, cheapest_path
+from scipy.optimize import OptimizeResult
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -28,41 +36,54 @@ N_TIME_POINTS = 2000
 SOLVER_RTOL   = 1e-5
 SOLVER_ATOL   = 1e-7
 MAX_STEP      = 2.0
+JACOBIAN      = 'analytic'   # 'analytic' | 'sparsity' | 'fd'
+CONVERGE_TOL  = None         # e.g. 1e-3: hold the steady state once a phase settles
+PATH_K        = None         # k cheapest paths per OD pair and class; None = all
+PATH_MAX_COST = None         # drop paths dearer than this free-flow cost
+COLUMN_GENERATION = False    # start from one path per OD and class, add paths at phase edges
+COLUMN_TOL    = 1e-6         # a path joins once it undercuts its OD average cost by this
+COLUMN_EVERY  = 25.0         # extra column checkpoints inside a phase (s); None = edges only
+COLUMN_SEED   = 0.1          # share of its OD demand a new path starts with
 
 
 # ──────────────────────────────────────────────────────
 #  PIECEWISE PRICING
 # ──────────────────────────────────────────────────────
-def get_station_parameters(t, station_id):
-   
-    if station_id == 'S1':
+PRICING_SCHEDULE = {
+    'breakpoints': [125, 250, 375],
+    'stations': {
         # Ph1: neutral | Ph2: aggressive cut to dominate O1 | Ph3: expensive | Ph4: moderate
-        if   t < 125: return {'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < 250: return {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < 375: return {'p_s': 0.65, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 12.0}
-        else:         return {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.15, 'nu_s': 15.0}
-    elif station_id == 'S2':
+        'S1': [{'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.65, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 12.0},
+               {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.15, 'nu_s': 15.0}],
         # Ph1: neutral | Ph2: high price (S1 wins) | Ph3: aggressive cut to dominate O1 | Ph4: moderate
-        if   t < 125: return {'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < 250: return {'p_s': 0.70, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < 375: return {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.12, 'nu_s': 10.0}
-        else:         return {'p_s': 0.45, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 13.0}
-    elif station_id == 'S3':
+        'S2': [{'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.70, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.12, 'nu_s': 10.0},
+               {'p_s': 0.45, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 13.0}],
         # Ph1: cheap (wins O2) | Ph2: moderate | Ph3: high | Ph4: moderate
-        if   t < 125: return {'p_s': 0.25, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < 250: return {'p_s': 0.35, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < 375: return {'p_s': 0.60, 'mu_s': 2.2, 'c_s': 0.14, 'nu_s': 13.0}
-        else:         return {'p_s': 0.40, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}
-    elif station_id == 'S4':
-        # Ph1: Undercut S3 ($0.25) while maintaining profit margin
-        if   t < 125: return {'p_s': 0.20, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        # Ph2: Undercut S3 ($0.35) 
-        elif t < 250: return {'p_s': 0.30, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        # Ph3: S3 is expensive ($0.60). S4 undercuts profitably, NOT at a loss.
-        elif t < 375: return {'p_s': 0.45, 'mu_s': 2.2, 'c_s': 0.12, 'nu_s': 13.0}
-        # Ph4: Match/Slightly undercut S3 ($0.40)
-        else:         return {'p_s': 0.38, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}
-    return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
+        'S3': [{'p_s': 0.25, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.35, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.60, 'mu_s': 2.2, 'c_s': 0.14, 'nu_s': 13.0},
+               {'p_s': 0.40, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}],
+        'S4': [# Ph1: Undercut S3 ($0.25) while maintaining profit margin
+               {'p_s': 0.20, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               # Ph2: Undercut S3 ($0.35)
+               {'p_s': 0.30, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               # Ph3: S3 is expensive ($0.60). S4 undercuts profitably, NOT at a loss.
+               {'p_s': 0.45, 'mu_s': 2.2, 'c_s': 0.12, 'nu_s': 13.0},
+               # Ph4: Match/Slightly undercut S3 ($0.40)
+               {'p_s': 0.38, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}],
+    },
+    'default': {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+}
+SCHEDULE = compile_schedule(PRICING_SCHEDULE)
+
+
+def get_station_parameters(t, station_id):
+    """Station parameters at time t (scalar or array)"""
+    return station_parameters(SCHEDULE, t, station_id)
 
 
 # ──────────────────────────────────────────────────────
@@ -165,45 +186,14 @@ def create_network():
 # ──────────────────────────────────────────────────────
 #  PATH ENUMERATION
 # ──────────────────────────────────────────────────────
-def enumerate_paths(G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx):
-    paths_EV  = {}
-    paths_NEV = {}
-
-    for o_idx in origins:
-        u_o, v_o, k_o = idx_to_edge[o_idx]
-        start = u_o   # origin node (O1 or O2, since it is a self-loop u==v)
-
-        for d_idx in destinations:
-            u_d, v_d, k_d = idx_to_edge[d_idx]
-            end = u_d   # destination node
-
-            od = (o_idx, d_idx)
-            mixed, charging = [], []
-
-            if nx.has_path(G, start, end):
-                for path_edges in nx.all_simple_edge_paths(G, start, end):
-                    # skip paths that accidentally pass through self-loop edges
-                    if any(G[u][v][k].get('is_origin') or G[u][v][k].get('is_destination')
-                           for u, v, k in path_edges):
-                        continue
-
-                    path_ids = ([o_idx]
-                                + [edge_to_idx[(u,v,k)] for u,v,k in path_edges]
-                                + [d_idx])
-
-                    ev_cnt = sum(1 for lid in path_ids
-                                 if G[idx_to_edge[lid][0]][idx_to_edge[lid][1]]
-                                     [idx_to_edge[lid][2]].get('link_type') == 'EV-only')
-
-                    if ev_cnt == 0:
-                        mixed.append(path_ids)
-                    elif ev_cnt == 1:
-                        charging.append(path_ids)
-
-            paths_NEV[od] = mixed
-            paths_EV[od]  = mixed + charging if charging else mixed
-
-    return paths_EV, paths_NEV
+def enumerate_paths(G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx,
+                    k=None, max_cost=None):
+    """EV / NEV paths per OD pair via ev_paths.generate_paths(): every simple
+    path by default, or the k cheapest per class within max_cost (defaults
+    PATH_K / PATH_MAX_COST); charging paths never take a second station"""
+    k = PATH_K if k is None else k
+    max_cost = PATH_MAX_COST if max_cost is None else max_cost
+    return generate_paths(G, origins, destinations, idx_to_edge, edge_to_idx, k, max_cost)
 
 
 # ──────────────────────────────────────────────────────
@@ -254,150 +244,189 @@ def latency_fn(x, is_charging=False):
 
 
 # ──────────────────────────────────────────────────────
-#  ROUTING MATRIX  (paper eq. 5)
+#  COUPLED ODE
 # ──────────────────────────────────────────────────────
-def compute_routing_matrix(y_EV, y_NEV,
-                            paths_EV, paths_NEV,
-                            od_pairs_EV, od_pairs_NEV,
-                            n_links):
-    pair_demand = {}   # (j, i) -> total demanded flow on transition j->i
+def coupled_dynamics(t, state, params):
+    n_links = params['n_links']
+    links   = params['links']
+    model   = params['model']
 
-    def accumulate(od_pairs, paths_dict, y_vec):
-        p_idx = 0
-        for od in od_pairs:
-            for path in paths_dict[od]:
-                yp = float(y_vec[p_idx])
-                for step in range(len(path) - 1):
-                    j, i = path[step], path[step+1]
-                    pair_demand[(j,i)] = pair_demand.get((j,i), 0.0) + yp
-                p_idx += 1
+    x = state[:n_links]
+    y = state[n_links:]          # EV path flows, then NEV path flows
 
-    accumulate(od_pairs_EV,  paths_EV,  y_EV)
-    accumulate(od_pairs_NEV, paths_NEV, y_NEV)
+    st = schedule_at(params['schedule'], t)
 
-    succ_sum = {}
-    for (j, i), d in pair_demand.items():
-        succ_sum[j] = succ_sum.get(j, 0.0) + d
+    # outflows and link density: dx/dt = (R^T - I) f
+    f     = link_outflows(links, model, x, st)
+    dx_dt = routing_inflow(params['routing'], y, f) - f
 
-    R = np.zeros((n_links, n_links))
-    for (j, i), d in pair_demand.items():
-        denom = succ_sum.get(j, 0.0)
-        if denom > 1e-12:
-            R[j, i] = d / denom
-        else:
-            succs = [ii for (jj,ii) in pair_demand if jj == j]
-            R[j, i] = 1.0 / max(len(succs), 1)
+    # replicator over all EV and NEV paths
+    c_EV, c_NEV = link_costs(links, model, x, st)
+    tau   = path_costs(params['paths'], c_EV, c_NEV)
+    dy_dt = replicator(params['paths'], model, y, tau)
 
-    return R
+    return np.concatenate([dx_dt, dy_dt])
 
 
-# ──────────────────────────────────────────────────────
-#  PATH COSTS
-# ──────────────────────────────────────────────────────
-def compute_path_costs(x, paths_dict, od_pairs, idx_to_edge, G, t, vcls='EV'):
-    costs = []
-    for od in od_pairs:
-        for path in paths_dict[od]:
-            cost = 0.0
-            for lid in path:
-                u, v, k = idx_to_edge[lid]
-                d  = G[u][v][k]
-                lt = d.get('link_type', 'mixed')
-                if lt in ('origin','destination'):
-                    continue
-                elif lt == 'EV-only' and vcls == 'EV':
-                    sid = d['station_id']
-                    sp  = get_station_parameters(t, sid)
-                    xi  = x[lid]
-                    svc = outflow_fn(xi, mu=sp['mu_s'], nu=sp['nu_s'], is_charging=True)
-                    wt  = xi / max(sp['mu_s'], 1e-9)  # paper eq(20): w = x_is/mu_s
-                    cost += latency_fn(xi, True) + alpha * wt + gamma * sp['p_s']
-                else:
-                    cost += latency_fn(x[lid])
-            costs.append(cost)
-    return np.array(costs)
+def coupled_jacobian(t, state, params):
+    """Analytic Jacobian of coupled_dynamics, handed to Radau."""
+    n_links = params['n_links']
+    st = schedule_at(params['schedule'], t)
+    return jacobian(params['routing'], params['links'], params['paths'],
+                    params['model'], st, state[:n_links], state[n_links:])
 
 
-# ──────────────────────────────────────────────────────
-#  COUPLED ODE
-# ──────────────────────────────────────────────────────
-def coupled_dynamics(t, state, params):
-    n_links    = params['n_links']
-    n_pEV      = params['n_paths_EV']
-    G          = params['G']
-    idx_to_edge= params['idx_to_edge']
-
-    x     = state[:n_links]
-    y_EV  = state[n_links:n_links + n_pEV]
-    y_NEV = state[n_links + n_pEV:]
-
-    # outflows
-    f = np.zeros(n_links)
-    for i in range(n_links):
-        u, v, k = idx_to_edge[i]
-        d  = G[u][v][k]
-        lt = d.get('link_type','mixed')
-        if lt == 'origin':
-            f[i] = params['lambda_origin'][i]
-        elif lt == 'EV-only':
-            sp   = get_station_parameters(t, d['station_id'])
-            f[i] = outflow_fn(x[i], mu=sp['mu_s'], nu=sp['nu_s'], is_charging=True)
-        else:
-            f[i] = outflow_fn(x[i])
-
-    # routing matrix
-    R = compute_routing_matrix(y_EV, y_NEV,
-                               params['paths_EV'], params['paths_NEV'],
-                               params['od_pairs_EV'], params['od_pairs_NEV'],
-                               n_links)
-
-    # link density: dx/dt = (R^T - I) f
-    dx_dt = R.T @ f - f
-
-    # replicator - EV
-    tau_EV   = compute_path_costs(x, params['paths_EV'], params['od_pairs_EV'],
-                                  idx_to_edge, G, t, 'EV')
-    dy_EV_dt = np.zeros(n_pEV)
-    idx = 0
-    for od in params['od_pairs_EV']:
-        np_od  = len(params['paths_EV'][od])
-        lam    = params['lambda_od_EV'][od]
-        y_od   = np.maximum(y_EV[idx:idx+np_od], 1e-9)
-        total  = y_od.sum()
-        y_od   = y_od*(lam/total) if total>1e-12 else np.full(np_od, lam/np_od)
-        if lam > 1e-9:
-            tau_od  = tau_EV[idx:idx+np_od]
-            tau_avg = (y_od * tau_od).sum() / lam
-            for ii in range(np_od):
-                dy_EV_dt[idx+ii] = k_rep * eta_EV * y_od[ii] * (tau_avg - tau_od[ii])
-        idx += np_od
+def coupled_gap(t, state, params):
+    """Relative equilibrium gap of the path flows at (t, state)."""
+    n_links = params['n_links']
+    st = schedule_at(params['schedule'], t)
+    c_EV, c_NEV = link_costs(params['links'], params['model'], state[:n_links], st)
+    tau = path_costs(params['paths'], c_EV, c_NEV)
+    return equilibrium_gap(params['paths'], params['model'], state[n_links:], tau)
 
-    # replicator - NEV
-    tau_NEV   = compute_path_costs(x, params['paths_NEV'], params['od_pairs_NEV'],
-                                   idx_to_edge, G, t, 'NEV')
-    n_pNEV    = params['n_paths_NEV']
-    dy_NEV_dt = np.zeros(n_pNEV)
-    idx = 0
-    for od in params['od_pairs_NEV']:
-        np_od  = len(params['paths_NEV'][od])
-        lam    = params['lambda_od_NEV'][od]
-        y_od   = np.maximum(y_NEV[idx:idx+np_od], 1e-9)
-        total  = y_od.sum()
-        y_od   = y_od*(lam/total) if total>1e-12 else np.full(np_od, lam/np_od)
-        if lam > 1e-9:
-            tau_od  = tau_NEV[idx:idx+np_od]
-            tau_avg = (y_od * tau_od).sum() / lam
-            for ii in range(np_od):
-                dy_NEV_dt[idx+ii] = k_rep * eta_NEV * y_od[ii] * (tau_avg - tau_od[ii])
-        idx += np_od
 
-    return np.concatenate([dx_dt, dy_EV_dt, dy_NEV_dt])
+# ──────────────────────────────────────────────────────
+#  COLUMN GENERATION
+# ──────────────────────────────────────────────────────
+def path_layout(params):
+    """(class, od, path) of every path flow, in state order."""
+    return ([('EV', od, tuple(p)) for od in params['od_pairs_EV']
+             for p in params['paths_EV'][od]] +
+            [('NEV', od, tuple(p)) for od in params['od_pairs_NEV']
+             for p in params['paths_NEV'][od]])
+
+
+def compile_path_set(params):
+    """Recompile routing and path incidences after the path set changed."""
+    n_links = params['n_links']
+    sets = (params['paths_EV'], params['paths_NEV'],
+            params['od_pairs_EV'], params['od_pairs_NEV'])
+    params['routing'] = compile_routing(*sets, n_links)
+    params['paths'] = compile_paths(*sets, params['lambda_od_EV'],
+                                    params['lambda_od_NEV'], n_links)
+    params['n_paths_EV'] = params['paths']['n_paths_EV']
+    params['n_paths_NEV'] = params['paths']['n_paths_NEV']
+
+
+def relayout(y, old, new):
+    """Path flows ``y`` in layout ``old`` moved to layout ``new``; paths
+    missing from ``old`` carry no flow (y may have a time axis)."""
+    pos = {key: i for i, key in enumerate(new)}
+    out = np.zeros((len(new),) + y.shape[1:])
+    out[[pos[key] for key in old]] = y
+    return out
+
+
+def add_columns(t, state, params):
+    """Add the cheapest path of every OD pair and class (for EVs: the best
+    mixed and the best one-stop path) under the link costs at (t, state)
+    when it undercuts the current OD average cost.
+
+    Returns the state in the new layout and the number of paths added;
+    each new path is seeded with COLUMN_SEED of its OD demand, taken
+    proportionally from the paths already in use.
+    """
+    n_links = params['n_links']
+    x, y = state[:n_links], state[n_links:]
+    st = schedule_at(params['schedule'], t)
+    c_EV, c_NEV = link_costs(params['links'], params['model'], x, st)
+    groups = params['paths']['groups']
+    tau = path_costs(params['paths'], c_EV, c_NEV)
+    y_pos = np.maximum(y, 0.0)
+    tau_avg = (groups.T @ (y_pos * tau)) / np.maximum(groups.T @ y_pos, 1e-300)
+
+    G, idx_to_edge, edge_to_idx = params['G'], params['idx_to_edge'], params['edge_to_idx']
+    old = path_layout(params)
+    added, g = 0, 0
+    for c, od_pairs, paths_dict, kinds in (
+            (c_EV, params['od_pairs_EV'], params['paths_EV'], (False, True)),
+            (c_NEV, params['od_pairs_NEV'], params['paths_NEV'], (False,))):
+        H = charging_layers(G, {e: c[i] for i, e in enumerate(idx_to_edge)})
+        for od in od_pairs:
+            start, end = idx_to_edge[od[0]][0], idx_to_edge[od[1]][0]
+            for charging in kinds:
+                best = cheapest_path(H, start, end, charging)
+                if best is None:
+                    continue
+                path = [od[0]] + [edge_to_idx[e] for e in best[1]] + [od[1]]
+                if best[0] < tau_avg[g] - COLUMN_TOL and path not in paths_dict[od]:
+                    paths_dict[od].append(path)
+                    added += 1
+            g += 1
+
+    if not added:
+        return state, 0
+    compile_path_set(params)
+    new = path_layout(params)
+    y = relayout(y, old, new)
+    fresh = np.ones(len(new), dtype=bool)
+    fresh[[new.index(key) for key in old]] = False
+    paths = params['paths']
+    lam, od = paths['lam'], paths['od_of']
+    seed = np.where(fresh, COLUMN_SEED * lam[od], 0.0)
+    kept = paths['groups'].T @ np.where(fresh, 0.0, y)
+    scale = (lam - paths['groups'].T @ seed) / np.maximum(kept, 1e-300)
+    y = np.where(fresh, seed, y * scale[od])
+    return np.concatenate([x, y]), added
+
+
+def integrate_columns(fun, params, t_eval, state0, edges, solver_kw, restart=None,
+                      converged=None, every=None):
+    """integrate_phases() one checkpoint interval at a time, calling
+    add_columns() at every inner phase edge and, with ``every``, every
+    ``every`` seconds in between.  ``restart`` still only runs at phase
+    edges; ``solver_kw()`` gives the solve_ivp keywords for the current
+    path set.  The trajectory comes back in the final layout, with zero
+    flow on a path before it was added."""
+    n_links = params['n_links']
+    res = OptimizeResult(success=True, message='', nfev=0, njev=0, nlu=0,
+                         segments=[], settled=[], ends=[], added=[])
+    checks = list(edges)
+    if every:
+        checks = sorted(set(checks) | set(np.arange(edges[0], edges[-1], every)[1:].tolist()))
+    parts = []
+    state = np.asarray(state0, dtype=float)
+    for k in range(len(checks) - 1):
+        t0, t1 = checks[k], checks[k + 1]
+        added = 0
+        if k > 0:
+            state, added = add_columns(t0, state, params)
+        last = k == len(checks) - 2
+        keep = t_eval[(t_eval >= t0) & ((t_eval <= t1) if last else (t_eval < t1))]
+        sol = integrate_phases(fun, keep, state, [t0, t1],
+                               restart=restart if t0 in edges else None,
+                               converged=converged, **solver_kw())
+        layout = path_layout(params)
+        parts.append((layout, sol))
+        for key in ('nfev', 'njev', 'nlu'):
+            res[key] += sol[key]
+        res.segments += sol.segments
+        res.settled += sol.settled
+        res.added.append(added)
+        res.message = sol.message
+        state = sol.ends[-1] if sol.ends else state
+        if not sol.success:
+            res.success = False
+            break
+
+    final = path_layout(params)
+    res.t = np.concatenate([sol.t for _, sol in parts])
+    res.y = np.concatenate([np.vstack([sol.y[:n_links],
+                                       relayout(sol.y[n_links:], layout, final)])
+                            for layout, sol in parts], axis=1)
+    res.ends = [np.concatenate([e[:n_links], relayout(e[n_links:], layout, final)])
+                for layout, sol in parts for e in sol.ends]
+    return res
 
 
 # ──────────────────────────────────────────────────────
 #  MAIN SIMULATION RUNNER
 # ──────────────────────────────────────────────────────
-def run_simulation():
+def run_simulation(jacobian=None, converge_tol=None, mode='dynamic', columns=None):
+    """mode='equilibrium' skips the transient and returns the steady state
+    of every pricing phase ({'mode', 'success', 'phases'}) instead of plotting.
+    columns=True (default COLUMN_GENERATION) starts the dynamic run from the
+    cheapest path per OD pair and class and adds paths at phase edges."""
     print("\n" + "="*70)
     print("EV CHARGING STATION COMPETITION SIMULATION  [FULLY FIXED]")
     print("="*70)
@@ -410,8 +439,14 @@ def run_simulation():
         assert G[u][v][k]['link_id'] == i, f"link_id mismatch at index {i}"
     print("CHECK: link_id == enum_idx  PASSED")
 
+    use_columns = (COLUMN_GENERATION if columns is None else columns) and mode == 'dynamic'
     paths_EV, paths_NEV = enumerate_paths(
-        G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx)
+        G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx,
+        k=1 if use_columns else None)
+    if use_columns:
+        # the path lists grow per class, so they must not be shared
+        paths_EV = {od: list(p) for od, p in paths_EV.items()}
+        paths_NEV = {od: list(p) for od, p in paths_NEV.items()}
     lambda_EV, lambda_NEV = create_od_demand(
         G, origins, destinations, idx_to_edge)
 
@@ -471,6 +506,8 @@ def run_simulation():
         lambda_origin[o_idx] = lam
     print(f"Origin outflows: { {i:lambda_origin[i] for i in origins} }")
 
+    links = compile_links(G, idx_to_edge, lambda_origin)
+
     params = dict(
         n_links=n_links, n_paths_EV=n_paths_EV, n_paths_NEV=n_paths_NEV,
         paths_EV=paths_EV, paths_NEV=paths_NEV,
@@ -478,7 +515,15 @@ def run_simulation():
         lambda_od_EV=lambda_EV, lambda_od_NEV=lambda_NEV,
         lambda_origin=lambda_origin,
         charging_stations=charging_stations,
-        G=G, idx_to_edge=idx_to_edge,
+        G=G, idx_to_edge=idx_to_edge, edge_to_idx=edge_to_idx,
+        routing=compile_routing(paths_EV, paths_NEV,
+                                od_pairs_EV, od_pairs_NEV, n_links),
+        links=links,
+        schedule=compile_schedule(PRICING_SCHEDULE, links['station_ids']),
+        paths=compile_paths(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                            lambda_EV, lambda_NEV, n_links),
+        model=kernel_model(LINK_CAP, LINK_STEEP, alpha, gamma,
+                           k_rep * eta_EV, k_rep * eta_NEV),
     )
 
     # Segmented integration
@@ -510,61 +555,80 @@ def run_simulation():
         yNEV = floor_reset(yNEV, od_pairs_NEV, paths_NEV, lambda_NEV)
         return np.concatenate([x_s, yEV, yNEV])
 
-    phase_bounds  = [0, 125, 250, 375, T_FINAL]
-    t_all = x_all = y_EV_all = y_NEV_all = None
-    current_state = state0.copy()
+    def solver_kw():
+        # rebuilt per call: column generation changes the path set
+        return dict(method='Radau', rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP,
+                    **solver_jacobian(jacobian or JACOBIAN, params['routing'], params['paths'],
+                                      lambda t, s: coupled_jacobian(t, s, params)))
 
-    for ph in range(len(phase_bounds) - 1):
-        t0, t1 = phase_bounds[ph], phase_bounds[ph+1]
-        n_pts  = max(50, int(N_TIME_POINTS * (t1-t0) / T_FINAL))
-        t_eval = np.linspace(t0, t1, n_pts)
+    # Phase boundaries come from the schedule breakpoints; each phase
+    # restarts from the exploration floor
+    phase_bounds = phase_edges(params['schedule'], T_FINAL)
+    t_eval = np.linspace(0, T_FINAL, N_TIME_POINTS)
 
-        # Reinitialize with exploration floor at each phase transition
-        current_state = apply_exploration_floor(
-            current_state, od_pairs_EV, od_pairs_NEV,
+    def restart(t0, state):
+        return apply_exploration_floor(
+            state, od_pairs_EV, od_pairs_NEV,
             paths_EV, paths_NEV, lambda_EV, lambda_NEV,
-            n_links, n_paths_EV)
-
-        print(f"  Phase {ph+1}: t in [{t0}, {t1}]", end='', flush=True)
-        sol = solve_ivp(lambda t, s: coupled_dynamics(t, s, params),
-                        [t0, t1], current_state,
-                        method='Radau', t_eval=t_eval,
-                        rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
-        ok = "OK" if sol.success else f"WARN: {sol.message}"
-        print(f"  {ok}  ({len(sol.t)} pts)")
-
-        # Clip x >= 0 in output (physical constraint)
-        sol.y[:n_links, :] = np.maximum(sol.y[:n_links, :], 0.0)
-
-        xp    = sol.y[:n_links, :]
-        yEVp  = sol.y[n_links:n_links+n_paths_EV, :]
-        yNEVp = sol.y[n_links+n_paths_EV:, :]
-
-        if ph == 0:
-            t_all, x_all, y_EV_all, y_NEV_all = sol.t, xp, yEVp, yNEVp
-        else:
-            t_all     = np.concatenate([t_all,     sol.t[1:]])
-            x_all     = np.concatenate([x_all,     xp[:,    1:]], axis=1)
-            y_EV_all  = np.concatenate([y_EV_all,  yEVp[:,  1:]], axis=1)
-            y_NEV_all = np.concatenate([y_NEV_all, yNEVp[:, 1:]], axis=1)
-
-        current_state = sol.y[:, -1]
-        current_state[:n_links] = np.maximum(current_state[:n_links], 0.0)
+            n_links, params['n_paths_EV'])
+
+    if mode == 'equilibrium':
+        phases = phase_equilibria(params['routing'], links, params['paths'],
+                                  params['model'],
+                                  lambda t: schedule_at(params['schedule'], t),
+                                  phase_bounds, state0, restart=restart)
+        print(equilibrium_table(phases, links))
+        return {'mode': 'equilibrium',
+                'success': all(ph['success'] for ph in phases),
+                'phases': summarise_equilibria(phases, links, n_paths_EV)}
+
+    fun = lambda t, s: coupled_dynamics(t, s, params)
+    tol = converge_tol if converge_tol is not None else CONVERGE_TOL
+    converged = None
+    if tol is not None:
+        watch = np.setdiff1d(np.arange(n_links), links['origin'])
+        converged = convergence_event(fun, lambda t, s: coupled_gap(t, s, params),
+                                      watch, tol)
+
+    if use_columns:
+        sol = integrate_columns(fun, params, t_eval, state0, phase_bounds, solver_kw,
+                                restart=restart, converged=converged, every=COLUMN_EVERY)
+        n_paths_EV, n_paths_NEV = params['n_paths_EV'], params['n_paths_NEV']
+        print(f"Column generation: {sum(sol.added)} paths added over {len(sol.added) - 1} "
+              f"checkpoints, state dim now {n_links + n_paths_EV + n_paths_NEV}")
+    else:
+        sol = integrate_phases(fun, t_eval, state0, phase_bounds, restart=restart,
+                               converged=converged, **solver_kw())
+    # One line per pricing phase; with columns its checkpoint intervals are grouped
+    for ph, (p0, p1) in enumerate(zip(phase_bounds[:-1], phase_bounds[1:])):
+        inside = [k for k, (t0, t1, _) in enumerate(sol.segments) if p0 <= t0 and t1 <= p1]
+        if not inside:
+            print(f"  Phase {ph+1}: t in [{p0}, {p1}]  not reached")
+            continue
+        ok = all(sol.segments[k][2] for k in inside)
+        settled = [sol.settled[k] for k in inside
+                   if k < len(sol.settled) and sol.settled[k] is not None]
+        note = f"  settled at t={', '.join(f'{ts:.1f}' for ts in settled)}" if settled else ""
+        parts = f" ({len(inside)} checkpoint intervals)" if len(inside) > 1 else ""
+        print(f"  Phase {ph+1}: t in [{p0}, {p1}]{parts}  "
+              f"{'OK' if ok else 'WARN: ' + sol.message}{note}")
+
+    # Clip x >= 0 in output (physical constraint)
+    sol.y[:n_links, :] = np.maximum(sol.y[:n_links, :], 0.0)
+
+    t_all     = sol.t
+    x_all     = sol.y[:n_links, :]
+    y_EV_all  = sol.y[n_links:n_links+n_paths_EV, :]
+    y_NEV_all = sol.y[n_links+n_paths_EV:, :]
 
     print(f"Total trajectory: {len(t_all)} pts")
 
     # Station metrics
     q_s, p_s = {}, {}
     for sid, lid in charging_stations.items():
-        q_s[sid] = np.array([
-            outflow_fn(x_all[lid, i],
-                       mu=get_station_parameters(t_all[i], sid)['mu_s'],
-                       nu=get_station_parameters(t_all[i], sid)['nu_s'],
-                       is_charging=True)
-            for i in range(len(t_all))])
-        p_s[sid] = np.array([
-            get_station_parameters(t_all[i], sid)['p_s']
-            for i in range(len(t_all))])
+        sp       = get_station_parameters(t_all, sid)
+        q_s[sid] = charging_outflow(params['model'], x_all[lid], sp['mu_s'], sp['nu_s'])
+        p_s[sid] = sp['p_s']
 
     # Print quick station summary
     print("\nStation queue means per phase:")
@@ -1134,7 +1198,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
         for _,ts,te in phases:
             mask=(t>=ts)&(t<=te); tp=t[mask]
             if len(tp)>1:
-                cs = np.array([get_station_parameters(ti,sid)['c_s'] for ti in tp])
+                cs = get_station_parameters(tp, sid)['c_s']
                 profits.append(
                     np.trapezoid((p_s_traj[sid][mask]-cs)*q_s_traj[sid][mask],tp))
             else:
@@ -2,12 +2,25 @@
 EV Charging Station Competition Simulation - TC9 (9-node, 4-station network)
 Web-compatible version for server deployment
 """
-import networkx as nx
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import matplotlib.animation as animation
-from scipy.integrate import solve_ivp
+from ev_engine import (compile_routing, routing_inflow, compile_links,
+                       compile_paths, kernel_model, charging_outflow,
+                       link_outflows, link_costs, path_costs, replicator,
+                       jacobian, solver_jacobian, integrate_phases,
+                       equilibrium_gap, convergence_event, phase_equilibria,
+                       summarise_equilibria, equilibrium_table,
+                       compile_ensemble, ensemble_rhs, ensemble_jacobian,
+                       phase_snapshots, progress_rhs, save_solution,
+                       load_solution, json_ready)
+from ev_pricing import (load_schedule, compile_schedule, station_parameters,
+                        schedule_at, schedules_at, phase_edges)
+from ev_paths import generate_paths
+from ev_cache import cached_scenario
+from ev_destination import (compile_destinations, initial_splits,
+                            destination_dynamics, destination_gap,
+                            destination_snapshots, summarise_destinations)
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -28,38 +41,62 @@ N_TIME_POINTS = 400
 SOLVER_RTOL = 1e-4
 SOLVER_ATOL = 1e-6
 MAX_STEP = 5.0
+JACOBIAN = 'analytic'  # 'analytic' | 'sparsity' | 'fd'
+CONVERGE_TOL = None    # e.g. 1e-3: hold the steady state once a phase settles
+PATH_K = None          # k cheapest paths per OD pair and class; None = all
+PATH_MAX_COST = None   # drop paths dearer than this free-flow cost
+SCENARIO_CACHE = True  # load compiled scenarios from disk (ev_cache)
 
 
 # ──────────────────────────────────────────────────────
 #  PIECEWISE PRICING
 # ──────────────────────────────────────────────────────
+PRICING_SCHEDULE = {
+    'breakpoints': [125.0, 250.0, 375.0],
+    'horizon': 500.0,   # phase boundaries are scaled to the simulation duration
+    'stations': {
+        'S1': [{'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.65, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 12.0},
+               {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.15, 'nu_s': 15.0}],
+        'S2': [{'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.70, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0},
+               {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.12, 'nu_s': 10.0},
+               {'p_s': 0.45, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 13.0}],
+        'S3': [{'p_s': 0.25, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.35, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.60, 'mu_s': 2.2, 'c_s': 0.14, 'nu_s': 13.0},
+               {'p_s': 0.40, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}],
+        'S4': [{'p_s': 0.20, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.30, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0},
+               {'p_s': 0.45, 'mu_s': 2.2, 'c_s': 0.12, 'nu_s': 13.0},
+               {'p_s': 0.38, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}],
+    },
+    'default': {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0},
+}
+
+_compiled_schedules = {}
+
+
+def pricing_schedule(t_final=500.0, schedule=None, station_ids=None):
+    """Compiled schedule with phase boundaries scaled to t_final
+
+    ``schedule`` may be a schedule dict or JSON path (see ev_pricing);
+    the built-in PRICING_SCHEDULE is used when it is None.
+    """
+    if schedule is None and station_ids is None and t_final in _compiled_schedules:
+        return _compiled_schedules[t_final]
+    spec = PRICING_SCHEDULE if schedule is None else load_schedule(schedule)
+    sched = compile_schedule(spec, station_ids,
+                             scale=t_final / spec.get('horizon', t_final))
+    if schedule is None and station_ids is None:
+        _compiled_schedules[t_final] = sched
+    return sched
+
+
 def get_station_parameters(t, station_id, t_final=500.0):
-    """Get station parameters with scaled phase boundaries"""
-    # Scale phase boundaries to simulation duration
-    scale = t_final / 500.0
-    p1, p2, p3 = 125 * scale, 250 * scale, 375 * scale
-    
-    if station_id == 'S1':
-        if   t < p1: return {'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < p2: return {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < p3: return {'p_s': 0.65, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 12.0}
-        else:        return {'p_s': 0.45, 'mu_s': 2.5, 'c_s': 0.15, 'nu_s': 15.0}
-    elif station_id == 'S2':
-        if   t < p1: return {'p_s': 0.55, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < p2: return {'p_s': 0.70, 'mu_s': 1.2, 'c_s': 0.10, 'nu_s':  8.0}
-        elif t < p3: return {'p_s': 0.15, 'mu_s': 1.5, 'c_s': 0.12, 'nu_s': 10.0}
-        else:        return {'p_s': 0.45, 'mu_s': 2.0, 'c_s': 0.15, 'nu_s': 13.0}
-    elif station_id == 'S3':
-        if   t < p1: return {'p_s': 0.25, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < p2: return {'p_s': 0.35, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < p3: return {'p_s': 0.60, 'mu_s': 2.2, 'c_s': 0.14, 'nu_s': 13.0}
-        else:        return {'p_s': 0.40, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}
-    elif station_id == 'S4':
-        if   t < p1: return {'p_s': 0.20, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < p2: return {'p_s': 0.30, 'mu_s': 1.8, 'c_s': 0.10, 'nu_s': 10.0}
-        elif t < p3: return {'p_s': 0.45, 'mu_s': 2.2, 'c_s': 0.12, 'nu_s': 13.0}
-        else:        return {'p_s': 0.38, 'mu_s': 2.5, 'c_s': 0.14, 'nu_s': 15.0}
-    return {'p_s': 0.5, 'mu_s': 1.5, 'c_s': 0.1, 'nu_s': 10.0}
+    """Get station parameters with scaled phase boundaries (t scalar or array)"""
+    return station_parameters(pricing_schedule(t_final), t, station_id)
 
 
 # ──────────────────────────────────────────────────────
@@ -71,6 +108,8 @@ def create_network():
     - O1 -> V2 -> D1 (via S1) or O1 -> V1 -> D1 (via S2)
     - O2 -> V3 -> D2/D3 (via S3) or O2 -> V4 -> D3 (via S4)
     """
+    import networkx as nx
+
     G = nx.MultiDiGraph()
 
     for n in ['O1','O2','V1','V2','V3','V4','D1','D2','D3']:
@@ -143,50 +182,36 @@ def create_network():
 # ──────────────────────────────────────────────────────
 #  PATH ENUMERATION
 # ──────────────────────────────────────────────────────
-def enumerate_paths(G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx):
-    paths_EV = {}
-    paths_NEV = {}
-
-    for o_idx in origins:
-        u_o, v_o, k_o = idx_to_edge[o_idx]
-        start = u_o
-
-        for d_idx in destinations:
-            u_d, v_d, k_d = idx_to_edge[d_idx]
-            end = u_d
-
-            od = (o_idx, d_idx)
-            mixed, charging = [], []
-
-            if nx.has_path(G, start, end):
-                for path_edges in nx.all_simple_edge_paths(G, start, end):
-                    if any(G[u][v][k].get('is_origin') or G[u][v][k].get('is_destination')
-                           for u, v, k in path_edges):
-                        continue
-
-                    path_ids = ([o_idx]
-                                + [edge_to_idx[(u,v,k)] for u,v,k in path_edges]
-                                + [d_idx])
+def enumerate_paths(G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx,
+                    k=None, max_cost=None):
+    """EV / NEV paths per OD pair via ev_paths.generate_paths(): every simple
+    path by default, or the k cheapest per class within max_cost (defaults
+    PATH_K / PATH_MAX_COST); charging paths never take a second station"""
+    k = PATH_K if k is None else k
+    max_cost = PATH_MAX_COST if max_cost is None else max_cost
+    return generate_paths(G, origins, destinations, idx_to_edge, edge_to_idx, k, max_cost)
 
-                    ev_cnt = sum(1 for lid in path_ids
-                                 if G[idx_to_edge[lid][0]][idx_to_edge[lid][1]]
-                                     [idx_to_edge[lid][2]].get('link_type') == 'EV-only')
 
-                    if ev_cnt == 0:
-                        mixed.append(path_ids)
-                    elif ev_cnt == 1:
-                        charging.append(path_ids)
+# ──────────────────────────────────────────────────────
+#  OD DEMAND
+# ──────────────────────────────────────────────────────
+DEMAND_SCENARIO = {
+    'O1': {'total_flow': 1.0, 'beta_EV': 0.6, 'destinations': {'D1': 1.0}},
+    'O2': {'total_flow': 1.2, 'beta_EV': 0.5, 'destinations': {'D2': 0.5, 'D3': 0.5}},
+}
 
-            paths_NEV[od] = mixed
-            paths_EV[od] = mixed + charging if charging else mixed
 
-    return paths_EV, paths_NEV
+def demand_scenario(overrides=None):
+    """DEMAND_SCENARIO with per-origin overrides, e.g. {'O1': {'beta_EV': 0.7}}"""
+    overrides = overrides or {}
+    unknown = set(overrides) - set(DEMAND_SCENARIO)
+    if unknown:
+        raise ValueError(f"unknown origins in demand overrides: {sorted(unknown)}")
+    return {oname: dict(cfg, **overrides.get(oname, {}))
+            for oname, cfg in DEMAND_SCENARIO.items()}
 
 
-# ──────────────────────────────────────────────────────
-#  OD DEMAND
-# ──────────────────────────────────────────────────────
-def create_od_demand(G, origins, destinations, idx_to_edge):
+def create_od_demand(G, origins, destinations, idx_to_edge, scenario=None):
     origin_name_to_idx = {}
     dest_name_to_idx = {}
     for i, (u, v, k) in enumerate(idx_to_edge):
@@ -196,10 +221,8 @@ def create_od_demand(G, origins, destinations, idx_to_edge):
         if d.get('is_destination'):
             dest_name_to_idx[d['dest_id']] = i
 
-    scenario = {
-        'O1': {'total_flow': 1.0, 'beta_EV': 0.6, 'destinations': {'D1': 1.0}},
-        'O2': {'total_flow': 1.2, 'beta_EV': 0.5, 'destinations': {'D2': 0.5, 'D3': 0.5}},
-    }
+    if scenario is None:
+        scenario = DEMAND_SCENARIO
 
     lambda_EV, lambda_NEV = {}, {}
     for oname, cfg in scenario.items():
@@ -231,171 +254,88 @@ def latency_fn(x, is_charging=False):
 
 
 # ──────────────────────────────────────────────────────
-#  ROUTING MATRIX
+#  COUPLED ODE
 # ──────────────────────────────────────────────────────
-def compute_routing_matrix(y_EV, y_NEV, paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV, n_links):
-    pair_demand = {}
-
-    def accumulate(od_pairs, paths_dict, y_vec):
-        p_idx = 0
-        for od in od_pairs:
-            for path in paths_dict[od]:
-                yp = float(y_vec[p_idx])
-                for step in range(len(path) - 1):
-                    j, i = path[step], path[step+1]
-                    pair_demand[(j,i)] = pair_demand.get((j,i), 0.0) + yp
-                p_idx += 1
-
-    accumulate(od_pairs_EV, paths_EV, y_EV)
-    accumulate(od_pairs_NEV, paths_NEV, y_NEV)
+def coupled_dynamics(t, state, params):
+    n_links = params['n_links']
+    links   = params['links']
+    model   = params['model']
 
-    succ_sum = {}
-    for (j, i), d in pair_demand.items():
-        succ_sum[j] = succ_sum.get(j, 0.0) + d
+    x = state[:n_links]
+    y = state[n_links:]          # EV path flows, then NEV path flows
 
-    R = np.zeros((n_links, n_links))
-    for (j, i), d in pair_demand.items():
-        denom = succ_sum.get(j, 0.0)
-        if denom > 1e-12:
-            R[j, i] = d / denom
-        else:
-            succs = [ii for (jj,ii) in pair_demand if jj == j]
-            R[j, i] = 1.0 / max(len(succs), 1)
+    st = schedule_at(params['schedule'], t)
 
-    return R
+    # outflows and link density: dx/dt = (R^T - I) f
+    f     = link_outflows(links, model, x, st)
+    dx_dt = routing_inflow(params['routing'], y, f) - f
 
+    # replicator over all EV and NEV paths
+    c_EV, c_NEV = link_costs(links, model, x, st)
+    tau   = path_costs(params['paths'], c_EV, c_NEV)
+    dy_dt = replicator(params['paths'], model, y, tau)
 
-# ──────────────────────────────────────────────────────
-#  PATH COSTS
-# ──────────────────────────────────────────────────────
-def compute_path_costs(x, paths_dict, od_pairs, idx_to_edge, G, t, t_final, vcls='EV'):
-    costs = []
-    for od in od_pairs:
-        for path in paths_dict[od]:
-            cost = 0.0
-            for lid in path:
-                u, v, k = idx_to_edge[lid]
-                d = G[u][v][k]
-                lt = d.get('link_type', 'mixed')
-                if lt in ('origin', 'destination'):
-                    continue
-                elif lt == 'EV-only' and vcls == 'EV':
-                    sid = d['station_id']
-                    sp = get_station_parameters(t, sid, t_final)
-                    xi = x[lid]
-                    wt = xi / max(sp['mu_s'], 1e-9)
-                    cost += latency_fn(xi, True) + alpha * wt + gamma * sp['p_s']
-                else:
-                    cost += latency_fn(x[lid])
-            costs.append(cost)
-    return np.array(costs)
+    return np.concatenate([dx_dt, dy_dt])
 
 
-# ──────────────────────────────────────────────────────
-#  COUPLED ODE
-# ──────────────────────────────────────────────────────
-def coupled_dynamics(t, state, params):
+def coupled_jacobian(t, state, params):
+    """Analytic Jacobian of coupled_dynamics, handed to Radau."""
     n_links = params['n_links']
-    n_pEV = params['n_paths_EV']
-    G = params['G']
-    idx_to_edge = params['idx_to_edge']
-    t_final = params['t_final']
+    st = schedule_at(params['schedule'], t)
+    return jacobian(params['routing'], params['links'], params['paths'],
+                    params['model'], st, state[:n_links], state[n_links:])
 
-    x = state[:n_links]
-    y_EV = state[n_links:n_links + n_pEV]
-    y_NEV = state[n_links + n_pEV:]
 
-    # outflows
-    f = np.zeros(n_links)
-    for i in range(n_links):
-        u, v, k = idx_to_edge[i]
-        d = G[u][v][k]
-        lt = d.get('link_type', 'mixed')
-        if lt == 'origin':
-            f[i] = params['lambda_origin'][i]
-        elif lt == 'EV-only':
-            sp = get_station_parameters(t, d['station_id'], t_final)
-            f[i] = outflow_fn(x[i], mu=sp['mu_s'], nu=sp['nu_s'], is_charging=True)
-        else:
-            f[i] = outflow_fn(x[i])
-
-    # routing matrix
-    R = compute_routing_matrix(y_EV, y_NEV,
-                               params['paths_EV'], params['paths_NEV'],
-                               params['od_pairs_EV'], params['od_pairs_NEV'],
-                               n_links)
-
-    dx_dt = R.T @ f - f
-
-    # replicator - EV
-    tau_EV = compute_path_costs(x, params['paths_EV'], params['od_pairs_EV'],
-                                idx_to_edge, G, t, t_final, 'EV')
-    dy_EV_dt = np.zeros(n_pEV)
-    idx = 0
-    for od in params['od_pairs_EV']:
-        np_od = len(params['paths_EV'][od])
-        lam = params['lambda_od_EV'][od]
-        y_od = np.maximum(y_EV[idx:idx+np_od], 1e-9)
-        total = y_od.sum()
-        y_od = y_od*(lam/total) if total > 1e-12 else np.full(np_od, lam/np_od)
-        if lam > 1e-9:
-            tau_od = tau_EV[idx:idx+np_od]
-            tau_avg = (y_od * tau_od).sum() / lam
-            for ii in range(np_od):
-                dy_EV_dt[idx+ii] = k_rep * eta_EV * y_od[ii] * (tau_avg - tau_od[ii])
-        idx += np_od
-
-    # replicator - NEV
-    tau_NEV = compute_path_costs(x, params['paths_NEV'], params['od_pairs_NEV'],
-                                 idx_to_edge, G, t, t_final, 'NEV')
-    n_pNEV = params['n_paths_NEV']
-    dy_NEV_dt = np.zeros(n_pNEV)
-    idx = 0
-    for od in params['od_pairs_NEV']:
-        np_od = len(params['paths_NEV'][od])
-        lam = params['lambda_od_NEV'][od]
-        y_od = np.maximum(y_NEV[idx:idx+np_od], 1e-9)
-        total = y_od.sum()
-        y_od = y_od*(lam/total) if total > 1e-12 else np.full(np_od, lam/np_od)
-        if lam > 1e-9:
-            tau_od = tau_NEV[idx:idx+np_od]
-            tau_avg = (y_od * tau_od).sum() / lam
-            for ii in range(np_od):
-                dy_NEV_dt[idx+ii] = k_rep * eta_NEV * y_od[ii] * (tau_avg - tau_od[ii])
-        idx += np_od
-
-    return np.concatenate([dx_dt, dy_EV_dt, dy_NEV_dt])
+def coupled_gap(t, state, params):
+    """Relative equilibrium gap of the path flows at (t, state)."""
+    n_links = params['n_links']
+    st = schedule_at(params['schedule'], t)
+    c_EV, c_NEV = link_costs(params['links'], params['model'], state[:n_links], st)
+    tau = path_costs(params['paths'], c_EV, c_NEV)
+    return equilibrium_gap(params['paths'], params['model'], state[n_links:], tau)
 
 
 # ──────────────────────────────────────────────────────
-#  MAIN SIMULATION RUNNER
+#  SCENARIO SETUP
 # ──────────────────────────────────────────────────────
-def run_simulation(save_animation_path=None, t_final=None, n_points=None, return_data=False):
-    """Main simulation runner for web deployment
-    
-    Args:
-        save_animation_path: Path to save animation GIF
-        t_final: Simulation duration (default: T_FINAL)
-        n_points: Number of time points (default: N_TIME_POINTS)
-        return_data: If True, returns network data for interactive visualization
+def compile_network(k=None, max_cost=None):
+    """Network and enumerated paths: the demand- and price-independent part
+    of a scenario, built once and shared by sweeps (k, max_cost: see
+    enumerate_paths)."""
+    k = PATH_K if k is None else k
+    max_cost = PATH_MAX_COST if max_cost is None else max_cost
+    (G, origins, destinations, charging_stations,
+     idx_to_edge, edge_to_idx) = create_network()
+    paths_EV, paths_NEV = enumerate_paths(
+        G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx,
+        k, max_cost)
+    return dict(G=G, origins=origins, destinations=destinations,
+                charging_stations=charging_stations, idx_to_edge=idx_to_edge,
+                edge_to_idx=edge_to_idx, paths_EV=paths_EV, paths_NEV=paths_NEV,
+                k=k, max_cost=max_cost)
+
+
+def compile_scenario(t_final=None, schedule=None, demand=None, network=None):
+    """Network, paths, demand and compiled kernels of one run
+
+    Returns the params dict coupled_dynamics() expects, plus 'state0'
+    (uniform split of every OD demand, empty links) and the raw network
+    objects. ``demand`` holds per-origin overrides of DEMAND_SCENARIO;
+    ``network`` is a compile_network() result to reuse.
     """
     sim_t_final = t_final if t_final is not None else T_FINAL
-    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
-
-    print("\n" + "="*70)
-    print("EV CHARGING STATION COMPETITION - TC9 (9-node, 4-station)")
-    print("="*70)
 
+    if network is None:
+        network = compile_network()
     (G, origins, destinations, charging_stations,
-     idx_to_edge, edge_to_idx) = create_network()
+     idx_to_edge, edge_to_idx, paths_EV, paths_NEV) = (
+        network[k] for k in ('G', 'origins', 'destinations', 'charging_stations',
+                             'idx_to_edge', 'edge_to_idx', 'paths_EV', 'paths_NEV'))
 
-    paths_EV, paths_NEV = enumerate_paths(
-        G, origins, destinations, charging_stations, idx_to_edge, edge_to_idx)
     lambda_EV, lambda_NEV = create_od_demand(
-        G, origins, destinations, idx_to_edge)
+        G, origins, destinations, idx_to_edge, demand_scenario(demand))
 
     n_links = len(idx_to_edge)
-    print(f"Network: {n_links} links, {len(charging_stations)} stations")
 
     # Build active OD pair lists
     od_pairs_EV, y_EV_0 = [], []
@@ -417,40 +357,176 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
 
     x0 = np.zeros(n_links)
     state0 = np.concatenate([x0, y_EV_0, y_NEV_0])
-    n_paths_EV = len(y_EV_0)
-    n_paths_NEV = len(y_NEV_0)
-
-    print(f"State dim: {len(state0)} = {n_links} links + {n_paths_EV} EV paths + {n_paths_NEV} NEV paths")
-    print(f"Duration: {sim_t_final}s, Time points: {sim_n_points}")
 
     # origin constant outflows
-    lambda_origin = np.zeros(n_links)
-    for o_idx in origins:
-        lam = (sum(lambda_EV.get((o_idx,d), 0.0) for d in destinations) +
-               sum(lambda_NEV.get((o_idx,d), 0.0) for d in destinations))
-        lambda_origin[o_idx] = lam
+    lambda_origin = origin_outflows(n_links, origins, destinations, lambda_EV, lambda_NEV)
+
+    links = compile_links(G, idx_to_edge, lambda_origin)
+    sched = pricing_schedule(sim_t_final, schedule, links['station_ids'])
 
-    params = dict(
-        n_links=n_links, n_paths_EV=n_paths_EV, n_paths_NEV=n_paths_NEV,
+    return dict(
+        n_links=n_links, n_paths_EV=len(y_EV_0), n_paths_NEV=len(y_NEV_0),
         paths_EV=paths_EV, paths_NEV=paths_NEV,
         od_pairs_EV=od_pairs_EV, od_pairs_NEV=od_pairs_NEV,
         lambda_od_EV=lambda_EV, lambda_od_NEV=lambda_NEV,
         lambda_origin=lambda_origin,
         charging_stations=charging_stations,
-        G=G, idx_to_edge=idx_to_edge,
+        G=G, idx_to_edge=idx_to_edge, edge_to_idx=edge_to_idx,
+        origins=origins, destinations=destinations,
         t_final=sim_t_final,
+        routing=compile_routing(paths_EV, paths_NEV,
+                                od_pairs_EV, od_pairs_NEV, n_links),
+        links=links,
+        schedule=sched,
+        paths=compile_paths(paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                            lambda_EV, lambda_NEV, n_links),
+        model=kernel_model(LINK_CAP, LINK_STEEP, alpha, gamma,
+                           k_rep * eta_EV, k_rep * eta_NEV),
+        state0=state0,
     )
 
-    # Single-phase integration (simpler for web)
-    print("Running simulation...")
-    t_eval = np.linspace(0, sim_t_final, sim_n_points)
-    
-    sol = solve_ivp(lambda t, s: coupled_dynamics(t, s, params),
-                    [0, sim_t_final], state0,
-                    method='Radau', t_eval=t_eval,
-                    rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
+
+def load_scenario(t_final=None, schedule=None, demand=None, network=None):
+    """compile_scenario() through the on-disk artifact cache (ev_cache)
+
+    The artifact is keyed by this module's source (network, constants),
+    the resolved schedule, demand and path options and the model
+    constants; a hit is memory-mapped instead of recompiled. ``network``
+    is only used to build on a miss. Set SCENARIO_CACHE = False to always
+    recompile.
+    """
+    sim_t_final = t_final if t_final is not None else T_FINAL
+    if not SCENARIO_CACHE:
+        return compile_scenario(sim_t_final, schedule, demand, network)
+    paths = ((network['k'], network['max_cost']) if network is not None
+             else (PATH_K, PATH_MAX_COST))
+    definition = dict(
+        t_final=sim_t_final, demand=demand_scenario(demand), paths=paths,
+        schedule=PRICING_SCHEDULE if schedule is None else load_schedule(schedule),
+        model=[LINK_CAP, LINK_STEEP, alpha, gamma, k_rep, eta_EV, eta_NEV])
+    return cached_scenario(__file__, definition,
+                           lambda: compile_scenario(sim_t_final, schedule, demand, network))
+
+
+def origin_outflows(n_links, origins, destinations, lambda_EV, lambda_NEV):
+    """Constant outflow of every origin loop: its total EV + NEV demand"""
+    lambda_origin = np.zeros(n_links)
+    for o_idx in origins:
+        lam = (sum(lambda_EV.get((o_idx,d), 0.0) for d in destinations) +
+               sum(lambda_NEV.get((o_idx,d), 0.0) for d in destinations))
+        lambda_origin[o_idx] = lam
+    return lambda_origin
+
+
+# ──────────────────────────────────────────────────────
+#  MAIN SIMULATION RUNNER
+# ──────────────────────────────────────────────────────
+def run_simulation(save_animation_path=None, t_final=None, n_points=None, return_data=False,
+                   schedule=None, jacobian=None, converge_tol=None, mode='dynamic',
+                   demand=None, plots=True, network=None, solver=None, figures=(1, 2, 3, 4),
+                   solution_path=None, charts=False, progress=None, renderer=None):
+    """Main simulation runner for web deployment
     
+    Args:
+        save_animation_path: Path to save animation GIF
+        t_final: Simulation duration (default: T_FINAL)
+        n_points: Number of time points (default: N_TIME_POINTS)
+        return_data: If True, returns network data for interactive visualization;
+            'arrays' keeps its time series as numpy arrays and adds the
+            path flows, for ev_trajectory.encode()
+        schedule: Pricing schedule dict or JSON path (default: PRICING_SCHEDULE)
+        jacobian: 'analytic', 'sparsity' or 'fd' (default: JACOBIAN)
+        converge_tol: Stop each pricing phase once the relative equilibrium
+            gap and link-density rates fall below this (default: CONVERGE_TOL)
+        mode: 'dynamic' integrates the transient; 'equilibrium' solves the
+            steady state of every pricing phase and returns
+            {'mode', 'success', 'phases'} without plotting
+        demand: Per-origin overrides of DEMAND_SCENARIO
+        plots: If False, skip all figures (matplotlib is never imported)
+            and return a compact {'mode', 'success', 'nfev', 'njev', 'nlu',
+            'phases'} summary with the state and station metrics each
+            pricing phase ended in; with return_data the network data
+            carries the same 'phases'
+        network: compile_network() result to reuse instead of rebuilding
+        solver: Overrides of 'rtol', 'atol', 'max_step' for Radau
+        figures: Numbers of the figures to render when plotting (1 network
+            animation, 2 path demands, 3 replicator convergence, 4
+            competition metrics; default all)
+        solution_path: .npz file holding the solver output for these
+            parameters: loaded instead of integrating if it exists,
+            written after a successful solve otherwise
+        charts: With return_data, add the series behind figures 2-4 as
+            'charts' (see chart_data()); needs no plotting
+        progress: Called with a dict per progress event: {'stage': 'build'},
+            the solver's {'stage': 'solve', ...} (see ev_engine.progress_rhs)
+            and {'stage': 'render', 'figure', 'n_figures', 'name'}
+        renderer: Draws the figures in place of render_figures(), called
+            with the same arguments (e.g. ev_render's process pool)
+    """
+    report = progress or (lambda event: None)
+    shown = set(figures)
+    sim_t_final = t_final if t_final is not None else T_FINAL
+    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
+
+    print("\n" + "="*70)
+    print("EV CHARGING STATION COMPETITION - TC9 (9-node, 4-station)")
+    print("="*70)
+
+    report({'stage': 'build'})
+    params = load_scenario(sim_t_final, schedule, demand, network)
+    (G, charging_stations, idx_to_edge, paths_EV, paths_NEV,
+     od_pairs_EV, od_pairs_NEV, lambda_EV, lambda_NEV, links, sched, state0) = (
+        params[k] for k in ('G', 'charging_stations', 'idx_to_edge',
+                            'paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                            'lambda_od_EV', 'lambda_od_NEV', 'links', 'schedule',
+                            'state0'))
+    n_links = params['n_links']
+    n_paths_EV = params['n_paths_EV']
+
+    print(f"Network: {n_links} links, {len(charging_stations)} stations")
+    print(f"State dim: {len(state0)} = {n_links} links + {n_paths_EV} EV paths + "
+          f"{params['n_paths_NEV']} NEV paths")
+    print(f"Duration: {sim_t_final}s, Time points: {sim_n_points}")
+
+    edges = phase_edges(sched, sim_t_final)
+    if mode == 'equilibrium':
+        phases = phase_equilibria(params['routing'], links, params['paths'],
+                                  params['model'], lambda t: schedule_at(sched, t),
+                                  edges, state0)
+        print(equilibrium_table(phases, links))
+        return {'mode': 'equilibrium',
+                'success': all(ph['success'] for ph in phases),
+                'phases': summarise_equilibria(phases, links, n_paths_EV)}
+
+    # Integrate phase by phase, restarting at every price breakpoint
+    print(f"Running simulation ({len(edges) - 1} pricing phases)...")
+    t_eval = np.linspace(0, sim_t_final, sim_n_points)
+    jac_kw = solver_jacobian(jacobian or JACOBIAN, params['routing'], params['paths'],
+                             lambda t, s: coupled_jacobian(t, s, params))
+
+    fun = lambda t, s: coupled_dynamics(t, s, params)
+    tol = converge_tol if converge_tol is not None else CONVERGE_TOL
+    converged = None
+    if tol is not None:
+        watch = np.setdiff1d(np.arange(n_links), links['origin'])
+        converged = convergence_event(fun, lambda t, s: coupled_gap(t, s, params),
+                                      watch, tol)
+
+    solver_kw = dict(rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
+    solver_kw.update(solver or {})
+    if solution_path and os.path.exists(solution_path):
+        sol = load_solution(solution_path)   # solved before with these parameters
+    else:
+        sol = integrate_phases(fun if progress is None else progress_rhs(fun, edges, progress),
+                               t_eval, state0, edges, converged=converged,
+                               method='Radau', **jac_kw, **solver_kw)
+        if solution_path and sol.success:
+            save_solution(solution_path, sol)
+
     print(f"Simulation {'OK' if sol.success else 'WARN'}: {len(sol.t)} pts")
+    if tol is not None:
+        print("Settled at: " + ", ".join('-' if ts is None else f"{ts:.1f}"
+                                         for ts in sol.settled))
 
     sol.y[:n_links, :] = np.maximum(sol.y[:n_links, :], 0.0)
 
@@ -459,43 +535,25 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
     y_EV_all = sol.y[n_links:n_links+n_paths_EV, :]
     y_NEV_all = sol.y[n_links+n_paths_EV:, :]
 
-    # Station metrics
-    q_s, p_s = {}, {}
-    for sid, lid in charging_stations.items():
-        q_s[sid] = np.array([
-            outflow_fn(x_all[lid, i],
-                       mu=get_station_parameters(t_all[i], sid, sim_t_final)['mu_s'],
-                       nu=get_station_parameters(t_all[i], sid, sim_t_final)['nu_s'],
-                       is_charging=True)
-            for i in range(len(t_all))])
-        p_s[sid] = np.array([
-            get_station_parameters(t_all[i], sid, sim_t_final)['p_s']
-            for i in range(len(t_all))])
-
-    # Create visualizations
-    print("Creating visualizations...")
-    
-    print("   [VIZ 1/4] Network animation...")
-    create_network_animation(G, x_all, t_all, idx_to_edge, charging_stations,
-                            sim_t_final, save_path=save_animation_path,
-                            n_frames=min(50, sim_n_points // 4))
-    
-    print("   [VIZ 2/4] Path demands...")
-    plot_path_demands(t_all, y_EV_all, y_NEV_all, paths_EV, paths_NEV,
-                     od_pairs_EV, od_pairs_NEV, lambda_EV, lambda_NEV,
-                     G, idx_to_edge)
-    
-    print("   [VIZ 3/4] Replicator convergence...")
-    plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
-                         paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
-                         lambda_EV, lambda_NEV, idx_to_edge, G, sim_t_final)
-    
-    print("   [VIZ 4/4] Competition metrics...")
-    plot_charging_station_metrics(q_s, p_s, t_all, charging_stations, x_all, sim_t_final)
-    
+    phases = None
+    if not plots:
+        phases = summarise_equilibria(
+            phase_snapshots(params['routing'], links, params['paths'], params['model'],
+                            lambda t: schedule_at(sched, t), sol),
+            links, n_paths_EV)
+        if not return_data:
+            return {'mode': 'dynamic', 'success': bool(sol.success),
+                    'nfev': int(sol.nfev), 'njev': int(sol.njev), 'nlu': int(sol.nlu),
+                    'phases': phases}
+
+    if plots:
+        print("Creating visualizations...")
+        (renderer or render_figures)(sorted(shown), sol, params, sim_t_final, sim_n_points,
+                                     save_animation_path, report)
+
     # Return network data for interactive visualization
     if return_data:
-        pos = nx.get_node_attributes(G, 'pos')
+        pos = dict(G.nodes(data='pos', default=(0, 0)))
         # Build nodes list
         nodes = []
         for node in G.nodes():
@@ -530,17 +588,20 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
                 'stationId': station_id
             })
         
-        # Downsample time series for web (max 100 points)
+        # Downsample time series for web (max 100 points); lists for JSON
+        # unless return_data is 'arrays'
         step = max(1, len(t_all) // 100)
-        t_sampled = t_all[::step].tolist()
-        x_sampled = x_all[:, ::step].tolist()
+        arrays = return_data == 'arrays'
+        series = (lambda a: a) if arrays else (lambda a: a.tolist())
+        t_sampled = series(t_all[::step])
+        x_sampled = series(x_all[:, ::step])
         
         # Station prices over time
         station_prices = {}
         for sid in charging_stations:
-            station_prices[sid] = [get_station_parameters(t, sid, sim_t_final)['p_s'] for t in t_sampled]
+            station_prices[sid] = series(station_parameters(sched, t_all[::step], sid)['p_s'])
         
-        return {
+        data = {
             'nodes': nodes,
             'edges': edges,
             'timePoints': t_sampled,
@@ -549,16 +610,230 @@ def run_simulation(save_animation_path=None, t_final=None, n_points=None, return
             'stationPrices': station_prices,
             'duration': float(sim_t_final)
         }
+        if phases is not None:
+            data['phases'] = phases  # per-phase end state and station metrics
+        if charts:
+            data['charts'] = chart_data(t_all, x_all, y_EV_all, y_NEV_all,
+                                        params, sim_t_final)
+        if arrays:
+            # path flows, rows in the order of 'paths' (OD pair, then path)
+            data['pathFlows'] = {'EV': y_EV_all[:, ::step], 'NEV': y_NEV_all[:, ::step]}
+            data['paths'] = {
+                cls: [{'od': list(od_label(od, idx_to_edge, G)), 'links': [int(l) for l in p]}
+                      for od in od_pairs for p in paths[od]]
+                for cls, paths, od_pairs in (('EV', paths_EV, od_pairs_EV),
+                                             ('NEV', paths_NEV, od_pairs_NEV))}
+        return data
     
     return None
 
 
+# ──────────────────────────────────────────────────────
+#  ENSEMBLE RUNNER
+# ──────────────────────────────────────────────────────
+def run_ensemble(variants, t_final=None, n_points=None):
+    """Integrate many demand / pricing variants as one batched ODE system
+
+    Each variant is a dict with optional 'demand' (per-origin overrides of
+    DEMAND_SCENARIO, e.g. {'O1': {'beta_EV': 0.7, 'total_flow': 1.1}}) and
+    'schedule' (schedule dict or JSON path). Members share the network,
+    paths and OD pairs of the base scenario; their states are stacked
+    member-major, the kernels run once over the member axis and Radau
+    factorises the block-diagonal analytic Jacobian. No plots are drawn.
+
+    Returns {'t', 'members': [{'variant', 'x', 'y_EV', 'y_NEV'}], 'success',
+    'nfev', 'njev', 'nlu'}.
+    """
+    sim_t_final = t_final if t_final is not None else T_FINAL
+    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
+
+    base = load_scenario(sim_t_final)
+    n_links = base['n_links']
+    n_paths_EV = base['n_paths_EV']
+    paths = base['paths']
+    od_pairs = ([('EV', od) for od in base['od_pairs_EV']] +
+                [('NEV', od) for od in base['od_pairs_NEV']])
+
+    lambda_origin, lam, state0, scheds = [], [], [], []
+    for v in variants:
+        lambda_EV, lambda_NEV = create_od_demand(
+            base['G'], base['origins'], base['destinations'], base['idx_to_edge'],
+            demand_scenario(v.get('demand')))
+        for vcls, lam_dict in (('EV', lambda_EV), ('NEV', lambda_NEV)):
+            extra = [od for od, val in lam_dict.items()
+                     if val > 1e-9 and (vcls, od) not in od_pairs]
+            if extra:
+                raise ValueError(f"variant {v!r} adds {vcls} OD pairs {extra}; "
+                                 f"ensemble members share the base OD set")
+        lam_k = np.array([(lambda_EV if vcls == 'EV' else lambda_NEV).get(od, 0.0)
+                          for vcls, od in od_pairs])
+        lam.append(lam_k)
+        lambda_origin.append(origin_outflows(n_links, base['origins'], base['destinations'],
+                                             lambda_EV, lambda_NEV))
+        y0 = lam_k[paths['od_of']] / paths['group_size'][paths['od_of']]
+        state0.append(np.concatenate([np.zeros(n_links), y0]))
+        scheds.append(pricing_schedule(sim_t_final, v.get('schedule'),
+                                       base['links']['station_ids']))
+
+    ens = compile_ensemble(base['links'], paths, np.array(lambda_origin).T,
+                           np.array(lam).T)
+    route, model = base['routing'], base['model']
+    dim = len(state0[0])
+    edges = sorted({e for sched in scheds for e in phase_edges(sched, sim_t_final)})
+
+    print(f"Ensemble: {len(variants)} members x {dim} states, "
+          f"{len(edges) - 1} pricing phases")
+
+    fun = lambda t, z: ensemble_rhs(route, ens, model, schedules_at(scheds, t), z)
+    jac = lambda t, z: ensemble_jacobian(route, ens, model,
+                                         [schedule_at(s, t) for s in scheds], z)
+    sol = integrate_phases(fun, np.linspace(0, sim_t_final, sim_n_points),
+                           np.concatenate(state0), edges,
+                           method='Radau', jac=jac,
+                           rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
+
+    print(f"Ensemble {'OK' if sol.success else 'WARN'}: {len(sol.t)} pts, "
+          f"{sol.nfev} RHS calls")
+
+    members = []
+    for k, v in enumerate(variants):
+        Y = sol.y[k * dim:(k + 1) * dim]
+        members.append({'variant': v,
+                        'x': np.maximum(Y[:n_links], 0.0),
+                        'y_EV': Y[n_links:n_links+n_paths_EV],
+                        'y_NEV': Y[n_links+n_paths_EV:]})
+
+    return {'t': sol.t, 'members': members, 'success': sol.success,
+            'nfev': sol.nfev, 'njev': sol.njev, 'nlu': sol.nlu}
+
+
+# ──────────────────────────────────────────────────────
+#  DESTINATION-BASED RUNNER
+# ──────────────────────────────────────────────────────
+def run_destination(t_final=None, n_points=None, schedule=None, demand=None,
+                    converge_tol=None, solver=None):
+    """Run the scenario on the destination-based formulation (ev_destination)
+
+    No paths are enumerated: the state is the link densities plus one
+    turning fraction per destination, class and link transition, started
+    from the uniform path split so the trajectory is that of
+    run_simulation(). Small systems use Radau, large ones RK45 (no
+    Jacobian to build); ``solver`` may override 'method', 'rtol', 'atol'
+    and 'max_step'. No plots are drawn.
+
+    Returns {'mode', 'success', 'nfev', 'state_dim', 't', 'x', 'phases'}.
+    """
+    sim_t_final = t_final if t_final is not None else T_FINAL
+    sim_n_points = n_points if n_points is not None else N_TIME_POINTS
+
+    (G, origins, destinations, charging_stations,
+     idx_to_edge, edge_to_idx) = create_network()
+    lambda_EV, lambda_NEV = create_od_demand(
+        G, origins, destinations, idx_to_edge, demand_scenario(demand))
+    n_links = len(idx_to_edge)
+    links = compile_links(G, idx_to_edge, origin_outflows(
+        n_links, origins, destinations, lambda_EV, lambda_NEV))
+    sched = pricing_schedule(sim_t_final, schedule, links['station_ids'])
+    model = kernel_model(LINK_CAP, LINK_STEEP, alpha, gamma,
+                         k_rep * eta_EV, k_rep * eta_NEV)
+
+    dest = compile_destinations(G, idx_to_edge, lambda_EV, lambda_NEV)
+    state0 = np.concatenate([np.zeros(n_links), initial_splits(dest)])
+    print(f"Destination model: {len(state0)} states = {n_links} links + "
+          f"{dest['n_trans']} turning fractions")
+
+    fun = lambda t, s: destination_dynamics(dest, links, model, schedule_at(sched, t), s)
+    tol = converge_tol if converge_tol is not None else CONVERGE_TOL
+    converged = None
+    if tol is not None:
+        watch = np.setdiff1d(np.arange(n_links), links['origin'])
+        converged = convergence_event(
+            fun, lambda t, s: destination_gap(dest, links, model, schedule_at(sched, t), s),
+            watch, tol)
+
+    solver_kw = dict(method='Radau' if len(state0) < 200 else 'RK45',
+                     rtol=SOLVER_RTOL, atol=SOLVER_ATOL, max_step=MAX_STEP)
+    solver_kw.update(solver or {})
+    sol = integrate_phases(fun, np.linspace(0, sim_t_final, sim_n_points), state0,
+                           phase_edges(sched, sim_t_final), converged=converged,
+                           **solver_kw)
+    print(f"Simulation {'OK' if sol.success else 'WARN'}: {len(sol.t)} pts, "
+          f"{sol.nfev} RHS calls")
+
+    phases = destination_snapshots(dest, links, model, lambda t: schedule_at(sched, t), sol)
+    return {'mode': 'destination', 'success': bool(sol.success), 'nfev': int(sol.nfev),
+            'state_dim': len(state0), 't': sol.t, 'x': np.maximum(sol.y[:n_links], 0.0),
+            'phases': summarise_destinations(phases, links)}
+
+
 # ══════════════════════════════════════════════════════
 #  VISUALIZATION FUNCTIONS
 # ══════════════════════════════════════════════════════
+# Figures of run_simulation(), numbered from 1 as in its ``figures``
+FIGURE_NAMES = ('Network animation', 'Path demands', 'Replicator convergence',
+                'Competition metrics')
+
+
+def station_flows(params, t, x_all):
+    """Charging outflow q_s and price p_s of every station over ``t``"""
+    q_s, p_s = {}, {}
+    for sid, lid in params['charging_stations'].items():
+        sp = station_parameters(params['schedule'], t, sid)
+        q_s[sid] = charging_outflow(params['model'], x_all[lid], sp['mu_s'], sp['nu_s'])
+        p_s[sid] = sp['p_s']
+    return q_s, p_s
+
+
+def render_figure(figure, sol, params, t_final, n_points, save_animation_path=None,
+                  batch=None, writer=None):
+    """Draw figure number ``figure`` (FIGURE_NAMES) of the run ``sol`` of
+    ``params``; ``batch`` and ``writer`` go to create_network_animation()"""
+    G, charging_stations, idx_to_edge, sched = (
+        params[k] for k in ('G', 'charging_stations', 'idx_to_edge', 'schedule'))
+    n_links, n_paths_EV = params['n_links'], params['n_paths_EV']
+    t_all = sol.t
+    x_all = sol.y[:n_links, :]
+    y_EV_all = sol.y[n_links:n_links+n_paths_EV, :]
+    y_NEV_all = sol.y[n_links+n_paths_EV:, :]
+    paths = [params[k] for k in ('paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                                 'lambda_od_EV', 'lambda_od_NEV')]
+
+    if figure == 1:
+        create_network_animation(G, x_all, t_all, idx_to_edge, charging_stations,
+                                 t_final, save_path=save_animation_path,
+                                 n_frames=min(50, n_points // 4), batch=batch, writer=writer)
+    elif figure == 2:
+        plot_path_demands(t_all, y_EV_all, y_NEV_all, *paths, G, idx_to_edge)
+    elif figure == 3:
+        plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all, *paths,
+                              idx_to_edge, G, t_final, schedule=sched)
+    elif figure == 4:
+        q_s, p_s = station_flows(params, t_all, x_all)
+        plot_charging_station_metrics(q_s, p_s, t_all, charging_stations, x_all, t_final,
+                                      schedule=sched)
+
+
+def render_figures(figures, sol, params, t_final, n_points, save_animation_path=None,
+                   report=None):
+    """Draw ``figures`` one after the other (see render_figure()), calling
+    ``report`` with a {'stage': 'render', ...} event before each"""
+    for n in figures:
+        name = FIGURE_NAMES[n - 1]
+        print(f"   [VIZ {n}/4] {name}...")
+        if report is not None:
+            report({'stage': 'render', 'figure': n, 'n_figures': 4, 'name': name})
+        render_figure(n, sol, params, t_final, n_points, save_animation_path)
+
+
 def create_network_animation(G, x_traj, t, idx_to_edge, charging_stations,
-                            t_final, save_path=None, n_frames=50):
-    """Create animated network visualization"""
+                            t_final, save_path=None, n_frames=50, batch=None, writer=None):
+    """Create animated network visualization.  ``batch`` (i, k) draws only
+    every k-th frame from the i-th on; ``writer`` (default: PillowWriter, 10 fps) saves it"""
+    import networkx as nx
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    import matplotlib.animation as animation
+
     pos = nx.get_node_attributes(G, 'pos')
     fig, ax = plt.subplots(figsize=(14, 9))
     
@@ -651,12 +926,17 @@ def create_network_animation(G, x_traj, t, idx_to_edge, charging_stations,
     
     frame_step = max(1, len(t) // n_frames)
     frames = np.arange(0, len(t), frame_step)
+    if batch is not None:
+        frames = frames[batch[0]::batch[1]]
+    if not len(frames):
+        plt.close('all')
+        return
     ani = animation.FuncAnimation(fig, update, frames=frames, interval=100)
     
     if save_path:
         try:
             print(f"   Saving animation to {save_path}...")
-            ani.save(save_path, writer='pillow', fps=10)
+            ani.save(save_path, writer=writer or animation.PillowWriter(fps=10))
             print(f"   Animation saved!")
         except Exception as e:
             print(f"   Warning: Could not save animation: {e}")
@@ -673,29 +953,34 @@ def od_label(od, idx_to_edge, G):
     return on, dn
 
 
+def path_demand_series(y_EV_all, y_NEV_all, paths_EV, paths_NEV,
+                       od_pairs_EV, od_pairs_NEV, lambda_EV, lambda_NEV,
+                       G, idx_to_edge):
+    """Path flows of every OD pair, NEV first: a list of
+    {'title', 'vehicle', 'demand', 'flows'} with flows[path][time]."""
+    series = []
+    for vcls, y_all, paths, od_pairs, lam in (
+            ('NEV', y_NEV_all, paths_NEV, od_pairs_NEV, lambda_NEV),
+            ('EV', y_EV_all, paths_EV, od_pairs_EV, lambda_EV)):
+        idx = 0
+        for od in od_pairs:
+            np_od = len(paths[od])
+            on, dn = od_label(od, idx_to_edge, G)
+            series.append(dict(title=f'{vcls}: {on} -> {dn}', vehicle=vcls,
+                               demand=lam[od], flows=y_all[idx:idx+np_od, :]))
+            idx += np_od
+    return series
+
+
 def plot_path_demands(t, y_EV_all, y_NEV_all, paths_EV, paths_NEV,
                      od_pairs_EV, od_pairs_NEV, lambda_EV, lambda_NEV,
                      G, idx_to_edge):
     """Plot path demand evolution"""
-    plots = []
-
-    idx = 0
-    for od in od_pairs_NEV:
-        np_od = len(paths_NEV[od])
-        on, dn = od_label(od, idx_to_edge, G)
-        plots.append(dict(title=f'NEV: {on} -> {dn}',
-                         data=y_NEV_all[idx:idx+np_od, :],
-                         demand=lambda_NEV[od]))
-        idx += np_od
-
-    idx = 0
-    for od in od_pairs_EV:
-        np_od = len(paths_EV[od])
-        on, dn = od_label(od, idx_to_edge, G)
-        plots.append(dict(title=f'EV: {on} -> {dn}',
-                         data=y_EV_all[idx:idx+np_od, :],
-                         demand=lambda_EV[od]))
-        idx += np_od
+    import matplotlib.pyplot as plt
+
+    plots = path_demand_series(y_EV_all, y_NEV_all, paths_EV, paths_NEV,
+                               od_pairs_EV, od_pairs_NEV, lambda_EV, lambda_NEV,
+                               G, idx_to_edge)
 
     if not plots:
         return
@@ -712,8 +997,8 @@ def plot_path_demands(t, y_EV_all, y_NEV_all, paths_EV, paths_NEV,
 
     for i, info in enumerate(plots):
         ax = axs[i]
-        for pi in range(info['data'].shape[0]):
-            ax.plot(t, info['data'][pi, :], lw=2.5, label=f'Path {pi}',
+        for pi in range(info['flows'].shape[0]):
+            ax.plot(t, info['flows'][pi, :], lw=2.5, label=f'Path {pi}',
                    color=bright_colors[pi % len(bright_colors)])
         ax.axhline(info['demand'], color='#DC143C', ls='--', lw=2.5,
                   label=f"Total Demand={info['demand']:.2f}")
@@ -728,21 +1013,23 @@ def plot_path_demands(t, y_EV_all, y_NEV_all, paths_EV, paths_NEV,
     plt.show()
 
 
-def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
-                          paths_EV, paths_NEV,
-                          od_pairs_EV, od_pairs_NEV,
-                          lambda_EV, lambda_NEV, idx_to_edge, G, t_final):
-    """Plot replicator convergence: tau_avg - tau_p -> 0"""
-    step   = max(1, len(t_all)//400)
+def cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all,
+                            paths_EV, paths_NEV,
+                            od_pairs_EV, od_pairs_NEV,
+                            lambda_EV, lambda_NEV, idx_to_edge, G, t_final,
+                            schedule=None, max_points=400):
+    """Replicator convergence tau_avg - tau_p of every path, on at most
+    ``max_points`` of the time points: (t_sub, [{'title', 'vehicle',
+    'gaps'}]) with gaps[path][time], NEV OD pairs first."""
+    if schedule is None:
+        schedule = pricing_schedule(t_final)
+    step   = max(1, len(t_all)//max_points)
     t_sub  = t_all[::step]
     x_sub  = x_all[:, ::step]
     yEVs   = y_EV_all[:, ::step]
     yNEVs  = y_NEV_all[:, ::step]
     n_sub  = len(t_sub)
 
-    # Bright colors for paths
-    bright_colors = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
-
     def gap_series(od_pairs, paths_dict, y_sub, lam_dict, vcls):
         results = []
         pidx = 0
@@ -766,7 +1053,7 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
                         if lt in ('origin','destination'): continue
                         elif lt=='EV-only' and vcls=='EV':
                             sid = d['station_id']
-                            sp  = get_station_parameters(t_sub[ti], sid, t_final)
+                            sp  = station_parameters(schedule, t_sub[ti], sid)
                             xi  = x_t[lid]
                             wt  = xi / max(sp['mu_s'], 1e-9)
                             c  += latency_fn(xi,True)+alpha*wt+gamma*sp['p_s']
@@ -777,12 +1064,29 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
                 tau_avg= (y_n*tau_p).sum() / max(lam,1e-12)
                 gaps[:, ti] = tau_avg - tau_p
             on, dn = od_label(od, idx_to_edge, G)
-            results.append(dict(title=f'{vcls}: {on}->{dn}', gaps=gaps))
+            results.append(dict(title=f'{vcls}: {on}->{dn}', vehicle=vcls, gaps=gaps))
             pidx += np_od
         return results
 
-    all_res = (gap_series(od_pairs_NEV, paths_NEV, yNEVs, lambda_NEV, 'NEV') +
-               gap_series(od_pairs_EV,  paths_EV,  yEVs,  lambda_EV,  'EV'))
+    return t_sub, (gap_series(od_pairs_NEV, paths_NEV, yNEVs, lambda_NEV, 'NEV') +
+                   gap_series(od_pairs_EV,  paths_EV,  yEVs,  lambda_EV,  'EV'))
+
+
+def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
+                          paths_EV, paths_NEV,
+                          od_pairs_EV, od_pairs_NEV,
+                          lambda_EV, lambda_NEV, idx_to_edge, G, t_final,
+                          schedule=None):
+    """Plot replicator convergence: tau_avg - tau_p -> 0"""
+    import matplotlib.pyplot as plt
+
+    t_sub, all_res = cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all,
+                                             paths_EV, paths_NEV, od_pairs_EV, od_pairs_NEV,
+                                             lambda_EV, lambda_NEV, idx_to_edge, G, t_final,
+                                             schedule=schedule)
+
+    # Bright colors for paths
+    bright_colors = ['#1E90FF', '#FF8C00', '#32CD32', '#DC143C', '#9932CC', '#00CED1', '#FF1493']
 
     if not all_res: return
 
@@ -811,9 +1115,54 @@ def plot_cost_convergence(t_all, x_all, y_EV_all, y_NEV_all,
     plt.show()
 
 
-def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_traj, t_final):
-    """Plot charging station competition metrics"""
+def station_metrics_series(q_s_traj, p_s_traj, t, charging_stations, x_traj, t_final,
+                           schedule=None):
+    """Competition metrics of the stations (sorted ids under 'stations'):
+    'marketShare' (%), 'price' and 'queue' over ``t``, integrated
+    'revenue' and 'profit' per pricing phase of the schedule ('phases':
+    {'name', 't_start', 't_end'}) and 'overallShare' (%), each a dict by
+    station."""
+    if schedule is None:
+        schedule = pricing_schedule(t_final)
     station_ids = sorted(charging_stations.keys())
+    edges = phase_edges(schedule, t_final)
+    phases = [dict(name=f'Phase {i+1}', t_start=ts, t_end=te)
+              for i, (ts, te) in enumerate(zip(edges[:-1], edges[1:]))]
+
+    revenue, profit = {}, {}
+    for sid in station_ids:
+        revs, profits = [], []
+        for ph in phases:
+            mask = (t >= ph['t_start']) & (t <= ph['t_end'])
+            tp = t[mask]
+            if len(tp) > 1:
+                cs = station_parameters(schedule, tp, sid)['c_s']
+                revs.append(np.trapezoid(p_s_traj[sid][mask] * q_s_traj[sid][mask], tp))
+                profits.append(np.trapezoid((p_s_traj[sid][mask] - cs) * q_s_traj[sid][mask], tp))
+            else:
+                revs.append(0.0)
+                profits.append(0.0)
+        revenue[sid], profit[sid] = revs, profits
+
+    tot = sum(q_s_traj[s] for s in station_ids) + 1e-9
+    tot_int = {sid: np.trapezoid(q_s_traj[sid], t) for sid in station_ids}
+    grand = sum(tot_int.values()) + 1e-9
+    return dict(stations=station_ids, phases=phases,
+                marketShare={sid: 100 * q_s_traj[sid] / tot for sid in station_ids},
+                price={sid: p_s_traj[sid] for sid in station_ids},
+                queue={sid: x_traj[charging_stations[sid], :] for sid in station_ids},
+                revenue=revenue, profit=profit,
+                overallShare={sid: 100 * tot_int[sid] / grand for sid in station_ids})
+
+
+def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_traj, t_final,
+                                  schedule=None):
+    """Plot charging station competition metrics"""
+    import matplotlib.pyplot as plt
+
+    metrics = station_metrics_series(q_s_traj, p_s_traj, t, charging_stations, x_traj,
+                                     t_final, schedule=schedule)
+    station_ids = metrics['stations']
     # Brighter, more vibrant colors
     colors = {'S1': '#FF4136', 'S2': '#0074D9', 'S3': '#2ECC40', 'S4': '#FF851B'}
 
@@ -821,22 +1170,16 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     fig.suptitle('Competition Metrics (Dynamic Pricing Game)', fontsize=16, fontweight='bold')
     fig.patch.set_facecolor('white')
 
-    # Scale phase boundaries
-    scale = t_final / 500.0
-    phases = [
-        (f'Phase 1\n(0-{int(125*scale)}s)', 0, 125*scale),
-        (f'Phase 2\n({int(125*scale)}-{int(250*scale)}s)', 125*scale, 250*scale),
-        (f'Phase 3\n({int(250*scale)}-{int(375*scale)}s)', 250*scale, 375*scale),
-        (f'Phase 4\n({int(375*scale)}-{int(t_final)}s)', 375*scale, t_final),
-    ]
+    # Phase boundaries from the (scaled) pricing schedule
+    phases = [(f"{ph['name']}\n({int(ph['t_start'])}-{int(ph['t_end'])}s)",
+               ph['t_start'], ph['t_end']) for ph in metrics['phases']]
     x_pos = np.arange(len(phases))
     width = 0.18
 
     # 1 Market Share
     ax = axs[0, 0]
-    tot = sum(q_s_traj[s] for s in station_ids) + 1e-9
     for sid in station_ids:
-        ms = 100 * q_s_traj[sid] / tot
+        ms = metrics['marketShare'][sid]
         ax.plot(t, ms, label=sid, lw=2.5, color=colors[sid])
         ax.fill_between(t, 0, ms, color=colors[sid], alpha=0.15)
     for _, _, pt in phases[:-1]:
@@ -851,7 +1194,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     # 2 Pricing
     ax = axs[0, 1]
     for sid in station_ids:
-        ax.plot(t, p_s_traj[sid], label=sid, lw=2.5, color=colors[sid])
+        ax.plot(t, metrics['price'][sid], label=sid, lw=2.5, color=colors[sid])
     for _, _, pt in phases[:-1]:
         ax.axvline(pt, color='gray', ls='--', alpha=0.5, lw=1)
     ax.set_title('Pricing Strategy', fontweight='bold', fontsize=12)
@@ -863,8 +1206,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     # 3 Queues
     ax = axs[0, 2]
     for sid in station_ids:
-        lid = charging_stations[sid]
-        ax.plot(t, x_traj[lid, :], label=sid, lw=2.5, color=colors[sid])
+        ax.plot(t, metrics['queue'][sid], label=sid, lw=2.5, color=colors[sid])
     for _, _, pt in phases[:-1]:
         ax.axvline(pt, color='gray', ls='--', alpha=0.5, lw=1)
     ax.set_title('Queue Lengths', fontweight='bold', fontsize=12)
@@ -876,14 +1218,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     # 4 Revenue by Phase
     ax = axs[1, 0]
     for i, sid in enumerate(station_ids):
-        revs = []
-        for _, ts, te in phases:
-            mask = (t >= ts) & (t <= te)
-            tp = t[mask]
-            if len(tp) > 1:
-                revs.append(np.trapezoid(p_s_traj[sid][mask] * q_s_traj[sid][mask], tp))
-            else:
-                revs.append(0.0)
+        revs = metrics['revenue'][sid]
         bars = ax.bar(x_pos + i*width, revs, width, label=sid, color=colors[sid], 
                      alpha=0.85, edgecolor='white', lw=1.5)
         # Add value labels on bars
@@ -901,15 +1236,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     # 5 Net Profit
     ax = axs[1, 1]
     for i, sid in enumerate(station_ids):
-        profits = []
-        for _, ts, te in phases:
-            mask = (t >= ts) & (t <= te)
-            tp = t[mask]
-            if len(tp) > 1:
-                cs = np.array([get_station_parameters(ti, sid, t_final)['c_s'] for ti in tp])
-                profits.append(np.trapezoid((p_s_traj[sid][mask] - cs) * q_s_traj[sid][mask], tp))
-            else:
-                profits.append(0.0)
+        profits = metrics['profit'][sid]
         bars = ax.bar(x_pos + i*width, profits, width, label=sid, color=colors[sid], 
                      alpha=0.85, edgecolor='white', lw=1.5)
         # Add value labels on bars
@@ -928,9 +1255,7 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
 
     # 6 Overall Market Share
     ax = axs[1, 2]
-    tot_int = {sid: np.trapezoid(q_s_traj[sid], t) for sid in station_ids}
-    grand = sum(tot_int.values()) + 1e-9
-    shares = [100 * tot_int[s] / grand for s in station_ids]
+    shares = [metrics['overallShare'][s] for s in station_ids]
     bars = ax.bar(range(len(station_ids)), shares,
                   color=[colors[s] for s in station_ids], alpha=0.85, 
                   edgecolor='white', lw=2)
@@ -949,6 +1274,34 @@ def plot_charging_station_metrics(q_s_traj, p_s_traj, t, charging_stations, x_tr
     plt.show()
 
 
+def chart_data(t_all, x_all, y_EV_all, y_NEV_all, params, t_final, max_points=200):
+    """The series behind figures 2-4 on at most ``max_points`` time points,
+    JSON-ready, for clients that draw the charts themselves:
+    {'pathDemands': {'t', 'series'}, 'convergence': {'t', 'series'},
+    'stations': {'t', ...}} (see the *_series functions)."""
+    step = max(1, len(t_all) // max_points)
+    G, idx_to_edge, sched = params['G'], params['idx_to_edge'], params['schedule']
+    paths = [params[k] for k in ('paths_EV', 'paths_NEV', 'od_pairs_EV', 'od_pairs_NEV',
+                                 'lambda_od_EV', 'lambda_od_NEV')]
+
+    demands = path_demand_series(y_EV_all, y_NEV_all, *paths, G, idx_to_edge)
+    t_sub, gaps = cost_convergence_series(t_all, x_all, y_EV_all, y_NEV_all, *paths,
+                                          idx_to_edge, G, t_final, schedule=sched,
+                                          max_points=max_points)
+    q_s, p_s = station_flows(params, t_all, x_all)
+    stations = station_metrics_series(q_s, p_s, t_all, params['charging_stations'], x_all,
+                                      t_final, schedule=sched)
+    for key in ('marketShare', 'price', 'queue'):
+        stations[key] = {sid: s[::step] for sid, s in stations[key].items()}
+
+    return json_ready({
+        'pathDemands': {'t': t_all[::step],
+                        'series': [dict(s, flows=s['flows'][:, ::step]) for s in demands]},
+        'convergence': {'t': t_sub, 'series': gaps},
+        'stations': dict(stations, t=t_all[::step]),
+    })
+
+
 # ──────────────────────────────────────────────────────
 if __name__ == '__main__':
     run_simulation()
@@ -0,0 +1,127 @@
+"""
+Binary columnar encoding of a run's trajectory for the web client.
+
+The interactive player needs the sampled time axis, the link densities,
+the path flows and the station prices of a run.  As JSON those are nested
+lists of float64 reprs, about 20 bytes per value and a slow parse for
+long runs.  Here each is one column of float32 (4 bytes per value) or,
+quantized, uint16 (2 bytes) with an offset and scale per row, behind a
+small JSON header:
+
+    bytes 0-3     b'EVT1'
+    bytes 4-7     header length n (uint32, little-endian)
+    bytes 8-8+n   header JSON, space-padded so that the columns start
+                  8-byte aligned
+    ...           the columns, little-endian, each 8-byte aligned
+
+The header holds everything that is not a time series (nodes, edges,
+stations, phases, ...) under 'meta' and one entry per column:
+
+    {"name": "densities", "dtype": "float32" | "uint16",
+     "shape": [n_links, n_times], "offset": <from the first column>,
+     "min": [...], "scale": [...]}    # uint16 only, one per row:
+                                      # value = min[row] + q * scale[row]
+
+Columns are row-major, so a row (one link, path or station) is a
+contiguous typed-array view in the browser.  Their names are timePoints,
+densities, pathFlowsEV, pathFlowsNEV and stationPrices (rows in the order
+of meta['stations']).  ``data`` is what a model's
+run_simulation(return_data='arrays') returns.
+"""
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'EVT1'
+ALIGN = 8
+DTYPES = ('float32', 'uint16')
+SERIES = ('timePoints', 'densities', 'pathFlows', 'stationPrices')
+
+
+def _pad(n):
+    return -n % ALIGN
+
+
+def _quantize(values):
+    """uint16 codes of ``values`` plus the per-row (min, scale) lists that
+    restore them.  Rows get their own range: an origin link's density spans
+    far more than a side road's."""
+    rows = values.reshape(-1, values.shape[-1])
+    if rows.shape[1] == 0:
+        return rows.astype('<u2'), [0.0] * len(rows), [1.0] * len(rows)
+    lo = rows.min(axis=1)
+    scale = (rows.max(axis=1) - lo) / 65535
+    scale[scale == 0] = 1.0
+    codes = np.rint((rows - lo[:, None]) / scale[:, None]).astype('<u2')
+    return codes, lo.tolist(), scale.tolist()
+
+
+def encode(data, dtype='float32'):
+    """Bytes of the trajectory in ``data`` (see the module docstring);
+    ``dtype`` 'uint16' quantizes every column to 16 bits."""
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, not {dtype!r}")
+    meta = {k: v for k, v in data.items() if k not in SERIES}
+    t = np.asarray(data['timePoints'], dtype=float)
+    stations = list(data['stationPrices'])
+    meta['stations'] = stations
+    columns = {
+        'timePoints': t,
+        'densities': np.asarray(data['densities'], dtype=float),
+        'pathFlowsEV': np.asarray(data['pathFlows']['EV'], dtype=float),
+        'pathFlowsNEV': np.asarray(data['pathFlows']['NEV'], dtype=float),
+        'stationPrices': np.array([data['stationPrices'][s] for s in stations],
+                                  dtype=float).reshape(len(stations), len(t)),
+    }
+
+    table, blobs, offset = [], [], 0
+    for name, values in columns.items():
+        entry = {'name': name, 'dtype': dtype, 'shape': list(values.shape), 'offset': offset}
+        if dtype == 'uint16':
+            codes, entry['min'], entry['scale'] = _quantize(values)
+            blob = codes.tobytes()
+        else:
+            blob = values.astype('<f4').tobytes()
+        blob += b'\0' * _pad(len(blob))
+        table.append(entry)
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({'meta': meta, 'columns': table}).encode('utf-8')
+    header += b' ' * _pad(8 + len(header))
+    return MAGIC + struct.pack('<I', len(header)) + header + b''.join(blobs)
+
+
+def decode(buf):
+    """Inverse of encode(): the ``data`` dict, with float32 arrays (rows of
+    densities and path flows, one array per station price)."""
+    buf = memoryview(buf)
+    if bytes(buf[:4]) != MAGIC:
+        raise ValueError('not an EVT1 trajectory')
+    (n,) = struct.unpack('<I', buf[4:8])
+    header = json.loads(bytes(buf[8:8 + n]))
+    start = 8 + n
+
+    columns = {}
+    for entry in header['columns']:
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape))
+        if entry['dtype'] == 'uint16':
+            codes = np.frombuffer(buf, '<u2', count, start + entry['offset'])
+            codes = codes.reshape(len(entry['min']), shape[-1])
+            values = (np.array(entry['min'])[:, None]
+                      + codes * np.array(entry['scale'])[:, None]).astype(np.float32)
+        else:
+            values = np.frombuffer(buf, '<f4', count, start + entry['offset'])
+        columns[entry['name']] = values.reshape(shape)
+
+    data = dict(header['meta'])
+    stations = data.pop('stations')
+    data.update({
+        'timePoints': columns['timePoints'],
+        'densities': columns['densities'],
+        'pathFlows': {'EV': columns['pathFlowsEV'], 'NEV': columns['pathFlowsNEV']},
+        'stationPrices': dict(zip(stations, columns['stationPrices'])),
+    })
+    return data
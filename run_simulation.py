@@ -5,36 +5,22 @@ import io
 import os
 from io import StringIO
 
-# Parse command-line arguments for simulation parameters
-# Usage: python run_simulation.py [duration] [points] [simulation_type]
+# Usage: python run_simulation.py [duration] [points] [simulation_type] [--no-plots]
 # simulation_type: 'tc7' (default, 4-node 2-station) or 'tc9' (9-node 4-station)
-t_final_arg = None
-n_points_arg = None
-sim_type_arg = 'tc7'  # default
+# --no-plots: compute only - return networkData (plus per-phase station
+#             metrics) without importing matplotlib or drawing any figure
+#
+# The same run is available as simulate() for long-lived workers
+# (sim_worker.py), which import this module once and call it per job.
 
-if len(sys.argv) > 1:
-    try:
-        t_final_arg = float(sys.argv[1])
-    except (ValueError, IndexError):
-        pass
-if len(sys.argv) > 2:
-    try:
-        n_points_arg = int(sys.argv[2])
-    except (ValueError, IndexError):
-        pass
-if len(sys.argv) > 3:
-    sim_type_arg = sys.argv[3].lower().strip()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANIMATION_GIF_PATH = os.path.join(BASE_DIR, 'network_animation.gif')
 
 # Add current directory to path to import ev_tc_7
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
-# Setup matplotlib for better graph quality
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+sys.path.insert(0, BASE_DIR)
 
-# Set style for brighter, cleaner graphs
-plt.rcParams.update({
+# Style for brighter, cleaner graphs
+GRAPH_STYLE = {
     'figure.facecolor': 'white',
     'axes.facecolor': 'white',
     'axes.edgecolor': '#333333',
@@ -52,20 +38,65 @@ plt.rcParams.update({
     'legend.framealpha': 0.9,
     'legend.fontsize': 10,
     'lines.linewidth': 2.5,
-})
+}
 
-# Capture all plots as base64 encoded images
+# Figures of the current run, as base64 encoded PNGs
 captured_figures = []
-figure_counter = 0
-animation_gif_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'network_animation.gif')
+
+# The figures of a run, numbered from 1 as the models' ``figures`` argument:
+# (name, MIME type); the animation is the GIF, the others are captured PNGs
+FIGURES = [
+    ('Network animation', 'image/gif'),
+    ('Path demands', 'image/png'),
+    ('Replicator convergence', 'image/png'),
+    ('Competition metrics', 'image/png'),
+]
+
+
+def parse_args(argv):
+    """(t_final, n_points, sim_type, plots) from the command-line arguments."""
+    plots = '--no-plots' not in argv
+    args = [a for a in argv if a != '--no-plots']
+
+    t_final = None
+    n_points = None
+    sim_type = 'tc7'  # default
+
+    if len(args) > 0:
+        try:
+            t_final = float(args[0])
+        except (ValueError, IndexError):
+            pass
+    if len(args) > 1:
+        try:
+            n_points = int(args[1])
+        except (ValueError, IndexError):
+            pass
+    if len(args) > 2:
+        sim_type = args[2].lower().strip()
+    return t_final, n_points, sim_type, plots
+
+
+def setup_matplotlib():
+    """Select the Agg backend, apply GRAPH_STYLE and make plt.show()
+    capture figures instead of displaying them.  Safe to call repeatedly."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    if plt.show is not save_current_figure:
+        plt.rcParams.update(GRAPH_STYLE)
+        plt.show = save_current_figure
+    return plt
+
 
 def save_current_figure():
     """Save current matplotlib figure as base64 encoded PNG."""
-    global figure_counter
+    import matplotlib.pyplot as plt
     try:
         # Get current figure
         fig = plt.gcf()
-        
+
         # Skip if no figure is active
         if fig.get_axes():
             # Set larger figure size for better web display
@@ -75,78 +106,179 @@ def save_current_figure():
             buffer.seek(0)
             image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
             captured_figures.append(image_base64)
-            figure_counter += 1
-            print(f"[Capture] Figure {figure_counter} saved ({len(image_base64)//1024}KB)", file=sys.stderr)
-        
+            print(f"[Capture] Figure {len(captured_figures)} saved ({len(image_base64)//1024}KB)", file=sys.stderr)
+
         plt.close('all')
     except Exception as e:
         print(f"[Error] Failed to save figure: {e}", file=sys.stderr)
 
-# Monkey patch plt.show to capture figures instead
-original_show = plt.show
-plt.show = save_current_figure
 
-try:
-    # Suppress print output from the simulation
-    # Redirect stdout to capture it but don't display it
-    old_stdout = sys.stdout
-    old_stderr = sys.stderr
-    sys.stdout = StringIO()
-    sys.stderr = StringIO()
-    
-    # Import and run the simulation based on type parameter
-    if sim_type_arg == 'tc9':
-        from ev_tc_9_web import run_simulation, create_network, enumerate_paths, create_od_demand
-        from ev_tc_9_web import get_station_parameters as get_params
+def load_simulation(sim_type):
+    """run_simulation() of the model behind ``sim_type``."""
+    if sim_type == 'tc9':
+        from ev_tc_9_web import run_simulation
     else:
-        from ev_tc_7 import run_simulation, create_network_with_charging_stations, enumerate_paths, create_od_demand
-        from ev_tc_7 import get_station_parameters as get_params
-    
-    # Run the simulation with provided parameters and save animation, get network data
-    network_data = run_simulation(save_animation_path=animation_gif_path, t_final=t_final_arg, n_points=n_points_arg, return_data=True)
-    
-    # Restore stdout/stderr
-    sys.stdout = old_stdout
-    sys.stderr = old_stderr
-    
-    # Read animation GIF as base64 if it exists
-    animation_base64 = None
-    if os.path.exists(animation_gif_path):
-        with open(animation_gif_path, 'rb') as f:
-            animation_base64 = base64.b64encode(f.read()).decode('utf-8')
-        print(f"Animation GIF loaded ({len(animation_base64)//1024}KB)", file=sys.stderr)
-    
+        from ev_tc_7 import run_simulation
+    return run_simulation
+
+
+def preload():
+    """Import everything a run needs, so that later runs only pay for the
+    solve and the figures."""
+    setup_matplotlib()
+    import matplotlib.animation  # noqa: F401
+    import matplotlib.patches  # noqa: F401
+    import networkx  # noqa: F401
+    for sim_type in ('tc7', 'tc9'):
+        load_simulation(sim_type)
+
+
+def encode_network_data(network_data, trajectory):
+    """networkData of the response for the ``trajectory`` format."""
+    if trajectory == 'json':
+        return network_data
+    from ev_trajectory import encode
+    payload = encode(network_data, dtype=trajectory)
+    return {'encoding': trajectory,
+            'trajectory': base64.b64encode(payload).decode('ascii')}
+
+
+def simulate(t_final=None, n_points=None, sim_type='tc7', plots=True,
+             animation_path=ANIMATION_GIF_PATH, progress=None, trajectory='json',
+             figures=None, solution_path=None, charts=False):
+    """Run one simulation and return the JSON-ready response dict
+    (success, message, graphs, animation, networkData).
+
+    Output of the simulation itself is suppressed.  Errors are reported
+    in the dict (success False), never raised.  ``progress`` is handed
+    to the model's run_simulation() and receives its progress events.
+    ``trajectory`` 'float32' or 'uint16' sends networkData as
+    {'encoding', 'trajectory'}: the ev_trajectory encoding of the network
+    data (with path flows) in that dtype, base64 encoded, instead of
+    nested JSON lists.
+
+    ``figures`` limits the plotted run to those FIGURES numbers; the others
+    are listed under 'figures' ({'n', 'name', 'type'}) for render_figure().
+    ``figures=()`` therefore returns as soon as the solve is done.
+    ``solution_path`` is handed to the model (solver output cache).
+    ``charts`` adds 'charts', the series behind figures 2-4 for the
+    client to draw (the model's chart_data()); with ``figures=()`` or
+    ``plots=False`` matplotlib is never touched.
+    """
+    shown = range(1, len(FIGURES) + 1) if figures is None else figures
+    if plots and shown:
+        setup_matplotlib()
+    captured_figures.clear()
+
+    # Suppress print output from the simulation
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    try:
+        run_simulation = load_simulation(sim_type)
+        return_data = True if trajectory == 'json' else 'arrays'
+
+        if not plots:
+            network_data = run_simulation(t_final=t_final, n_points=n_points,
+                                          return_data=return_data, plots=False, charts=charts,
+                                          progress=progress)
+            chart_series = network_data.pop('charts', None)
+            network_data = encode_network_data(network_data, trajectory)
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            result = {
+                'success': True,
+                'message': 'Simulation completed successfully (compute only, no graphs).',
+                'graphs': [],
+                'animation': None,
+                'networkData': network_data
+            }
+            if charts:
+                result['charts'] = chart_series
+            return result
+
+        # Run the simulation with provided parameters and save animation, get network data;
+        # the figures are drawn on ev_render's process pool unless it has one process
+        # (a run without figures, e.g. a lazy one, does not start it)
+        pool_renderer = None
+        if shown:
+            from ev_render import renderer
+            pool_renderer = renderer(sim_type, captured_figures)
+        network_data = run_simulation(save_animation_path=animation_path, t_final=t_final,
+                                      n_points=n_points, return_data=return_data,
+                                      figures=shown, solution_path=solution_path,
+                                      charts=charts, progress=progress,
+                                      renderer=pool_renderer)
+        chart_series = network_data.pop('charts', None)
+        network_data = encode_network_data(network_data, trajectory)
+
+        # Restore stdout/stderr
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+
+        # Read animation GIF as base64 if it exists
+        animation_base64 = None
+        if 1 in shown and os.path.exists(animation_path):   # figure 1 is the GIF
+            with open(animation_path, 'rb') as f:
+                animation_base64 = base64.b64encode(f.read()).decode('utf-8')
+            print(f"Animation GIF loaded ({len(animation_base64)//1024}KB)", file=sys.stderr)
+
+        if len(captured_figures) == 0 and any(n > 1 for n in shown):
+            print("Warning: No figures captured", file=sys.stderr)
+
+        result = {
+            'success': True,
+            'message': f'Simulation completed successfully. Captured {len(captured_figures)} graphs.',
+            'graphs': list(captured_figures),
+            'animation': animation_base64,  # Animated GIF as base64
+            'networkData': network_data  # Interactive network data
+        }
+        if charts:
+            result['charts'] = chart_series
+        if figures is not None:
+            result['figures'] = [{'n': n, 'name': name, 'type': mime}
+                                 for n, (name, mime) in enumerate(FIGURES, 1) if n not in shown]
+        return result
+
+    except ImportError as e:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        return {
+            'success': False,
+            'message': f'Import Error: {str(e)}',
+            'graphs': list(captured_figures)
+        }
+
+    except Exception as e:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        return {
+            'success': False,
+            'message': f'Error: {str(e)}',
+            'graphs': list(captured_figures)
+        }
+
+
+def render_figure(t_final, n_points, sim_type, figure, solution_path=None,
+                  animation_path=ANIMATION_GIF_PATH, progress=None):
+    """Render FIGURES number ``figure`` of a run on its own.  With the
+    ``solution_path`` its earlier simulate() wrote, the solve is skipped.
+
+    Returns {success, message, type, data} with the image base64 encoded.
+    """
+    if not 1 <= figure <= len(FIGURES):
+        return {'success': False, 'message': f'No figure {figure}'}
+    name, mime = FIGURES[figure - 1]
+    result = simulate(t_final, n_points, sim_type, animation_path=animation_path,
+                      progress=progress, figures=[figure], solution_path=solution_path)
+    if not result['success']:
+        return {'success': False, 'message': result['message']}
+    data = result['animation'] if mime == 'image/gif' else next(iter(result['graphs']), None)
+    if data is None:
+        return {'success': False, 'message': f'{name} was not rendered'}
+    return {'success': True, 'message': f'Rendered {name}', 'type': mime, 'data': data}
+
+
+if __name__ == '__main__':
+    t_final_arg, n_points_arg, sim_type_arg, plots_arg = parse_args(sys.argv[1:])
+    output = simulate(t_final_arg, n_points_arg, sim_type_arg, plots=plots_arg)
+
     # Output only the JSON result
-    if len(captured_figures) == 0:
-        print("Warning: No figures captured", file=sys.stderr)
-    
-    output = {
-        'success': True,
-        'message': f'Simulation completed successfully. Captured {len(captured_figures)} graphs.',
-        'graphs': captured_figures,
-        'animation': animation_base64,  # Animated GIF as base64
-        'networkData': network_data  # Interactive network data
-    }
-    print(json.dumps(output))
-    
-except ImportError as e:
-    sys.stdout = old_stdout
-    sys.stderr = old_stderr
-    output = {
-        'success': False,
-        'message': f'Import Error: {str(e)}',
-        'graphs': captured_figures
-    }
-    print(json.dumps(output))
-    sys.exit(1)
-    
-except Exception as e:
-    sys.stdout = old_stdout
-    sys.stderr = old_stderr
-    output = {
-        'success': False,
-        'message': f'Error: {str(e)}',
-        'graphs': captured_figures
-    }
     print(json.dumps(output))
-    sys.exit(1)
+    if not output['success']:
+        sys.exit(1)
@@ -0,0 +1,185 @@
+// Cache of finished /api/run-simulation responses, and of what lazy runs
+// leave behind for their figures.
+//
+// tc7 and tc9 are deterministic, so a response depends only on the
+// normalized request parameters and on the simulation code.  Keys are a
+// SHA-256 over both; codeVersion() hashes every Python source of the project
+// (plus requirements.txt), so editing a model retires the old entries.
+//
+// Two tiers, both least-recently-used:
+//   memory  serialized response bodies, bounded by SIM_CACHE_MEMORY_MB
+//   disk    <dir>/<key>.<ext>, bounded by SIM_CACHE_DISK_MB; every hit
+//           refreshes the file's mtime (the LRU order of the disk tier,
+//           which survives restarts) and disk hits move back into memory
+// Bodies are stored exactly as sent, so hits skip JSON serialization too.
+//
+// Entries are responses (<key>.json) and, per lazy run (runKey()), the run's
+// parameters (<run>.run.json), the solver output the worker writes
+// (<run>.npz) and the figures rendered so far (<run>-<n>.png / .gif).
+
+const crypto = require('crypto');
+const fs = require('fs');
+const fsp = require('fs/promises');
+const path = require('path');
+
+const PROJECT_ROOT = path.join(__dirname, '..');
+const CACHE_DIR = process.env.SIM_RESULT_CACHE_DIR || path.join(PROJECT_ROOT, '.result_cache');
+const MB = 1024 * 1024;
+const TRAJECTORY_FORMATS = ['json', 'float32', 'uint16'];
+
+// Hash of the code that produces a result
+function codeVersion(root = PROJECT_ROOT) {
+  const hash = crypto.createHash('sha256');
+  const files = fs.readdirSync(root)
+    .filter((f) => f.endsWith('.py') || f === 'requirements.txt')
+    .sort();
+  for (const f of files) {
+    hash.update(f + '\0');
+    hash.update(fs.readFileSync(path.join(root, f)));
+  }
+  return hash.digest('hex').slice(0, 16);
+}
+
+// Request body -> the parameters the simulation actually sees
+function normalizeParams(body = {}) {
+  const simType = String(body.simType || 'tc7').toLowerCase().trim();
+  return {
+    duration: parseFloat(body.duration) || 100,
+    points: parseInt(body.points) || 400,
+    simType: simType === 'tc9' ? 'tc9' : 'tc7',   // anything else runs tc7
+    plots: body.plots !== false,
+    // 'lazy': no figures in the response, each rendered on first request
+    figures: body.plots !== false && body.figures === 'lazy' ? 'lazy' : 'eager',
+    // networkData as nested JSON lists, or binary columns (ev_trajectory.py)
+    trajectory: TRAJECTORY_FORMATS.includes(body.trajectory) ? body.trajectory : 'json',
+    // the series behind figures 2-4, for the client to draw as charts
+    charts: body.charts === true
+  };
+}
+
+class ResultCache {
+  constructor(options = {}) {
+    this.dir = options.dir || CACHE_DIR;
+    this.memoryBytes = options.memoryBytes ?? (parseFloat(process.env.SIM_CACHE_MEMORY_MB) || 64) * MB;
+    this.diskBytes = options.diskBytes ?? (parseFloat(process.env.SIM_CACHE_DISK_MB) || 512) * MB;
+    this.version = options.version || codeVersion();
+    this.memory = new Map();   // file name -> Buffer, oldest first
+    this.memoryUsed = 0;
+    this.stats = { memoryHits: 0, diskHits: 0, misses: 0 };
+    fs.mkdirSync(this.dir, { recursive: true });
+  }
+
+  key(params) {
+    const { duration, points, simType, plots, trajectory, figures, charts } = params;
+    return crypto.createHash('sha256')
+      .update(JSON.stringify([this.version, duration, points, simType, plots, trajectory, figures, charts]))
+      .digest('hex').slice(0, 32);
+  }
+
+  // Key of the solve behind `params`, which its figures depend on
+  runKey(params) {
+    const { duration, points, simType } = params;
+    return crypto.createHash('sha256')
+      .update(JSON.stringify([this.version, 'run', duration, points, simType]))
+      .digest('hex').slice(0, 32);
+  }
+
+  etag(key) {
+    return `W/"${key}"`;
+  }
+
+  // Cached body for `key`, or null
+  async get(key, ext = 'json') {
+    const file = this.path(key, ext);
+    const name = path.basename(file);
+    const body = this.memory.get(name);
+    if (body) {
+      this.memory.delete(name);   // move to the young end
+      this.memory.set(name, body);
+      this._touch(file);
+      this.stats.memoryHits += 1;
+      return body;
+    }
+    try {
+      const data = await fsp.readFile(file);
+      this._touch(file);
+      this._remember(name, data);
+      this.stats.diskHits += 1;
+      return data;
+    } catch (err) {
+      this.stats.misses += 1;
+      return null;
+    }
+  }
+
+  async set(key, body, ext = 'json') {
+    const file = this.path(key, ext);
+    this._remember(path.basename(file), body);
+    const tmp = `${file}.${process.pid}.tmp`;
+    try {
+      await fsp.writeFile(tmp, body);
+      await fsp.rename(tmp, file);
+      await this._trimDisk();
+    } catch (err) {
+      console.error(`[Cache] Failed to store ${key}: ${err.message}`);
+      fsp.unlink(tmp).catch(() => {});
+    }
+  }
+
+  status() {
+    return {
+      version: this.version,
+      memoryEntries: this.memory.size,
+      memoryMB: +(this.memoryUsed / MB).toFixed(1),
+      ...this.stats
+    };
+  }
+
+  // File of an entry; also where a worker may write one (names ending in
+  // .tmp are in-progress writes and left alone)
+  path(key, ext = 'json') {
+    return path.join(this.dir, `${key}.${ext}`);
+  }
+
+  _touch(file) {
+    const now = new Date();
+    fsp.utimes(file, now, now).catch(() => {});
+  }
+
+  _remember(name, body) {
+    if (body.length > this.memoryBytes) return;
+    if (this.memory.has(name)) {
+      this.memoryUsed -= this.memory.get(name).length;
+      this.memory.delete(name);
+    }
+    this.memory.set(name, body);
+    this.memoryUsed += body.length;
+    for (const [old, oldBody] of this.memory) {
+      if (this.memoryUsed <= this.memoryBytes) break;
+      this.memory.delete(old);
+      this.memoryUsed -= oldBody.length;
+    }
+  }
+
+  async _trimDisk() {
+    const names = (await fsp.readdir(this.dir)).filter((f) => !f.endsWith('.tmp'));
+    const entries = [];
+    for (const name of names) {
+      try {
+        const st = await fsp.stat(path.join(this.dir, name));
+        entries.push({ name, size: st.size, mtime: st.mtimeMs });
+      } catch (err) {
+        // removed concurrently
+      }
+    }
+    let used = entries.reduce((sum, e) => sum + e.size, 0);
+    entries.sort((a, b) => a.mtime - b.mtime);
+    for (const e of entries) {
+      if (used <= this.diskBytes) break;
+      await fsp.unlink(path.join(this.dir, e.name)).catch(() => {});
+      used -= e.size;
+    }
+  }
+}
+
+module.exports = { ResultCache, normalizeParams, codeVersion };
@@ -0,0 +1,96 @@
+// Records of the asynchronous simulation jobs behind /api/jobs.
+//
+// A job is 'pending' while its run is queued or running in the worker pool
+// (reported as 'queued' or 'running'), then 'done', 'failed' or 'cancelled'.
+// Finished jobs keep their response body (shared with the result cache)
+// and are forgotten `ttlMs` after they finish; `job.finished` resolves when
+// a job leaves 'pending'.
+
+const crypto = require('crypto');
+
+class JobStore {
+  constructor(options = {}) {
+    this.ttlMs = options.ttlMs || 15 * 60 * 1000;
+    this.jobs = new Map();
+    this.sweeper = setInterval(() => this._sweep(), Math.min(this.ttlMs, 60 * 1000));
+    this.sweeper.unref();
+  }
+
+  create(params, key) {
+    const job = {
+      id: crypto.randomUUID(),
+      params,
+      key,
+      status: 'pending',
+      createdAt: new Date(),
+      finishedAt: null,
+      handle: null,    // runShared() handle while pending
+      body: null,      // response body once done
+      cached: false,
+      error: null,
+      httpStatus: null
+    };
+    job.finished = new Promise((resolve) => { job.resolveFinished = resolve; });
+    this.jobs.set(job.id, job);
+    return job;
+  }
+
+  get(id) {
+    return this.jobs.get(id);
+  }
+
+  delete(id) {
+    this.jobs.delete(id);
+  }
+
+  // Record how a pending job ended: outcome is { body, cached } or { status, error }
+  finish(job, outcome) {
+    if (job.status !== 'pending') return;
+    job.handle = null;
+    job.finishedAt = new Date();
+    if (outcome.body) {
+      job.status = 'done';
+      job.body = outcome.body;
+      job.cached = !!outcome.cached;
+    } else {
+      job.status = outcome.cancelled ? 'cancelled' : 'failed';
+      job.error = outcome.error;
+      job.httpStatus = outcome.status || 500;
+    }
+    job.resolveFinished();
+  }
+
+  // JSON-ready state of a job; `pool` resolves where a pending job stands
+  view(job, pool) {
+    const view = {
+      id: job.id,
+      status: job.status,
+      params: job.params,
+      createdAt: job.createdAt,
+      finishedAt: job.finishedAt
+    };
+    if (job.status === 'pending') {
+      const state = pool.jobState(job.handle.task.id) || { state: 'running' };
+      view.status = state.state;
+      if (state.position !== undefined) view.position = state.position;
+      if (state.startedAt) view.startedAt = state.startedAt;
+    } else if (job.status === 'done') {
+      view.cached = job.cached;
+      view.result = `/api/jobs/${job.id}/result`;
+    } else {
+      view.error = job.error;
+    }
+    return view;
+  }
+
+  _sweep() {
+    const cutoff = Date.now() - this.ttlMs;
+    for (const [id, job] of this.jobs) {
+      if (job.finishedAt && job.finishedAt.getTime() < cutoff) {
+        this.jobs.delete(id);
+      }
+    }
+  }
+}
+
+module.exports = { JobStore };
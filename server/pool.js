@@ -0,0 +1,323 @@
+// Pool of long-lived Python simulation workers (../sim_worker.py).
+//
+// Every worker imports numpy/scipy/networkx/matplotlib and both models once
+// and then runs jobs one at a time, so a request costs the solve and the
+// figures instead of a fresh interpreter plus several seconds of imports.
+// Messages are length-prefixed JSON frames over the worker's stdin/stdout
+// (4-byte big-endian length, then UTF-8 JSON); see sim_worker.py.
+//
+// Workers are retired after `maxJobs` jobs (bounds leaks in long-running
+// matplotlib processes) and replaced when they crash.  A crash fails only
+// the job the worker was running; queued jobs wait for the replacement.
+//
+// Jobs wait in a FIFO queue of at most `maxQueued` entries and run on at
+// most `size` workers at once.  A job that is cancelled or runs past its
+// timeout has its worker killed (and replaced), which frees the CPU at once;
+// its promise rejects with an error whose `code` is 'CANCELLED' or 'TIMEOUT'.
+// Workers lead their own process group, so that the kill also reaches the
+// processes they render figures on (ev_render.py).
+
+const { spawn } = require('child_process');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+const PROJECT_ROOT = path.join(__dirname, '..');
+const WORKER_SCRIPT = path.join(PROJECT_ROOT, 'sim_worker.py');
+
+// Restart backoff for workers that die before they are ready
+const RESTART_DELAY_MS = 1000;
+const MAX_RESTART_DELAY_MS = 30000;
+
+// Process groups (and so killing a worker's whole tree) are POSIX only
+const GROUP_KILL = process.platform !== 'win32';
+
+// Determine Python executable - check various venv locations for cloud platforms
+function resolvePython() {
+  if (process.env.PYTHON) {
+    return process.env.PYTHON;
+  }
+  if (process.env.NODE_ENV !== 'production') {
+    return 'python';
+  }
+  const pythonPaths = [
+    '/opt/render/project/src/.venv/bin/python',
+    '/app/venv/bin/python',
+    '/usr/bin/python3',
+    'python3',
+    'python'
+  ];
+  for (const p of pythonPaths) {
+    if (!p.startsWith('/') || fs.existsSync(p)) {
+      return p;
+    }
+  }
+  return 'python';
+}
+
+function encodeFrame(message) {
+  const body = Buffer.from(JSON.stringify(message), 'utf8');
+  const head = Buffer.alloc(4);
+  head.writeUInt32BE(body.length, 0);
+  return Buffer.concat([head, body]);
+}
+
+// Splits a byte stream into frames; calls onMessage with each parsed message
+function frameReader(onMessage) {
+  let chunks = [];
+  let buffered = 0;
+  let expected = null;
+
+  return (data) => {
+    chunks.push(data);
+    buffered += data.length;
+    while (true) {
+      if (expected === null) {
+        if (buffered < 4) return;
+        const all = Buffer.concat(chunks);
+        expected = all.readUInt32BE(0);
+        chunks = [all.subarray(4)];
+        buffered -= 4;
+      }
+      if (buffered < expected) return;
+      const all = Buffer.concat(chunks);
+      const body = all.subarray(0, expected);
+      chunks = [all.subarray(expected)];
+      buffered -= expected;
+      expected = null;
+      onMessage(JSON.parse(body.toString('utf8')));
+    }
+  };
+}
+
+class WorkerPool {
+  constructor(options = {}) {
+    this.size = options.size || Math.min(2, os.cpus().length);
+    this.maxJobs = options.maxJobs || 50;
+    this.maxQueued = options.maxQueued || 32;
+    this.pythonCmd = options.pythonCmd || resolvePython();
+    this.workers = new Set();
+    this.queue = [];
+    this.nextId = 1;
+    this.restartDelay = RESTART_DELAY_MS;
+    this.closed = false;
+    this.stats = { completed: 0, failed: 0, crashes: 0, recycled: 0, cancelled: 0, timedOut: 0 };
+  }
+
+  start() {
+    console.log(`[Pool] Starting ${this.size} Python worker(s) with ${this.pythonCmd}, recycling after ${this.maxJobs} jobs`);
+    for (let i = 0; i < this.size; i++) {
+      this._spawn();
+    }
+    return this;
+  }
+
+  // Queue one simulation.  Returns { id, promise, cancel }; the promise
+  // resolves with the dict run_simulation.py prints, and `onProgress` gets
+  // the job's progress events (see sim_worker.py) while it runs.  Throws an
+  // error with code 'QUEUE_FULL' when `maxQueued` jobs are already waiting.
+  submit(params, options = {}) {
+    if (this.queue.length >= this.maxQueued) {
+      throw jobError('QUEUE_FULL', `Simulation queue is full (${this.maxQueued} jobs waiting)`);
+    }
+    const job = { id: this.nextId++, params, timeoutMs: options.timeoutMs || 0, onProgress: options.onProgress };
+    job.promise = new Promise((resolve, reject) => {
+      job.resolve = resolve;
+      job.reject = reject;
+    });
+    this.queue.push(job);
+    this._dispatch();
+    return { id: job.id, promise: job.promise, cancel: () => this.cancel(job.id) };
+  }
+
+  run(params, options) {
+    return this.submit(params, options).promise;
+  }
+
+  // 'queued' (with its place in line), 'running', or null once finished
+  jobState(id) {
+    const position = this.queue.findIndex((job) => job.id === id);
+    if (position >= 0) {
+      return { state: 'queued', position };
+    }
+    for (const worker of this.workers) {
+      if (worker.job && worker.job.id === id) {
+        return { state: 'running', startedAt: worker.job.startedAt };
+      }
+    }
+    return null;
+  }
+
+  // Drop a queued job or kill the worker running it; false if it is done
+  cancel(id, code = 'CANCELLED', message = 'Simulation cancelled') {
+    const position = this.queue.findIndex((job) => job.id === id);
+    if (position >= 0) {
+      const [job] = this.queue.splice(position, 1);
+      this.stats.cancelled += 1;
+      job.reject(jobError(code, message));
+      return true;
+    }
+    for (const worker of this.workers) {
+      if (worker.job && worker.job.id === id) {
+        this._kill(worker, code, message);
+        return true;
+      }
+    }
+    return false;
+  }
+
+  status() {
+    const workers = [...this.workers];
+    return {
+      size: this.size,
+      ready: workers.filter((w) => w.ready).length,
+      busy: workers.filter((w) => w.job).length,
+      queued: this.queue.length,
+      maxQueued: this.maxQueued,
+      ...this.stats
+    };
+  }
+
+  close() {
+    this.closed = true;
+    for (const worker of this.workers) {
+      worker.retiring = true;
+      worker.proc.stdin.end();
+    }
+    for (const job of this.queue.splice(0)) {
+      job.reject(new Error('Worker pool is shutting down'));
+    }
+  }
+
+  _spawn() {
+    if (this.closed) return;
+    const proc = spawn(this.pythonCmd, [WORKER_SCRIPT], {
+      cwd: PROJECT_ROOT,
+      env: { ...process.env, PYTHONUNBUFFERED: '1' },
+      stdio: ['pipe', 'pipe', 'pipe'],
+      detached: GROUP_KILL
+    });
+    const worker = { proc, ready: false, job: null, jobs: 0, retiring: false, stderr: '' };
+    this.workers.add(worker);
+
+    proc.stdout.on('data', frameReader((message) => this._onMessage(worker, message)));
+    proc.stderr.on('data', (data) => {
+      const text = data.toString();
+      worker.stderr = (worker.stderr + text).slice(-4000);
+      console.error(`[Worker ${proc.pid}] ${text.trimEnd()}`);
+    });
+    proc.stdin.on('error', () => {});   // EPIPE after a crash; 'exit' reports it
+    proc.on('error', (err) => this._onExit(worker, err.message));
+    proc.on('exit', (code, signal) => this._onExit(worker, signal ? `killed by ${signal}` : `exited with code ${code}`));
+  }
+
+  _onMessage(worker, message) {
+    if (message.type === 'ready') {
+      console.log(`[Pool] Worker ${message.pid} ready`);
+      worker.ready = true;
+      this.restartDelay = RESTART_DELAY_MS;
+      this._dispatch();
+      return;
+    }
+    const job = worker.job;
+    if (message.type === 'progress' && job && message.id === job.id) {
+      if (job.onProgress) job.onProgress(message.progress);
+      return;
+    }
+    if (message.type !== 'result' || !job || message.id !== job.id) {
+      console.error(`[Pool] Unexpected message from worker ${worker.proc.pid}: ${message.type}`);
+      return;
+    }
+    clearTimeout(job.timer);
+    worker.job = null;
+    worker.jobs += 1;
+    this.stats.completed += 1;
+    job.resolve(message.result);
+
+    if (worker.jobs >= this.maxJobs) {
+      console.log(`[Pool] Recycling worker ${worker.proc.pid} after ${worker.jobs} jobs`);
+      worker.retiring = true;
+      worker.ready = false;
+      this.stats.recycled += 1;
+      worker.proc.stdin.end();
+      this._spawn();
+    }
+    this._dispatch();
+  }
+
+  _onExit(worker, reason) {
+    if (!this.workers.delete(worker)) return;   // 'error' and 'exit' may both fire
+    if (worker.retiring) return;
+
+    console.error(`[Pool] Worker ${worker.proc.pid} ${reason}`);
+    this.stats.crashes += 1;
+
+    if (worker.job) {
+      clearTimeout(worker.job.timer);
+      this.stats.failed += 1;
+      worker.job.reject(new Error(`Python worker ${reason}\n${worker.stderr}`));
+    } else if (!worker.ready && ![...this.workers].some((w) => w.ready)) {
+      // No worker has come up: fail the waiting requests rather than hang them
+      for (const job of this.queue.splice(0)) {
+        this.stats.failed += 1;
+        job.reject(new Error(`Python worker failed to start (${reason})\n${worker.stderr}`));
+      }
+    }
+
+    const delay = worker.ready || worker.jobs > 0 ? 0 : this.restartDelay;
+    if (delay) {
+      this.restartDelay = Math.min(this.restartDelay * 2, MAX_RESTART_DELAY_MS);
+    }
+    setTimeout(() => this._spawn(), delay);
+  }
+
+  _dispatch() {
+    for (const worker of this.workers) {
+      if (!this.queue.length) return;
+      if (!worker.ready || worker.job || worker.retiring) continue;
+      const job = this.queue.shift();
+      worker.job = job;
+      job.startedAt = new Date();
+      if (job.timeoutMs) {
+        job.timer = setTimeout(() => this._kill(worker, 'TIMEOUT',
+          `Simulation timed out after ${job.timeoutMs / 1000} s`), job.timeoutMs);
+      }
+      worker.proc.stdin.write(encodeFrame({ id: job.id, ...job.params }));
+    }
+  }
+
+  // Stop the job a worker is running by killing the worker, then replace it
+  _kill(worker, code, message) {
+    const job = worker.job;
+    clearTimeout(job.timer);
+    console.log(`[Pool] Killing worker ${worker.proc.pid}: ${message}`);
+    worker.job = null;
+    worker.ready = false;
+    worker.retiring = true;
+    killWorker(worker.proc);
+    this.stats[code === 'TIMEOUT' ? 'timedOut' : 'cancelled'] += 1;
+    job.reject(jobError(code, message));
+    this._spawn();
+  }
+}
+
+// SIGKILL a worker with its render processes (its process group)
+function killWorker(proc) {
+  if (GROUP_KILL) {
+    try {
+      process.kill(-proc.pid, 'SIGKILL');
+      return;
+    } catch (err) {
+      // already gone, or not a group leader: kill the worker alone
+    }
+  }
+  proc.kill('SIGKILL');
+}
+
+function jobError(code, message) {
+  const err = new Error(message);
+  err.code = code;
+  return err;
+}
+
+module.exports = { WorkerPool, resolvePython, encodeFrame, frameReader };
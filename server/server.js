@@ -1,7 +1,8 @@
 const express = require('express');
 const cors = require('cors');
-const { spawn } = require('child_process');
-const path = require('path');
+const { WorkerPool } = require('./pool');
+const { ResultCache, normalizeParams } = require('./cache');
+const { JobStore } = require('./jobs');
 
 const app = express();
 const PORT = process.env.PORT || 3000;
@@ -28,7 +29,7 @@ app.use(express.json());
 
 // Health check endpoint
 app.get('/health', (req, res) => {
-  res.json({ status: 'ok', version: BUILD_VERSION, timestamp: new Date().toISOString() });
+  res.json({ status: 'ok', version: BUILD_VERSION, timestamp: new Date().toISOString(), pool: pool.status(), cache: resultCache.status(), inflight: inflight.size });
 });
 
 // Root endpoint
@@ -38,7 +39,9 @@ app.get('/', (req, res) => {
     version: BUILD_VERSION,
     endpoints: {
       health: '/health',
-      simulation: '/api/run-simulation (POST)'
+      simulation: '/api/run-simulation (POST)',
+      jobs: '/api/jobs (POST), /api/jobs/:id (GET, DELETE), /api/jobs/:id/result (GET), /api/jobs/:id/events (GET, SSE)',
+      figures: '/api/runs/:id/figures/:n (GET)'
     }
   });
 });
@@ -52,110 +55,380 @@ app.get('/api/run-simulation', (req, res) => {
   });
 });
 
-// Run Python code endpoint
-app.post('/api/run-simulation', (req, res) => {
-  const pythonScriptPath = path.join(__dirname, '..', 'run_simulation.py');
-  
-  // Get simulation parameters from request body (with defaults)
-  const duration = parseFloat(req.body.duration) || 100;
-  const points = parseInt(req.body.points) || 400;
-  const simType = req.body.simType || 'tc7'; // 'tc7' (4-node, 2-station) or 'tc9' (9-node, 4-station)
-  
-  console.log(`[Server] Starting simulation from: ${pythonScriptPath}`);
-  console.log(`[Server] Parameters: duration=${duration}s, points=${points}, type=${simType}`);
-  console.log(`[Server] Working directory: ${path.join(__dirname, '..')}`);
-  
-  // Determine Python executable - check various venv locations for cloud platforms
-  const isProduction = process.env.NODE_ENV === 'production';
-  let pythonCmd = 'python';
-  
-  if (isProduction) {
-    const fs = require('fs');
-    // Check multiple possible Python locations
-    const pythonPaths = [
-      '/opt/render/project/src/.venv/bin/python',
-      '/app/venv/bin/python',
-      '/usr/bin/python3',
-      'python3',
-      'python'
-    ];
-    
-    for (const p of pythonPaths) {
-      if (p.startsWith('/')) {
-        if (fs.existsSync(p)) {
-          pythonCmd = p;
-          break;
-        }
-      } else {
-        pythonCmd = p;
-        break;
+// Long-lived Python workers with the simulation modules preloaded; at most
+// SIM_POOL_SIZE runs at once, SIM_MAX_QUEUED waiting, each killed after
+// SIM_JOB_TIMEOUT_S seconds
+const JOB_TIMEOUT_MS = (parseFloat(process.env.SIM_JOB_TIMEOUT_S) || 600) * 1000;
+const pool = new WorkerPool({
+  size: parseInt(process.env.SIM_POOL_SIZE) || undefined,
+  maxJobs: parseInt(process.env.SIM_WORKER_MAX_JOBS) || undefined,
+  maxQueued: parseInt(process.env.SIM_MAX_QUEUED) || undefined
+}).start();
+
+// Finished responses, keyed by normalized parameters and code version
+const resultCache = new ResultCache();
+console.log(`[Server] Result cache in ${resultCache.dir} (code version ${resultCache.version})`);
+
+function sendCached(req, res, key, body, source, type = 'application/json') {
+  const etag = resultCache.etag(key);
+  res.set({ 'ETag': etag, 'Cache-Control': 'no-cache', 'X-Cache': source });
+  if (req.get('If-None-Match') === etag) {
+    res.status(304).end();
+    return;
+  }
+  res.type(type).send(body);
+}
+
+// Runs in progress by cache key: identical requests attach to the first
+// one instead of starting their own Python job
+const inflight = new Map();
+
+// Lazy runs ("figures": "lazy") by run key (ResultCache.runKey): their solve
+// parameters, also kept in the cache as <run>.run.json so that figure URLs
+// survive a restart.  The run's worker writes its solver output to
+// <run>.npz, which the figure jobs read back instead of solving again.
+const runs = new Map();
+const MAX_RUNS = 10000;
+
+// MIME type of each figure (run_simulation.FIGURES)
+const FIGURE_TYPES = { 1: 'image/gif', 2: 'image/png', 3: 'image/png', 4: 'image/png' };
+
+function rememberRun(params) {
+  const runId = resultCache.runKey(params);
+  if (runs.has(runId)) return;
+  const { duration, points, simType } = params;
+  runs.set(runId, { duration, points, simType });
+  if (runs.size > MAX_RUNS) runs.delete(runs.keys().next().value);
+  resultCache.set(runId, Buffer.from(JSON.stringify(runs.get(runId))), 'run.json');
+}
+
+async function findRun(runId) {
+  if (!/^[0-9a-f]{32}$/.test(runId)) return null;
+  if (!runs.has(runId)) {
+    const record = await resultCache.get(runId, 'run.json');
+    if (!record) return null;
+    runs.set(runId, JSON.parse(record));
+  }
+  return runs.get(runId);
+}
+
+// Job frame for the worker pool: lazy runs and figure jobs share the solver
+// output of their run
+function workerParams(params) {
+  if (params.figures !== 'lazy' && params.figure === undefined) return params;
+  return { ...params, solutionPath: resultCache.path(resultCache.runKey(params), 'npz') };
+}
+
+// Attach to the run for `key`, starting it if needed; `store` turns the
+// worker's result into the body to send (and caches it).  Returns a handle:
+//   promise      resolves with { body } or { status, error } for the response
+//   task         the worker pool job
+//   latest()     the last progress event, or null
+//   subscribe(f) calls f with every further progress event; returns the
+//                unsubscribe function
+//   release()    gives up on the result; the last caller to do so cancels
+//                the run
+// Throws an error with code 'QUEUE_FULL' when a new run cannot be queued.
+function runShared(key, params, store = (result) => storeResponse(key, params, result)) {
+  let run = inflight.get(key);
+  if (!run) {
+    run = { waiters: 0, listeners: new Set(), latest: null, stages: [] };
+    run.task = pool.submit(workerParams(params), {
+      timeoutMs: JOB_TIMEOUT_MS,
+      onProgress: (event) => onProgress(run, event)
+    });
+    run.promise = settle(run.task, store)
+      .finally(() => {
+        inflight.delete(key);
+        logStages(key, run.stages);
+      });
+    inflight.set(key, run);
+  }
+  run.waiters += 1;
+  let released = false;
+  return {
+    task: run.task,
+    promise: run.promise,
+    latest: () => run.latest,
+    subscribe(listener) {
+      run.listeners.add(listener);
+      return () => run.listeners.delete(listener);
+    },
+    release() {
+      if (released) return;
+      released = true;
+      run.waiters -= 1;
+      if (run.waiters === 0 && inflight.get(key) === run) {
+        console.log(`[Server] Cancelling abandoned run ${key}`);
+        run.task.cancel();
       }
     }
+  };
+}
+
+// Progress event of a run: fan out to its listeners and note where each
+// stage (build, every solver phase, every figure) began
+function onProgress(run, event) {
+  run.latest = event;
+  const stage = event.stage === 'solve' ? `solve ${event.phase}/${event.n_phases}`
+    : event.stage === 'render' ? `render ${event.figure}/${event.n_figures} ${event.name}`
+    : event.stage;
+  const last = run.stages[run.stages.length - 1];
+  if (!last || last.stage !== stage) {
+    run.stages.push({ stage, at: Date.now() });
+  }
+  for (const listener of run.listeners) {
+    listener(event);
   }
+}
+
+// One log line per run with the time spent in each stage
+function logStages(key, stages) {
+  if (!stages.length) return;
+  const end = Date.now();
+  const parts = stages.map((s, i) => {
+    const seconds = ((i + 1 < stages.length ? stages[i + 1].at : end) - s.at) / 1000;
+    return `${s.stage} ${seconds.toFixed(2)}s`;
+  });
+  console.log(`[Server] Run ${key} stages: ${parts.join(', ')}`);
+}
+
+async function settle(task, store) {
+  try {
+    const result = await task.promise;
+    if (!result.success) {
+      console.error(`[Server] Simulation failed: ${result.message}`);
+      return { status: 500, error: { success: false, error: 'Simulation failed', details: result.message } };
+    }
+    return { body: await store(result) };
+  } catch (err) {
+    console.error(`[Server] Worker error: ${err.message}`);
+    const errors = {
+      TIMEOUT: [504, 'Simulation timed out'],
+      CANCELLED: [410, 'Simulation cancelled']
+    };
+    const [status, error] = errors[err.code] || [500, 'Failed to execute Python script'];
+    return { status, cancelled: err.code === 'CANCELLED', error: { success: false, error, details: err.message } };
+  }
+}
+
+// Cache and return the response body of a finished simulation; the figures
+// a lazy run left out get the URLs they are rendered at
+async function storeResponse(key, params, result) {
+  console.log(`[Server] Simulation finished. Graphs: ${result.graphs ? result.graphs.length : 0}`);
+  if (result.figures) {
+    const runId = resultCache.runKey(params);
+    for (const figure of result.figures) {
+      figure.url = `/api/runs/${runId}/figures/${figure.n}`;
+    }
+  }
+  const body = Buffer.from(JSON.stringify({ success: true, data: result }));
+  await resultCache.set(key, body);
+  return body;
+}
+
+function sendQueueFull(res, err) {
+  res.set('Retry-After', '30').status(503).json({ success: false, error: 'Server busy', details: err.message });
+}
+
+// Run Python code endpoint (holds the connection until the result is ready)
+app.post('/api/run-simulation', async (req, res) => {
+  // Simulation parameters from the request body (with defaults):
+  // duration, points, simType ('tc7' 4-node 2-station or 'tc9' 9-node
+  // 4-station), plots (false: compute only, no graphs or animation),
+  // trajectory ('json', or 'float32' / 'uint16' binary columns for networkData),
+  // figures ('lazy': graphs and animation left out, see /api/runs/:id/figures/:n),
+  // charts (true: add the series of the graphs for the client to draw)
+  const params = normalizeParams(req.body);
+  const { duration, points, simType, plots } = params;
+  const key = resultCache.key(params);
+  
+  console.log(`[Server] Parameters: duration=${duration}s, points=${points}, type=${simType}, plots=${plots}`);
+  if (params.figures === 'lazy') rememberRun(params);
   
-  console.log(`[Server] Using Python: ${pythonCmd}`);
+  const cached = await resultCache.get(key);
+  if (cached) {
+    console.log(`[Server] Cache hit ${key}`);
+    sendCached(req, res, key, cached, 'HIT');
+    return;
+  }
   
-  // Spawn Python process with simulation parameters as arguments
-  const pythonProcess = spawn(pythonCmd, [pythonScriptPath, duration.toString(), points.toString(), simType], {
-    cwd: path.join(__dirname, '..'),  // Set working directory to project root
-    env: { ...process.env, PYTHONUNBUFFERED: '1' }
+  const shared = inflight.has(key);
+  if (shared) {
+    console.log(`[Server] Joining in-flight run ${key}`);
+  }
+  let handle;
+  try {
+    handle = runShared(key, params);
+  } catch (err) {
+    sendQueueFull(res, err);
+    return;
+  }
+  // A client that disconnects no longer keeps the Python job alive
+  res.on('close', () => {
+    if (!res.writableFinished) handle.release();
   });
   
-  let dataOutput = '';
-  let errorOutput = '';
+  const outcome = await handle.promise;
+  if (outcome.body) {
+    sendCached(req, res, key, outcome.body, shared ? 'COALESCED' : 'MISS');
+  } else {
+    res.status(outcome.status).json(outcome.error);
+  }
+});
+
+// Asynchronous jobs: submit, poll, fetch the result, cancel
+const jobs = new JobStore({ ttlMs: (parseFloat(process.env.SIM_JOB_TTL_S) || 900) * 1000 });
+
+app.post('/api/jobs', async (req, res) => {
+  const params = normalizeParams(req.body);
+  const key = resultCache.key(params);
+  const job = jobs.create(params, key);
+  if (params.figures === 'lazy') rememberRun(params);
   
-  // Collect stdout
-  pythonProcess.stdout.on('data', (data) => {
-    const output = data.toString();
-    console.log(`[Python stdout] ${output}`);
-    dataOutput += output;
-  });
+  const cached = await resultCache.get(key);
+  if (cached) {
+    jobs.finish(job, { body: cached, cached: true });
+  } else {
+    try {
+      job.handle = runShared(key, params);
+    } catch (err) {
+      jobs.delete(job.id);
+      sendQueueFull(res, err);
+      return;
+    }
+    job.handle.promise.then((outcome) => jobs.finish(job, outcome));
+  }
   
-  // Collect stderr
-  pythonProcess.stderr.on('data', (data) => {
-    const error = data.toString();
-    console.error(`[Python stderr] ${error}`);
-    errorOutput += error;
+  console.log(`[Server] Job ${job.id} submitted: duration=${params.duration}s, points=${params.points}, type=${params.simType}, plots=${params.plots}`);
+  res.status(202).location(`/api/jobs/${job.id}`).json(jobs.view(job, pool));
+});
+
+app.get('/api/jobs/:id', (req, res) => {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    res.status(404).json({ success: false, error: 'Unknown job' });
+    return;
+  }
+  res.json(jobs.view(job, pool));
+});
+
+app.get('/api/jobs/:id/result', (req, res) => {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    res.status(404).json({ success: false, error: 'Unknown job' });
+  } else if (job.status === 'done') {
+    sendCached(req, res, job.key, job.body, job.cached ? 'HIT' : 'MISS');
+  } else if (job.status === 'pending') {
+    res.status(409).json(jobs.view(job, pool));
+  } else {
+    res.status(job.httpStatus).json(job.error);
+  }
+});
+
+// Server-Sent Events for a job: 'status' (the job view) on connect and once
+// it has finished, 'progress' (solver time, phase, RHS calls, figure being
+// rendered) while it runs.  The stream ends after the final status.
+app.get('/api/jobs/:id/events', (req, res) => {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    res.status(404).json({ success: false, error: 'Unknown job' });
+    return;
+  }
+  res.set({
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no'   // let nginx pass events through unbuffered
   });
+  res.flushHeaders();
+  const send = (event, data) => res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
   
-  // Handle process completion
-  pythonProcess.on('close', (code) => {
-    console.log(`[Server] Python process exited with code ${code}`);
-    
-    if (code === 0) {
-      try {
-        // Parse the output assuming the Python script outputs JSON
-        const result = JSON.parse(dataOutput);
-        console.log(`[Server] Successfully parsed JSON. Graphs: ${result.graphs ? result.graphs.length : 0}`);
-        res.json({ success: true, data: result });
-      } catch (e) {
-        console.error(`[Server] JSON parse error: ${e.message}`);
-        console.log(`[Server] Raw output: ${dataOutput.substring(0, 200)}`);
-        res.status(500).json({ 
-          success: false, 
-          error: 'Failed to parse simulation output',
-          details: e.message
-        });
-      }
-    } else {
-      console.error(`[Server] Python script failed with code ${code}`);
-      res.status(500).json({ 
-        success: false, 
-        error: `Python script failed with code ${code}`,
-        details: errorOutput 
-      });
-    }
+  send('status', jobs.view(job, pool));
+  if (job.status !== 'pending') {
+    res.end();
+    return;
+  }
+  if (job.handle.latest()) {
+    send('progress', job.handle.latest());
+  }
+  const unsubscribe = job.handle.subscribe((event) => send('progress', event));
+  const heartbeat = setInterval(() => res.write(': keep-alive\n\n'), 15000);
+  const stop = () => {
+    unsubscribe();
+    clearInterval(heartbeat);
+  };
+  job.finished.then(() => {
+    stop();
+    send('status', jobs.view(job, pool));
+    res.end();
   });
+  req.on('close', stop);
+});
+
+// Cancels a pending job (killing its Python worker unless another request
+// shares the run); removes a finished one
+app.delete('/api/jobs/:id', (req, res) => {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    res.status(404).json({ success: false, error: 'Unknown job' });
+    return;
+  }
+  if (job.status === 'pending') {
+    console.log(`[Server] Job ${job.id} cancelled`);
+    const handle = job.handle;
+    jobs.finish(job, { cancelled: true, status: 410, error: { success: false, error: 'Simulation cancelled' } });
+    handle.release();
+    res.json(jobs.view(job, pool));
+  } else {
+    jobs.delete(job.id);
+    res.status(204).end();
+  }
+});
+
+// One figure of a lazy run: rendered by a worker from the run's solver
+// output on first request (solving again only if that was evicted), then
+// served from the cache.  n is 1 (network animation, GIF) to 4.
+app.get('/api/runs/:id/figures/:n', async (req, res) => {
+  const n = parseInt(req.params.n);
+  const type = FIGURE_TYPES[n];
+  const run = await findRun(req.params.id);
+  if (!run || !type || String(n) !== req.params.n) {
+    res.status(404).json({ success: false, error: 'Unknown run or figure' });
+    return;
+  }
+  const key = `${req.params.id}-${n}`;
+  const ext = type.split('/')[1];
+  
+  const cached = await resultCache.get(key, ext);
+  if (cached) {
+    sendCached(req, res, key, cached, 'HIT', type);
+    return;
+  }
   
-  // Handle process errors
-  pythonProcess.on('error', (err) => {
-    console.error(`[Server] Process error: ${err.message}`);
-    res.status(500).json({ 
-      success: false, 
-      error: 'Failed to execute Python script',
-      details: err.message 
+  const shared = inflight.has(key);
+  let handle;
+  try {
+    handle = runShared(key, { ...run, figure: n }, async (result) => {
+      const image = Buffer.from(result.data, 'base64');
+      console.log(`[Server] Rendered figure ${n} of run ${req.params.id} (${Math.round(image.length / 1024)}KB)`);
+      await resultCache.set(key, image, ext);
+      return image;
     });
+  } catch (err) {
+    sendQueueFull(res, err);
+    return;
+  }
+  res.on('close', () => {
+    if (!res.writableFinished) handle.release();
   });
+  
+  const outcome = await handle.promise;
+  if (outcome.body) {
+    sendCached(req, res, key, outcome.body, shared ? 'COALESCED' : 'MISS', type);
+  } else {
+    res.status(outcome.status).json(outcome.error);
+  }
 });
 
 // Start server
@@ -163,3 +436,11 @@ app.listen(PORT, '0.0.0.0', () => {
   console.log(`Server is running on port ${PORT}`);
   console.log(`Environment: ${process.env.NODE_ENV || 'development'}`);
 });
+
+// Stop the Python workers with the server
+for (const signal of ['SIGINT', 'SIGTERM']) {
+  process.on(signal, () => {
+    pool.close();
+    process.exit(0);
+  });
+}
@@ -0,0 +1,107 @@
+"""
+Long-lived simulation worker behind server/pool.js.
+
+Each worker imports numpy/scipy, networkx, matplotlib and both models
+once (run_simulation.preload) and then runs jobs until the server closes
+its stdin, so a request pays for the solve and the figures only.
+
+The server talks to it over stdin/stdout in frames: a 4-byte big-endian
+length followed by that many bytes of UTF-8 JSON.
+
+    server -> worker   {"id": ..., "duration": ..., "points": ...,
+                        "simType": "tc7" | "tc9", "plots": true,
+                        "trajectory": "json" | "float32" | "uint16",
+                        "figures": "eager" | "lazy", "charts": false,
+                        "solutionPath": ...}
+                       a run; "lazy" skips the figures and writes the
+                       solver output to solutionPath, "charts" adds
+                       the series of figures 2-4
+                       {"id": ..., "duration": ..., "points": ...,
+                        "simType": ..., "figure": n, "solutionPath": ...}
+                       one figure of such a run (render_figure)
+    worker -> server   {"type": "ready", "pid": ...}           once, when loaded
+                       {"type": "progress", "id": ..., "progress": {...}}
+                                                               while a job runs
+                       {"type": "result", "id": ..., "result": {...}}
+                                                               once per job
+
+``progress`` is an event of the model's run_simulation(progress=...):
+{"stage": "build"}, {"stage": "solve", "t", "t_final", "phase",
+"n_phases", "rhs_calls"} (see ev_engine.progress_rhs) or {"stage":
+"render", "figure", "n_figures", "name"}.  ``result`` is the dict
+run_simulation.py prints, or render_figure()'s for a figure.  The
+frames own the real stdout; anything else the process prints goes to
+stderr.
+"""
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+
+def read_frame(stream):
+    """Next message from ``stream``, or None at end of input."""
+    head = stream.read(4)
+    if len(head) < 4:
+        return None
+    (size,) = struct.unpack('>I', head)
+    body = stream.read(size)
+    if len(body) < size:
+        return None
+    return json.loads(body)
+
+
+def write_frame(stream, message):
+    body = json.dumps(message).encode('utf-8')
+    stream.write(struct.pack('>I', len(body)) + body)
+    stream.flush()
+
+
+def main():
+    frames_in, frames_out = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr   # stray prints must not corrupt the frames
+
+    import run_simulation
+    run_simulation.preload()
+
+    # every job renders its GIF under its own name in this worker's directory,
+    # never into the shared network_animation.gif the command line writes
+    tmp = tempfile.mkdtemp(prefix='ev-worker-')
+    write_frame(frames_out, {'type': 'ready', 'pid': os.getpid()})
+    try:
+        while True:
+            job = read_frame(frames_in)
+            if job is None:
+                break
+            job_id = job.get('id')
+            gif = os.path.join(tmp, f"network_animation-{job_id}.gif")
+
+            def progress(event, job_id=job_id):
+                write_frame(frames_out, {'type': 'progress', 'id': job_id, 'progress': event})
+
+            if 'figure' in job:
+                result = run_simulation.render_figure(job.get('duration'), job.get('points'),
+                                                      job.get('simType', 'tc7'), job['figure'],
+                                                      solution_path=job.get('solutionPath'),
+                                                      animation_path=gif, progress=progress)
+            else:
+                lazy = job.get('figures') == 'lazy'
+                result = run_simulation.simulate(job.get('duration'), job.get('points'),
+                                                 job.get('simType', 'tc7'),
+                                                 plots=job.get('plots', True),
+                                                 animation_path=gif, progress=progress,
+                                                 trajectory=job.get('trajectory', 'json'),
+                                                 figures=() if lazy else None,
+                                                 solution_path=job.get('solutionPath'),
+                                                 charts=job.get('charts', False))
+            if os.path.exists(gif):
+                os.remove(gif)
+            write_frame(frames_out, {'type': 'result', 'id': job_id, 'result': result})
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
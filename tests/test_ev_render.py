@@ -0,0 +1,58 @@
+"""Tests of the process-pool renderer (ev_render.py).
+
+Run from the project root:  python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ev_render  # noqa: E402
+import run_simulation  # noqa: E402
+
+
+def steady_run(n_points=40):
+    """tc7's parameters and a constant trajectory at its initial state."""
+    from ev_tc_7 import load_scenario
+    params = load_scenario(None)
+    sol = OptimizeResult(t=np.linspace(0, 100, n_points),
+                         y=np.tile(params['state0'][:, None], (1, n_points)))
+    return params, sol
+
+
+class RenderPoolTest(unittest.TestCase):
+    def setUp(self):
+        run_simulation.setup_matplotlib()
+        self.params, self.sol = steady_run()
+
+    def tearDown(self):
+        ev_render.shutdown()
+
+    def render(self, captured):
+        ev_render.render_figures('ev_tc_7', captured, 2, [2], self.sol, self.params, 100, 40)
+
+    def test_broken_pool_is_replaced(self):
+        pool = ev_render.get_pool(2)
+        with self.assertRaises(ev_render.BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        with self.assertRaises(ev_render.BrokenProcessPool):
+            self.render([])
+        self.assertIsNone(ev_render._pool)
+
+        captured = []
+        self.render(captured)
+        self.assertEqual(len(captured), 1)
+        self.assertIsNot(ev_render._pool, pool)
+
+    def test_no_figures_starts_no_pool(self):
+        ev_render.render_figures('ev_tc_7', [], 2, [], self.sol, self.params, 100, 40)
+        self.assertIsNone(ev_render._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()